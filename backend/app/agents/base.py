@@ -1,11 +1,30 @@
 from abc import ABC, abstractmethod
-from typing import Any, Dict, Optional
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
 from sqlalchemy.orm import Session
 
 from app.models import Agent, AgentTask, AgentStatus
 from app.core.config import settings
 from app.core.celery_app import celery_app
-from app.ai import model_manager
+from app.core.rate_limiter import get_rate_limiter, usage_limit_key
+from app.ai import (
+    BatchRequest,
+    BuiltContext,
+    CascadeModelAdapter,
+    ContextBuilder,
+    ContextSection,
+    DEFAULT_DRAFT_MODEL,
+    HedgedModelAdapter,
+    ModelResponse,
+    OutputLengthAdapter,
+    PromptTemplate,
+    build_cascade_policies,
+    build_hedging_policies,
+    completion_tokens,
+    model_manager,
+    output_length_predictor,
+    template_registry,
+    truncate_to_tokens,
+)
 from app.crud import model_config as model_config_crud
 
 class BaseAgent(ABC):
@@ -13,6 +32,13 @@ class BaseAgent(ABC):
     Agent基类
     支持可配置的AI模型
     """
+    # 使用限制配额不足时最多等待的秒数
+    rate_limit_max_wait: float = 30.0
+    # 不需要即时结果、可以通过离线批量推理执行的任务类型
+    batch_task_types: Tuple[str, ...] = ()
+    # 长文本分块并发处理的任务类型 -> 归并方式，也可以通过parameters.map_reduce配置
+    map_reduce_task_types: Dict[str, str] = {}
+
     def __init__(
         self,
         db: Session,
@@ -28,13 +54,15 @@ class BaseAgent(ABC):
             db,
             agent_id=agent_model.id
         )
+        # 配置的模型在model_manager中的名称，使用默认模型时为None（离线批次按它分组）
+        self.model_key: Optional[str] = None
         
         # 根据配置初始化模型
         if self.model_config:
             self.setup_model()
         else:
-            # 使用默认模型
-            self.model = model_manager.get_model()
+            # 使用默认模型，经由路由器在默认模型故障时切换到其备用模型
+            self.model = self._wrap_router(model_manager.get_router())
 
     def setup_model(self) -> None:
         """
@@ -45,42 +73,125 @@ class BaseAgent(ABC):
         # 获取或创建模型实例
         model_key = f"{config.provider}_{config.model_name}"
         try:
-            self.model = model_manager.get_model(model_key)
+            model_manager.get_model(model_key)
         except ValueError:
-            # 如果模型不存在，创建新实例
-            from app.ai import OpenAIAdapter  # 未来可以支持更多适配器
+            # 如果模型不存在，使用对应供应商创建新实例
+            from app.ai import wrap_model
+            
+            if not model_manager.has_provider(config.provider):
+                # 使用默认模型
+                self.model = self._wrap_router(model_manager.get_router())
+                return
             
-            if config.provider == "openai":
-                model = OpenAIAdapter(
+            # 熔断阈值等包装层参数可以通过extra_params按配置调整
+            model = wrap_model(
+                model_manager.create_adapter(
+                    config.provider,
                     api_key=config.api_key,
                     model_name=config.model_name,
-                    organization=config.organization_id
-                )
-                model_manager.register_model(model_key, model)
-                self.model = model
-            else:
-                # 使用默认模型
-                self.model = model_manager.get_model()
+                    organization=config.organization_id,
+                    base_url=config.base_url,
+                    extra_params=config.extra_params
+                ),
+                config.extra_params
+            )
+            model_manager.register_model(model_key, model)
+        
+        self.model_key = model_key
+        self.model = self._wrap_router(
+            self._build_router(model_key),
+            hedge_model=self._hedge_router(),
+            extra_params=config.extra_params
+        )
+
+    def _build_router(self, model_key: str):
+        """
+        为配置的模型创建路由器
+        限流或超时时切换到fallback_provider指定的模型，未配置时切换到默认模型
+        """
+        fallback = model_manager.find_model(self.model_config.fallback_provider)
+        if fallback is None:
+            fallback = model_manager.get_default_model()
+        return model_manager.get_router([model_key], fallback=fallback)
+
+    def _hedge_router(self):
+        """
+        对冲请求使用的模型：配置了fallback_provider时对冲到备用模型，否则对冲到同一模型
+        """
+        fallback = model_manager.find_model(self.model_config.fallback_provider)
+        return model_manager.get_router([fallback]) if fallback else None
+
+    def _wrap_router(self, router, hedge_model=None, extra_params=None):
+        """
+        为路由器加上按任务类型配置的级联、对冲请求和自适应max_tokens
+        （extra_params.adaptive_max_tokens为false时使用固定的max_tokens）
+        """
+        extra_params = extra_params or {}
+        try:
+            primary = (router.candidates or [model_manager.get_default_model()])[0]
+        except ValueError:
+            primary = None
+        model = self._with_cascade(router, primary, extra_params.get("cascade"))
+        model = self._with_hedging(model, primary, hedge_model, extra_params.get("hedging"))
+        if extra_params.get("adaptive_max_tokens", True) is False:
+            return model
+        return OutputLengthAdapter(
+            model,
+            self.agent_model.agent_type.value,
+            default_max_tokens=self.max_output_tokens
+        )
+
+    def _with_cascade(self, router, primary, options):
+        """
+        配置的任务类型先使用草稿模型（默认gpt35），草稿未通过验收检查时再使用路由器的模型；
+        需要在extra_params.cascade中启用（true或配置字典），草稿模型与主模型相同时不使用级联
+        """
+        if not options:
+            return router
+        options = options if isinstance(options, dict) else {}
+        draft = model_manager.find_model(options.get("draft_model", DEFAULT_DRAFT_MODEL))
+        if draft is None or draft == primary:
+            return router
+        return CascadeModelAdapter(
+            router,
+            model_manager.get_router([draft]),
+            policies=build_cascade_policies(options.get("tasks"))
+        )
+
+    def _with_hedging(self, model, primary, hedge_model=None, overrides=None):
+        """
+        加上对冲请求，对冲阈值使用主模型按任务类型的滚动延迟统计
+        """
+        # 尚未设置默认模型时由对冲适配器自行统计延迟
+        stats = model_manager.get_task_stats(primary) if primary else None
+        return HedgedModelAdapter(
+            model,
+            hedge_model=hedge_model,
+            policies=build_hedging_policies(overrides),
+            stats=stats
+        )
 
     async def process_task(self, task: AgentTask) -> Dict[str, Any]:
         """
         处理任务前检查使用限制
         """
         # 如果有模型配置，检查使用限制
+        tokens_required = 0
         if self.model_config:
             # 估算所需token
             prompt = await self.prepare_prompt(task)
             tokens_required = self.model.get_token_count(prompt)
             
-            # 检查限制
-            check_result = model_config_crud.check_usage_limits(
-                self.db,
-                agent_id=self.agent_model.id,
-                tokens_required=tokens_required
+            # 占用配额，配额不足时等待一段时间
+            check_result = await get_rate_limiter().acquire(
+                usage_limit_key(self.agent_model.id),
+                self.model_config.usage_limits or {},
+                tokens_required,
+                timeout=self.rate_limit_max_wait
             )
             
-            if not check_result["allowed"]:
-                raise ValueError(f"使用限制检查失败: {check_result['reason']}")
+            if not check_result.allowed:
+                raise ValueError(f"使用限制检查失败: {check_result.reason}")
         
         # 处理任务
         result = await self._process_task(task)
@@ -90,6 +201,14 @@ class BaseAgent(ABC):
             tokens_used = result.get("tokens_used", 0)
             cost = result.get("cost", 0.0)
             
+            # 准入时计入了提示的估算token，这里按实际用量补记差额（实际用量更少时为负数，退还多预留的部分）；
+            # 结果中没有tokens_used时无法核对，保留预留的估算值
+            if "tokens_used" in result:
+                await get_rate_limiter().consume_tokens_async(
+                    usage_limit_key(self.agent_model.id),
+                    tokens_used - tokens_required
+                )
+            
             model_config_crud.update_usage_stats(
                 self.db,
                 agent_id=self.agent_model.id,
@@ -115,6 +234,148 @@ class BaseAgent(ABC):
         """
         pass
 
+    @property
+    def max_output_tokens(self) -> int:
+        """
+        为模型输出预留的token数
+        """
+        parameters = (self.model_config.parameters if self.model_config else None) or self.parameters
+        return parameters.get("max_tokens", 2048)
+
+    def output_length_key(self, task_type: str) -> str:
+        return f"{self.agent_model.agent_type.value}:{task_type}"
+
+    def predicted_max_tokens(self, task_type: str) -> int:
+        """
+        按最近的输出长度预测任务类型的max_tokens，样本不足时为max_output_tokens
+        """
+        return output_length_predictor.predict(
+            self.output_length_key(task_type),
+            self.max_output_tokens,
+            min(self.max_output_tokens * 2, self.model.context_window // 2)
+        )
+
+    def record_output_length(self, task_type: str, response: ModelResponse) -> None:
+        """
+        记录不经过模型适配器的调用（如批量推理）的输出长度
+        """
+        output_length_predictor.record(
+            self.output_length_key(task_type),
+            completion_tokens(response),
+            truncated=response.metadata.get("finish_reason") == "length"
+        )
+
+    async def build_context(
+        self,
+        sections: List[ContextSection],
+        template: Optional[PromptTemplate] = None,
+        reserve_tokens: Optional[int] = None,
+        prompt_tokens: Optional[int] = None
+    ) -> BuiltContext:
+        """
+        在模型窗口内组装提示上下文
+        预算为提示的token上限（默认为模型窗口减去输出预留）减去模板静态文本的token数，
+        放不下的片段按优先级截断或摘要
+        """
+        model_name = self.model.model_name
+        if prompt_tokens is None:
+            reserve = self.max_output_tokens if reserve_tokens is None else reserve_tokens
+            prompt_tokens = self.model.context_window - reserve
+        fixed = template.static_tokens(model_name) if template is not None else 0
+        builder = ContextBuilder(
+            prompt_tokens - fixed,
+            model=model_name,
+            summarizer=self.summarize_context
+        )
+        for section in sections:
+            builder.add_section(section)
+        return await builder.build()
+
+    def context_rebuilder(
+        self,
+        sections: List[ContextSection],
+        template: PromptTemplate
+    ) -> Callable[[int], Awaitable[str]]:
+        """
+        返回按给定token数重建提示的函数，作为overflow参数传给模型调用：
+        上下文超限时用更小的预算重新组装，低优先级的片段先被摘要或截断
+        """
+        async def rebuild(prompt_tokens: int) -> str:
+            context = await self.build_context(sections, template=template, prompt_tokens=prompt_tokens)
+            return template.render(**context.sections)
+        return rebuild
+
+    async def summarize_context(self, text: str, max_tokens: int) -> str:
+        """
+        把上下文片段摘要到max_tokens个token以内
+        """
+        template = template_registry.get("CONTEXT_SUMMARY_PROMPT")
+        model_name = self.model.model_name
+        # 摘要请求本身也要放得进模型窗口
+        available = self.model.context_window - max_tokens - template.static_tokens(model_name) - 16
+        response = await self.model.generate_text(
+            prompt=template.render(
+                text=truncate_to_tokens(text, available, model_name),
+                max_tokens=max_tokens
+            ),
+            max_tokens=max_tokens,
+            temperature=0.3
+        )
+        return response.content
+
+    async def process_long_text(
+        self,
+        task: AgentTask,
+        text: str,
+        map_func: Callable[[str], Awaitable[Any]]
+    ) -> Any:
+        """
+        处理可能很长的文本
+        任务类型配置了map-reduce且文本超出单次调用的上限时，按块并发调用map_func并归并结果，
+        否则直接对整段文本调用map_func
+        """
+        reducers = {**self.map_reduce_task_types, **self.parameters.get("map_reduce", {})}
+        reducer = reducers.get(task.task_type)
+        if reducer is None:
+            return await map_func(text)
+        return await self.model.map_reduce_text(text, map_func, reducer)
+
+    def supports_batch(self, task: AgentTask) -> bool:
+        """
+        任务是否可以通过离线批量推理执行
+        """
+        return task.task_type in self.batch_task_types
+
+    def batch_request(self, task: AgentTask, prompt: str, **kwargs: Any) -> BatchRequest:
+        """
+        构造任务的批量请求，custom_id使用任务ID以便把结果对应回任务
+        """
+        kwargs.setdefault("max_tokens", self.predicted_max_tokens(task.task_type))
+        return BatchRequest(
+            custom_id=f"task-{task.id}",
+            prompt=prompt,
+            metadata={"task_type": task.task_type},
+            **kwargs
+        )
+
+    async def build_batch_request(self, task: AgentTask) -> Optional[BatchRequest]:
+        """
+        为批量执行的任务准备模型请求，请求按self.model（即批次使用的模型）的窗口组装
+        由支持批量执行的Agent实现，默认返回None表示不支持
+        """
+        return None
+
+    async def apply_batch_result(
+        self,
+        task: AgentTask,
+        response: ModelResponse
+    ) -> Optional[Dict[str, Any]]:
+        """
+        处理批量推理返回的结果，返回写入任务的结果
+        由支持批量执行的Agent实现，默认返回None表示不支持
+        """
+        return None
+
     @abstractmethod
     async def validate_task(self, task: AgentTask) -> bool:
         """
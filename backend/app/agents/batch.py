@@ -0,0 +1,336 @@
+import asyncio
+import logging
+import os
+import time
+import uuid
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Set, Tuple
+from sqlalchemy.orm import Session
+
+from app.ai import (
+    BatchJob,
+    BatchModelAdapter,
+    BatchRequest,
+    BatchResult,
+    get_batch_adapter,
+    write_batch_file,
+)
+from app.ai.batch import COMPLETED
+from app.core.config import settings
+from app.core.rate_limiter import RateLimitResult, get_rate_limiter, usage_limit_key
+from app.crud import model_config as model_config_crud
+from app.models import AgentTask
+from .base import BaseAgent
+from .constants import TASK_STATUS
+
+logger = logging.getLogger(__name__)
+
+def task_id_from_custom_id(custom_id: str) -> Optional[int]:
+    """
+    从批量请求的custom_id（task-<任务ID>）中取出任务ID
+    """
+    prefix, _, task_id = custom_id.partition("-")
+    if prefix != "task" or not task_id.isdigit():
+        return None
+    return int(task_id)
+
+class BatchTaskCollector:
+    """
+    离线批量任务收集器
+    可以批量执行的任务先标记为queued，flush时按Agent配置的模型分组写入JSONL批次文件并提交，
+    任务标记为batched并在result中记录batch_id和模型；collect时把已完成批次的结果写回任务。
+    状态都保存在AgentTask上，多个AgentManager实例和进程重启之间可以共享；
+    提交和写回前都先用带状态条件的UPDATE取得任务，多个进程同时运行时每个任务只处理一次
+    """
+
+    def __init__(
+        self,
+        db: Session,
+        agents: Dict[int, BaseAgent],
+        adapter: Optional[BatchModelAdapter] = None,
+        work_dir: Optional[str] = None,
+        max_batch_size: Optional[int] = None
+    ):
+        self.db = db
+        self.agents = agents
+        # 指定时所有模型共用这个适配器，否则每个模型使用get_batch_adapter的适配器
+        self._adapter = adapter
+        self.work_dir = work_dir or settings.BATCH_WORK_DIR
+        self.max_batch_size = max_batch_size or settings.BATCH_MAX_SIZE
+
+    def adapter_for(self, model_key: Optional[str]) -> BatchModelAdapter:
+        """
+        模型对应的批量推理适配器，model_key为None时为默认模型
+        """
+        return self._adapter or get_batch_adapter(model_key)
+
+    def accepts(self, task: AgentTask) -> bool:
+        """
+        任务是否可以加入离线批次
+        """
+        agent = self.agents.get(task.agent_id)
+        return agent is not None and agent.supports_batch(task)
+
+    async def enqueue(self, task: AgentTask) -> None:
+        """
+        把任务加入待提交队列
+        """
+        task.status = TASK_STATUS["QUEUED"]
+        await self.db.commit()
+
+    def _queued(self):
+        return self.db.query(AgentTask).filter(AgentTask.status == TASK_STATUS["QUEUED"])
+
+    def _claim(self, task: AgentTask, status: str) -> bool:
+        """
+        把任务从status原子地改为processing，返回是否由当前进程取得
+        """
+        claimed = self.db.query(AgentTask).filter(
+            AgentTask.id == task.id,
+            AgentTask.status == status
+        ).update({AgentTask.status: TASK_STATUS["PROCESSING"]}, synchronize_session=False)
+        if claimed:
+            task.status = TASK_STATUS["PROCESSING"]
+        return claimed == 1
+
+    async def _claim_queued(self, exclude: Set[int]) -> List[AgentTask]:
+        """
+        取得排队的任务（按优先级，最多max_batch_size个），跳过exclude中的任务
+        """
+        query = self._queued()
+        if exclude:
+            query = query.filter(~AgentTask.id.in_(exclude))
+        candidates = query.order_by(
+            AgentTask.priority.desc(), AgentTask.id
+        ).limit(self.max_batch_size).all()
+
+        tasks = [task for task in candidates if self._claim(task, TASK_STATUS["QUEUED"])]
+        await self.db.commit()
+        return tasks
+
+    async def flush(self) -> List[BatchJob]:
+        """
+        取得排队的任务并提交，返回提交的批次
+        """
+        return await self._submit_tasks(await self._claim_queued(set()), set())
+
+    async def _submit_tasks(self, tasks: List[AgentTask], deferred: Set[int]) -> List[BatchJob]:
+        """
+        按Agent配置的模型分组写入批次文件并提交
+        无法构造请求的任务直接标记为失败；超出每日token限制或提交失败的任务放回队列并记入deferred
+        """
+        groups: Dict[Optional[str], List[Tuple[AgentTask, BaseAgent, BatchRequest]]] = defaultdict(list)
+        for task in tasks:
+            agent = self.agents.get(task.agent_id)
+            try:
+                if agent is None:
+                    raise ValueError(f"Agent {task.agent_id} not found")
+                request = await agent.build_batch_request(task)
+                if request is None:
+                    raise ValueError(f"{type(agent).__name__} does not support batch tasks")
+                check = await self._check_limits(agent, request)
+            except Exception as e:
+                self._fail(task, str(e))
+                continue
+            if check is not None and not check.allowed:
+                if check.retry_after is None:
+                    self._fail(task, f"使用限制检查失败: {check.reason}")
+                else:
+                    self._requeue(task, deferred)
+                continue
+            groups[agent.model_key].append((task, agent, request))
+
+        jobs = []
+        for model_key, entries in groups.items():
+            try:
+                job = await self._submit(model_key, [request for _, _, request in entries])
+            except Exception as e:
+                logger.error(f"Submitting batch for {model_key or 'default model'} failed: {e}")
+                for task, _, _ in entries:
+                    self._requeue(task, deferred)
+                continue
+
+            for task, agent, request in entries:
+                reserved = await self._reserve(agent, request)
+                task.status = TASK_STATUS["BATCHED"]
+                task.result = {
+                    "batch_id": job.batch_id,
+                    "batch_model": model_key,
+                    "reserved_tokens": reserved,
+                }
+            jobs.append(job)
+            logger.info(f"Submitted batch {job.batch_id} with {len(entries)} tasks")
+
+        await self.db.commit()
+        return jobs
+
+    async def _submit(self, model_key: Optional[str], requests: List[BatchRequest]) -> BatchJob:
+        adapter = self.adapter_for(model_key)
+        path = os.path.join(
+            self.work_dir,
+            f"tasks_{time.strftime('%Y%m%d%H%M%S')}_{uuid.uuid4().hex[:8]}.jsonl"
+        )
+        write_batch_file(requests, path, adapter.model_name)
+        return await adapter.submit_batch(path)
+
+    @staticmethod
+    def _limits(agent: BaseAgent) -> Dict[str, Any]:
+        # 批量请求不占用每分钟请求配额，只受单次和每日token限制
+        limits = dict(agent.model_config.usage_limits or {})
+        limits.pop("max_requests_per_minute", None)
+        return limits
+
+    async def _check_limits(self, agent: BaseAgent, request: BatchRequest) -> Optional[RateLimitResult]:
+        """
+        按Agent的使用限制检查批量请求的提示token，没有模型配置时返回None
+        """
+        if not agent.model_config:
+            return None
+        return await get_rate_limiter().try_acquire_async(
+            usage_limit_key(agent.agent_model.id),
+            self._limits(agent),
+            agent.model.get_token_count(request.prompt),
+            consume=False
+        )
+
+    async def _reserve(self, agent: BaseAgent, request: BatchRequest) -> int:
+        """
+        批次提交成功后计入提示的token，结果返回时再按实际用量补记
+        """
+        if not agent.model_config:
+            return 0
+        tokens = agent.model.get_token_count(request.prompt)
+        await get_rate_limiter().consume_tokens_async(usage_limit_key(agent.agent_model.id), tokens)
+        return tokens
+
+    async def collect(self) -> List[int]:
+        """
+        收取已结束批次的结果并写回任务，返回处理过的任务ID
+        """
+        tasks = self.db.query(AgentTask).filter(
+            AgentTask.status == TASK_STATUS["BATCHED"]
+        ).all()
+
+        by_batch: Dict[Tuple[Optional[str], str], List[AgentTask]] = defaultdict(list)
+        for task in tasks:
+            info = task.result or {}
+            by_batch[(info.get("batch_model"), info.get("batch_id"))].append(task)
+
+        processed: List[int] = []
+        for (model_key, batch_id), batch_tasks in by_batch.items():
+            try:
+                adapter = self.adapter_for(model_key)
+                job = await adapter.get_batch(batch_id)
+            except ValueError as e:
+                for task in batch_tasks:
+                    if self._claim(task, TASK_STATUS["BATCHED"]):
+                        self._fail(task, str(e))
+                        processed.append(task.id)
+                continue
+            if not job.finished:
+                continue
+
+            results: Dict[int, BatchResult] = {}
+            if job.status == COMPLETED:
+                for result in await adapter.get_results(job):
+                    task_id = task_id_from_custom_id(result.custom_id)
+                    if task_id is not None:
+                        results[task_id] = result
+
+            for task in batch_tasks:
+                # 其他进程已经写回的任务跳过
+                if not self._claim(task, TASK_STATUS["BATCHED"]):
+                    continue
+                await self._apply(task, results.get(task.id), job)
+                processed.append(task.id)
+
+        await self.db.commit()
+        return processed
+
+    async def _apply(
+        self,
+        task: AgentTask,
+        result: Optional[BatchResult],
+        job: BatchJob
+    ) -> None:
+        reserved = (task.result or {}).get("reserved_tokens", 0)
+        if result is None:
+            self._fail(task, f"Batch {job.batch_id} {job.status} without result: {job.error or ''}")
+            return
+        if not result.succeeded:
+            self._fail(task, result.error or "Batch request failed")
+            return
+
+        agent = self.agents.get(task.agent_id)
+        if agent is None:
+            self._fail(task, f"Agent {task.agent_id} not found")
+            return
+
+        try:
+            output = await agent.apply_batch_result(task, result.response)
+            if output is None:
+                raise ValueError(f"{type(agent).__name__} does not support batch tasks")
+        except Exception as e:
+            self._fail(task, str(e))
+            return
+        task.result = output
+        agent.record_output_length(task.task_type, result.response)
+        task.status = TASK_STATUS["COMPLETED"]
+        task.error_message = None
+
+        # 批量请求不占用每分钟请求配额，按实际用量补记token并记录使用统计
+        if agent.model_config:
+            await get_rate_limiter().consume_tokens_async(
+                usage_limit_key(agent.agent_model.id),
+                result.response.tokens_used - reserved
+            )
+            model_config_crud.update_usage_stats(
+                self.db,
+                agent_id=agent.agent_model.id,
+                tokens_used=result.response.tokens_used,
+                cost=0.0
+            )
+
+    @staticmethod
+    def _fail(task: AgentTask, message: str) -> None:
+        task.status = TASK_STATUS["FAILED"]
+        task.error_message = message
+
+    @staticmethod
+    def _requeue(task: AgentTask, deferred: Set[int]) -> None:
+        task.status = TASK_STATUS["QUEUED"]
+        deferred.add(task.id)
+
+    async def run_once(self) -> List[BatchJob]:
+        """
+        收取已完成批次的结果，再把排队的任务全部提交
+        暂时无法提交的任务留在队列中，下一轮再处理
+        """
+        await self.collect()
+        jobs: List[BatchJob] = []
+        deferred: Set[int] = set()
+        while True:
+            tasks = await self._claim_queued(deferred)
+            if not tasks:
+                return jobs
+            jobs.extend(await self._submit_tasks(tasks, deferred))
+
+async def run_batch_worker(interval: Optional[float] = None) -> None:
+    """
+    后台定期提交批次和收取结果，直到被取消
+    """
+    from app.core.database import SessionLocal
+    from .manager import AgentManager
+
+    interval = interval or settings.BATCH_INTERVAL
+    while True:
+        await asyncio.sleep(interval)
+        db = SessionLocal()
+        try:
+            manager = AgentManager(db)
+            await manager.initialize_agents()
+            await manager.batch_collector.run_once()
+        except Exception as e:
+            logger.error(f"Batch worker iteration failed: {e}")
+        finally:
+            db.close()
@@ -1,6 +1,7 @@
 from typing import Any, Dict, List
 from sqlalchemy.orm import Session
 
+from app.ai import BatchRequest, ContextSection, ModelResponse, parse_json_response, template_registry
 from app.models import Novel, Chapter, Event, AgentTask, AgentType
 from .base import BaseAgent
 
@@ -9,6 +10,7 @@ class CoherenceAgent(BaseAgent):
     连贯性维护Agent
     负责维护整体故事的连贯性和完整性
     """
+    batch_task_types = ("analyze_coherence",)
     
     async def process_task(self, task: AgentTask) -> Dict[str, Any]:
         """
@@ -98,6 +100,65 @@ class CoherenceAgent(BaseAgent):
 
         return analysis
 
+    async def build_batch_request(self, task: AgentTask) -> BatchRequest:
+        """
+        连贯性分析的批量请求
+        范围内最后一章作为当前内容，之前的章节作为前文，前文放不下时保留最近的部分
+        """
+        novel_id = task.task_data["novel_id"]
+        chapter_range = task.task_data["chapter_range"]
+
+        chapters = self.db.query(Chapter).filter(
+            Chapter.novel_id == novel_id,
+            Chapter.chapter_number.between(chapter_range[0], chapter_range[1])
+        ).order_by(Chapter.chapter_number).all()
+        if not chapters:
+            raise ValueError(f"No chapters in range {chapter_range} of novel {novel_id}")
+
+        template = template_registry.get("COHERENCE_PROMPT")
+        context = await self.build_context(
+            [
+                ContextSection(
+                    "current_content",
+                    chapters[-1].content or "",
+                    priority=2,
+                    min_tokens=500
+                ),
+                ContextSection(
+                    "previous_content",
+                    "\n\n".join(c.content or "" for c in chapters[:-1]),
+                    priority=1,
+                    keep="tail"
+                ),
+            ],
+            template=template
+        )
+        return self.batch_request(task, template.render(**context.sections), temperature=0.3)
+
+    async def apply_batch_result(
+        self,
+        task: AgentTask,
+        response: ModelResponse
+    ) -> Dict[str, Any]:
+        """
+        处理批量返回的连贯性分析结果
+        """
+        analysis = parse_json_response(response.content)
+        if "error" in analysis:
+            raise ValueError(f"连贯性分析结果解析失败: {analysis['error']}")
+        analysis["tokens_used"] = response.tokens_used
+
+        self.emit_event(
+            "coherence_analyzed",
+            {
+                "novel_id": task.task_data["novel_id"],
+                "chapter_range": task.task_data["chapter_range"],
+                "result": analysis
+            }
+        )
+
+        return analysis
+
     async def _track_story_elements(self, data: Dict[str, Any]) -> Dict[str, Any]:
         """
         追踪故事元素
@@ -22,6 +22,8 @@ AGENT_TYPES = {
 TASK_STATUS = {
     "PENDING": "pending",
     "PROCESSING": "processing",
+    "QUEUED": "queued",        # 等待加入离线批次
+    "BATCHED": "batched",      # 已提交离线批次，等待结果
     "COMPLETED": "completed",
     "FAILED": "failed",
     "CANCELLED": "cancelled"
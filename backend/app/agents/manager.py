@@ -1,8 +1,10 @@
 from typing import Dict, List, Optional, Any
 from sqlalchemy.orm import Session
 
+from app.ai import current_task_type, task_stream_broker
 from app.models import Agent, AgentTask, Novel, AgentType, AgentStatus
 from .base import BaseAgent
+from .batch import BatchTaskCollector
 from . import get_agent_class, validate_task_type
 
 class AgentManager:
@@ -14,6 +16,8 @@ class AgentManager:
     def __init__(self, db: Session):
         self.db = db
         self._agents: Dict[str, BaseAgent] = {}
+        # 质量检查等不需要即时结果的任务通过离线批量推理执行
+        self.batch_collector = BatchTaskCollector(db, self._agents)
 
     async def initialize_agents(self) -> None:
         """
@@ -110,6 +114,7 @@ class AgentManager:
         if not agent:
             raise ValueError(f"Agent {task.agent_id} not found")
 
+        error: Optional[str] = None
         try:
             # 更新Agent状态
             await agent.update_status(AgentStatus.WORKING)
@@ -118,8 +123,12 @@ class AgentManager:
             if not await agent.validate_task(task):
                 raise ValueError("Task validation failed")
 
-            # 处理任务
-            result = await agent.process_task(task)
+            # 处理任务，模型调用可以按任务类型选择对冲等策略
+            task_type_token = current_task_type.set(task.task_type)
+            try:
+                result = await agent.process_task(task)
+            finally:
+                current_task_type.reset(task_type_token)
 
             # 更新任务状态
             task.status = "completed"
@@ -136,12 +145,43 @@ class AgentManager:
 
         except Exception as e:
             # 错误处理
+            error = str(e)
             task.status = "failed"
-            task.error_message = str(e)
+            task.error_message = error
             await agent.update_status(AgentStatus.ERROR)
             await agent.log_error(str(e))
             await self.db.commit()
             raise
+        finally:
+            # 任务在开始流式生成之前失败（或没有走流式生成）时也要结束输出通道，
+            # 否则订阅该任务的SSE连接会一直等待；已经关闭的通道保持原样
+            await task_stream_broker.close(task_id, error=error)
+
+    async def schedule_task(
+        self,
+        task_id: int,
+        batch: Optional[bool] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        调度任务
+        可以批量执行的任务（batch为None时按任务类型判断）加入离线批次，返回None；
+        其余任务立即执行并返回结果
+        """
+        task = self.db.query(AgentTask).filter(AgentTask.id == task_id).first()
+        if not task:
+            raise ValueError(f"Task {task_id} not found")
+
+        if batch is not False and self.batch_collector.accepts(task):
+            agent = self._agents[task.agent_id]
+            if not await agent.validate_task(task):
+                task.status = "failed"
+                task.error_message = "Task validation failed"
+                await self.db.commit()
+                raise ValueError("Task validation failed")
+            await self.batch_collector.enqueue(task)
+            return None
+
+        return await self.execute_task(task_id)
 
     async def _get_available_agent(self, agent_type: str) -> Optional[BaseAgent]:
         """
@@ -1,6 +1,7 @@
 from typing import Any, Dict, List
 from sqlalchemy.orm import Session
 
+from app.ai import BatchRequest, ModelResponse, parse_json_response, template_registry, truncate_to_tokens
 from app.models import Novel, Chapter, AgentTask, AgentType
 from .base import BaseAgent
 
@@ -9,6 +10,7 @@ class QAAgent(BaseAgent):
     质量审核Agent
     负责对生成的内容进行质量检查和审核
     """
+    batch_task_types = ("check_content_quality",)
     
     async def process_task(self, task: AgentTask) -> Dict[str, Any]:
         """
@@ -92,6 +94,50 @@ class QAAgent(BaseAgent):
 
         return quality_check
 
+    async def build_batch_request(self, task: AgentTask) -> BatchRequest:
+        """
+        内容质量检查的批量请求
+        """
+        chapter_id = task.task_data["chapter_id"]
+        chapter = self.db.query(Chapter).filter(Chapter.id == chapter_id).first()
+        if not chapter:
+            raise ValueError(f"Chapter {chapter_id} not found")
+
+        template = template_registry.get("QUALITY_CHECK_PROMPT")
+        model_name = self.model.model_name
+        available = (
+            self.model.context_window
+            - self.max_output_tokens
+            - template.static_tokens(model_name)
+        )
+        prompt = template.render(
+            content=truncate_to_tokens(task.task_data["content"], available, model_name)
+        )
+        return self.batch_request(task, prompt, temperature=0.3)
+
+    async def apply_batch_result(
+        self,
+        task: AgentTask,
+        response: ModelResponse
+    ) -> Dict[str, Any]:
+        """
+        处理批量返回的质量检查结果
+        """
+        quality_check = parse_json_response(response.content)
+        if "error" in quality_check:
+            raise ValueError(f"质量检查结果解析失败: {quality_check['error']}")
+        quality_check["tokens_used"] = response.tokens_used
+
+        self.emit_event(
+            "content_quality_checked",
+            {
+                "chapter_id": task.task_data["chapter_id"],
+                "result": quality_check
+            }
+        )
+
+        return quality_check
+
     async def _verify_consistency(self, data: Dict[str, Any]) -> Dict[str, Any]:
         """
         一致性验证
@@ -4,6 +4,7 @@ import logging
 from datetime import datetime
 
 from app.core.config import settings
+from app.ai.utils import chunk_chars
 
 logger = logging.getLogger(__name__)
 
@@ -52,28 +53,11 @@ def calculate_task_priority(
 def chunk_text(text: str, chunk_size: int = 2000) -> List[str]:
     """
     将长文本分割成小块以适应模型输入限制
+    chunk_size为每块的字符数，在句子边界处切分，支持无空格的中文文本
     """
     if not text:
         return []
-        
-    chunks = []
-    current_chunk = []
-    current_size = 0
-    
-    for word in text.split():
-        word_size = len(word)
-        if current_size + word_size + 1 > chunk_size and current_chunk:
-            chunks.append(" ".join(current_chunk))
-            current_chunk = [word]
-            current_size = word_size
-        else:
-            current_chunk.append(word)
-            current_size += word_size + 1
-            
-    if current_chunk:
-        chunks.append(" ".join(current_chunk))
-        
-    return chunks
+    return chunk_chars(text, max_chars=chunk_size)
 
 def merge_agent_results(results: List[Dict[str, Any]]) -> Dict[str, Any]:
     """
@@ -1,8 +1,21 @@
-from typing import Any, Dict, List
+from typing import Any, Awaitable, Callable, Dict, List, Optional
 from sqlalchemy.orm import Session
 
 from app.models import Novel, Chapter, Event, AgentTask, AgentType
+from app.ai import (
+    ContextSection,
+    best_of_n,
+    combine_scorers,
+    extract_constraints,
+    keyword_scorer,
+    length_scorer,
+    quality_scorer,
+    repetition_scorer,
+    task_stream_broker,
+    template_registry,
+)
 from .base import BaseAgent
+from .exceptions import TaskExecutionError
 
 class WritingAgent(BaseAgent):
     """
@@ -18,7 +31,7 @@ class WritingAgent(BaseAgent):
         task_data = task.task_data
         
         if task_type == "generate_content":
-            return await self._generate_content(task_data)
+            return await self._generate_content(task_data, task_id=task.id)
         elif task_type == "polish_text":
             return await self._polish_text(task_data)
         elif task_type == "adjust_style":
@@ -45,10 +58,15 @@ class WritingAgent(BaseAgent):
         required = required_fields[task.task_type]
         return all(field in task.task_data for field in required)
 
-    async def _generate_content(self, data: Dict[str, Any]) -> Dict[str, Any]:
+    async def _generate_content(
+        self,
+        data: Dict[str, Any],
+        task_id: Optional[int] = None
+    ) -> Dict[str, Any]:
         """
         生成内容
         根据场景和人物信息生成具体的文字内容
+        生成过程以流式方式进行，增量文本会发布到任务流供前端实时展示
         """
         chapter_id = data["chapter_id"]
         scene_id = data["scene_id"]
@@ -62,9 +80,30 @@ class WritingAgent(BaseAgent):
         if not scene:
             raise ValueError(f"Scene {scene_id} not found")
 
-        # TODO: 调用AI模型生成文字内容
+        # 场景描述优先，人物设定放不下时摘要，风格要求放不下时截断
+        template = template_registry.get("SCENE_PROMPT")
+        sections = [
+            ContextSection("scene_context", scene.description or "", priority=3, min_tokens=200),
+            ContextSection(
+                "characters",
+                str(data.get("characters", "")),
+                priority=2,
+                min_tokens=100,
+                summarize=True
+            ),
+            ContextSection("plot_requirements", str(style_guide), priority=1, min_tokens=50),
+        ]
+        context = await self.build_context(sections, template=template)
+        prompt = template.render(**context.sections)
+        # 超出上下文窗口时按更小的预算重建提示，而不是让整个任务失败
+        rebuild = self.context_rebuilder(sections, template)
+        if data.get("samples", 1) > 1:
+            text = await self._best_of_n_generation(prompt, data, overflow=rebuild)
+        else:
+            text = await self._stream_generation(prompt, task_id, overflow=rebuild)
+
         content = {
-            "text": "生成的文字内容...",
+            "text": text,
             "structure": {
                 "paragraphs": ["段落1", "段落2"],
                 "dialogues": ["对话1", "对话2"],
@@ -75,7 +114,7 @@ class WritingAgent(BaseAgent):
                 "rhythm": "节奏",
                 "imagery": "意象应用"
             },
-            "word_count": 1000
+            "word_count": len(text)
         }
 
         # 更新章节内容
@@ -97,6 +136,71 @@ class WritingAgent(BaseAgent):
 
         return content
 
+    async def _stream_generation(
+        self,
+        prompt: str,
+        task_id: Optional[int] = None,
+        overflow: Optional[Callable[[int], Awaitable[str]]] = None
+    ) -> str:
+        """
+        流式调用模型并把增量文本转发到任务流
+        任务被取消时提前结束迭代，从而关闭上游请求
+        """
+        pieces: List[str] = []
+        if task_id is not None:
+            task_stream_broker.open(task_id)
+
+        error = None
+        stream = self.model.generate_text_stream(prompt, overflow=overflow)
+        try:
+            async for chunk in stream:
+                pieces.append(chunk)
+                if task_id is None:
+                    continue
+                await task_stream_broker.publish(task_id, chunk)
+                if task_stream_broker.is_cancelled(task_id):
+                    break
+        except Exception as e:
+            error = str(e)
+            raise
+        finally:
+            await stream.aclose()
+            if task_id is not None:
+                await task_stream_broker.close(task_id, error=error)
+
+        if task_id is not None and task_stream_broker.is_cancelled(task_id):
+            raise TaskExecutionError(f"Task {task_id} cancelled")
+
+        return "".join(pieces)
+
+    async def _best_of_n_generation(
+        self,
+        prompt: str,
+        data: Dict[str, Any],
+        overflow: Optional[Callable[[int], Awaitable[str]]] = None
+    ) -> str:
+        """
+        并发生成samples个候选，按字数要求、关键词覆盖、重复度和本地质量评分选出最好的一个
+        设置了sample_threshold时第一个达到阈值的候选直接采用；此模式不发布增量文本
+        """
+        scorers = [quality_scorer(), repetition_scorer()]
+        constraints = extract_constraints(str(data["style_guide"]))
+        if constraints["min_length"] and constraints["max_length"]:
+            target = (constraints["min_length"] + constraints["max_length"]) // 2
+            scorers.append((length_scorer(target), 2.0))
+        if data.get("keywords"):
+            scorers.append(keyword_scorer(data["keywords"]))
+
+        result = await best_of_n(
+            self.model,
+            prompt,
+            n=data["samples"],
+            scorer=combine_scorers(*scorers),
+            threshold=data.get("sample_threshold"),
+            overflow=overflow
+        )
+        return result.response.content
+
     async def _polish_text(self, data: Dict[str, Any]) -> Dict[str, Any]:
         """
         文字润色
@@ -1,5 +1,8 @@
+from typing import Any, Dict, Optional
+
 from .base import (
     BaseModelAdapter,
+    ModelAdapterWrapper,
     ModelResponse,
     ModelError,
     TokenLimitError,
@@ -8,51 +11,228 @@ from .base import (
     ModelTimeoutError,
     ModelRateLimitError,
     ModelManager,
+    RoutedModelAdapter,
+    RoutingDecision,
+    CircuitBreaker,
+    CircuitBreakerAdapter,
+    CircuitOpenError,
+    CircuitState,
+    current_task_type,
+    get_task_type,
 )
+from .metrics import OverflowStats, RollingStats, overflow_stats, percentile
 from .openai_adapter import OpenAIAdapter
+from .fake_adapter import FakeModelAdapter, create_fake_adapter
+from .batch import (
+    BatchJob,
+    BatchModelAdapter,
+    BatchRequest,
+    BatchResult,
+    LocalBatchAdapter,
+    close_batch_adapters,
+    get_batch_adapter,
+    init_batch_adapter,
+    read_batch_results,
+    write_batch_file,
+)
+from .cache import (
+    ResponseCache,
+    MemoryCacheBackend,
+    RedisCacheBackend,
+    CachedModelAdapter,
+    response_cache,
+)
+from .best_of_n import (
+    BestOfNResult,
+    Sample,
+    best_of_n,
+    build_scorer,
+    combine_scorers,
+    iter_samples,
+    keyword_scorer,
+    length_scorer,
+    quality_scorer,
+    repetition_scorer,
+    sample_temperatures,
+)
+from .cascade import (
+    DEFAULT_CASCADE_POLICIES,
+    DEFAULT_DRAFT_MODEL,
+    CascadeModelAdapter,
+    CascadePolicy,
+    CascadeStats,
+    build_cascade_policies,
+    cascade_stats,
+    confidence_check,
+    json_check,
+    local_quality_score,
+    quality_check,
+)
+from .hedging import (
+    HedgeBudget,
+    HedgedModelAdapter,
+    HedgingPolicy,
+    build_hedging_policies,
+    hedge_budget,
+)
+from .output_length import (
+    OutputLengthAdapter,
+    OutputLengthPredictor,
+    completion_tokens,
+    output_length_predictor,
+)
+from .overflow import (
+    COMPRESSION_MARKER,
+    OverflowRecoveryAdapter,
+    compress_prompt,
+    parse_token_limit,
+)
+from .recording import RecordingAdapter, CassetteMissError
+from .retry import (
+    DEFAULT_RETRY_RULES,
+    RetryBudget,
+    RetryPolicy,
+    RetryRule,
+    build_retry_policy,
+    default_retry_policy,
+    parse_retry_after,
+    retry_budget,
+    with_retry,
+)
+from .semantic_cache import (
+    SemanticCache,
+    SemanticCacheAdapter,
+    SemanticCachePolicy,
+    build_semantic_cache_policies,
+    normalize_prompt,
+    semantic_cache,
+)
+from .singleflight import SingleFlight, SingleFlightAdapter, request_coalescer
 from .utils import (
     load_prompt_template,
     parse_json_response,
     count_tokens,
+    count_tokens_batch,
     chunk_text,
+    chunk_chars,
+    iter_chunks,
+    truncate_to_tokens,
+    pack_batches,
     validate_prompt_variables,
     sanitize_prompt_input,
     merge_generations,
     extract_constraints,
     rate_content_quality,
 )
-import prompts
+from .map_reduce import map_chunks, map_reduce
+from .reducers import REDUCERS, Reducer, by_key, get_reducer, register_reducer
+from .json_stream import JSONStreamParser, extract_json, iter_json_fields
+from .tokenizer import TokenizerRegistry, tokenizer_registry, estimate_tokens
+from .streaming import STREAMING_TASK_TYPES, TaskStream, TaskStreamBroker, task_stream_broker
+from .context import BuiltContext, ContextBuilder, ContextSection
+from .templates import PromptTemplate, TemplateRegistry, template_registry
+from . import prompts
+
+# 注册内置提示模板，每个模板只解析一次
+template_registry.register_module(prompts)
 
 # 创建全局模型管理器实例
 model_manager = ModelManager()
 
-# 注册默认的OpenAI模型
+def wrap_model(
+    model: BaseModelAdapter,
+    extra_params: Optional[Dict[str, Any]] = None
+) -> BaseModelAdapter:
+    """
+    为供应商适配器套上标准的包装层：
+    响应缓存 -> [语义缓存] -> 相同请求合并 -> 上下文超限恢复 -> 熔断器 -> 供应商适配器
+    extra_params为ModelConfig.extra_params，用于配置各包装层（overflow_recovery为false时不做超限恢复）；
+    配置了extra_params.recording（path、mode等）时在供应商适配器外录制或回放调用
+    """
+    extra_params = extra_params or {}
+    if extra_params.get("recording"):
+        model = RecordingAdapter(model, **extra_params["recording"])
+    model = CircuitBreakerAdapter(model, **extra_params.get("circuit_breaker", {}))
+    if extra_params.get("overflow_recovery", True):
+        model = OverflowRecoveryAdapter(model)
+    model = SingleFlightAdapter(model)
+    semantic = extra_params.get("semantic_cache")
+    if semantic:
+        # 值为true时使用默认的任务类型，为字典时按任务类型覆盖阈值和有效期
+        model = SemanticCacheAdapter(
+            model,
+            semantic_cache,
+            build_semantic_cache_policies(semantic if isinstance(semantic, dict) else None)
+        )
+    return CachedModelAdapter(model, response_cache)
+
+def create_openai_adapter(
+    model_name: str = "gpt-4",
+    api_key: Optional[str] = None,
+    organization: Optional[str] = None,
+    base_url: Optional[str] = None,
+    extra_params: Optional[Dict[str, Any]] = None,
+    **kwargs: Any
+) -> OpenAIAdapter:
+    """
+    OpenAI供应商工厂
+    连接池大小、并发数和超时从extra_params.http读取，按错误类型的重试规则从extra_params.retry读取
+    """
+    extra_params = extra_params or {}
+    return OpenAIAdapter(
+        api_key=api_key,
+        model_name=model_name,
+        organization=organization,
+        base_url=base_url,
+        retry_policy=build_retry_policy(extra_params["retry"]) if "retry" in extra_params else None,
+        **extra_params.get("http", {})
+    )
+
+# 注册内置的模型供应商，ModelConfig.provider按名称选择
+model_manager.register_provider("openai", create_openai_adapter)
+model_manager.register_provider("fake", create_fake_adapter)
+
+# 注册默认模型
 def setup_default_models():
     """
     初始化并注册默认的AI模型
+    AI_MODEL_PROVIDER设置为fake时使用模拟模型，便于离线压测
     """
     from app.core.config import settings
     
+    provider = settings.AI_MODEL_PROVIDER
+    
     # 注册GPT-4模型
-    gpt4_model = OpenAIAdapter(
+    gpt4_model = model_manager.create_adapter(
+        provider,
         api_key=settings.AI_MODEL_API_KEY,
         model_name="gpt-4",
         organization=settings.OPENAI_ORG_ID
     )
-    model_manager.register_model("gpt4", gpt4_model, is_default=True)
+    model_manager.register_model(
+        "gpt4",
+        wrap_model(gpt4_model),
+        is_default=True,
+        fallback="gpt35"
+    )
     
     # 注册GPT-3.5-Turbo模型
-    gpt35_model = OpenAIAdapter(
+    gpt35_model = model_manager.create_adapter(
+        provider,
         api_key=settings.AI_MODEL_API_KEY,
         model_name="gpt-3.5-turbo",
         organization=settings.OPENAI_ORG_ID
     )
-    model_manager.register_model("gpt35", gpt35_model)
+    model_manager.register_model(
+        "gpt35",
+        wrap_model(gpt35_model)
+    )
 
 # 导出所有模块
 __all__ = [
     # 基础类和接口
     "BaseModelAdapter",
+    "ModelAdapterWrapper",
     "ModelResponse",
     "ModelError",
     "TokenLimitError",
@@ -60,27 +240,173 @@ __all__ = [
     "ModelAPIError",
     "ModelTimeoutError",
     "ModelRateLimitError",
+    "CircuitOpenError",
     "ModelManager",
+    "RoutedModelAdapter",
+    "RoutingDecision",
+    "CircuitBreaker",
+    "CircuitBreakerAdapter",
+    "CircuitState",
+    "RollingStats",
+    "percentile",
     
     # 模型适配器
     "OpenAIAdapter",
+    "FakeModelAdapter",
+    "create_openai_adapter",
+    "create_fake_adapter",
+    
+    # 响应缓存
+    "ResponseCache",
+    "MemoryCacheBackend",
+    "RedisCacheBackend",
+    "CachedModelAdapter",
+    "response_cache",
+    
+    # 离线批量推理
+    "BatchJob",
+    "BatchModelAdapter",
+    "BatchRequest",
+    "BatchResult",
+    "LocalBatchAdapter",
+    "close_batch_adapters",
+    "get_batch_adapter",
+    "init_batch_adapter",
+    "read_batch_results",
+    "write_batch_file",
+    
+    # 语义缓存
+    "SemanticCache",
+    "SemanticCacheAdapter",
+    "SemanticCachePolicy",
+    "build_semantic_cache_policies",
+    "normalize_prompt",
+    "semantic_cache",
+    
+    # 模型级联
+    "DEFAULT_CASCADE_POLICIES",
+    "DEFAULT_DRAFT_MODEL",
+    "CascadeModelAdapter",
+    "CascadePolicy",
+    "CascadeStats",
+    "build_cascade_policies",
+    "cascade_stats",
+    "confidence_check",
+    "json_check",
+    "local_quality_score",
+    "quality_check",
+    
+    # Best-of-N采样
+    "BestOfNResult",
+    "Sample",
+    "best_of_n",
+    "build_scorer",
+    "combine_scorers",
+    "iter_samples",
+    "keyword_scorer",
+    "length_scorer",
+    "quality_scorer",
+    "repetition_scorer",
+    "sample_temperatures",
+    
+    # 输出长度预测
+    "OutputLengthAdapter",
+    "OutputLengthPredictor",
+    "completion_tokens",
+    "output_length_predictor",
+    
+    # 上下文超限恢复
+    "COMPRESSION_MARKER",
+    "OverflowRecoveryAdapter",
+    "OverflowStats",
+    "compress_prompt",
+    "overflow_stats",
+    "parse_token_limit",
+    
+    # 重试策略
+    "DEFAULT_RETRY_RULES",
+    "RetryBudget",
+    "RetryPolicy",
+    "RetryRule",
+    "build_retry_policy",
+    "default_retry_policy",
+    "parse_retry_after",
+    "retry_budget",
+    "with_retry",
+    
+    # 对冲请求
+    "HedgeBudget",
+    "HedgedModelAdapter",
+    "HedgingPolicy",
+    "build_hedging_policies",
+    "hedge_budget",
+    "current_task_type",
+    "get_task_type",
+    
+    # 录制回放
+    "RecordingAdapter",
+    "CassetteMissError",
+    
+    # 请求合并
+    "SingleFlight",
+    "SingleFlightAdapter",
+    "request_coalescer",
     
     # 工具函数
     "load_prompt_template",
     "parse_json_response",
     "count_tokens",
+    "count_tokens_batch",
     "chunk_text",
+    "chunk_chars",
+    "iter_chunks",
+    "truncate_to_tokens",
+    "pack_batches",
     "validate_prompt_variables",
     "sanitize_prompt_input",
     "merge_generations",
     "extract_constraints",
     "rate_content_quality",
     
+    # 长文本map-reduce
+    "map_reduce",
+    "map_chunks",
+    "REDUCERS",
+    "Reducer",
+    "by_key",
+    "get_reducer",
+    "register_reducer",
+    
+    # JSON解析
+    "JSONStreamParser",
+    "extract_json",
+    "iter_json_fields",
+    
+    # 分词器
+    "TokenizerRegistry",
+    "tokenizer_registry",
+    "estimate_tokens",
+    
+    # 流式输出
+    "STREAMING_TASK_TYPES",
+    "TaskStream",
+    "TaskStreamBroker",
+    "task_stream_broker",
+    
+    # 上下文组装
+    "BuiltContext",
+    "ContextBuilder",
+    "ContextSection",
+    
     # 提示模板
     "prompts",
+    "PromptTemplate",
+    "TemplateRegistry",
+    "template_registry",
     
     # 全局实例
     "model_manager",
+    "wrap_model",
     "setup_default_models",
 ]
 
@@ -92,6 +418,8 @@ __exceptions__ = [
     "ModelAPIError",
     "ModelTimeoutError",
     "ModelRateLimitError",
+    "CircuitOpenError",
+    "CassetteMissError",
 ]
 
 # 工具函数导出
@@ -99,7 +427,12 @@ __utils__ = [
     "load_prompt_template",
     "parse_json_response",
     "count_tokens",
+    "count_tokens_batch",
     "chunk_text",
+    "chunk_chars",
+    "iter_chunks",
+    "truncate_to_tokens",
+    "pack_batches",
     "validate_prompt_variables",
     "sanitize_prompt_input",
     "merge_generations",
@@ -1,5 +1,21 @@
 from abc import ABC, abstractmethod
-from typing import Any, Dict, List, Optional
+from collections import deque
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+import asyncio
+import enum
+import logging
+import random
+import time
+
+from .json_stream import FieldKey, extract_json, iter_json_fields
+from .map_reduce import map_reduce
+from .metrics import RollingStats, overflow_stats
+from .reducers import by_key
+from .utils import count_tokens, count_tokens_batch, pack_batches
+
+logger = logging.getLogger(__name__)
 
 class ModelResponse:
     """
@@ -17,12 +33,99 @@ class ModelResponse:
         self.model_name = model_name
         self.metadata = metadata or {}
 
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        转换为可序列化的字典
+        """
+        return {
+            "content": self.content,
+            "tokens_used": self.tokens_used,
+            "model_name": self.model_name,
+            "metadata": dict(self.metadata),
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ModelResponse":
+        """
+        从字典还原响应对象
+        """
+        return cls(
+            content=data["content"],
+            tokens_used=data["tokens_used"],
+            model_name=data["model_name"],
+            metadata=dict(data.get("metadata") or {}),
+        )
+
+# 适配器层内部使用的控制参数，由包装适配器消费，不会透传给模型供应商
+CONTROL_KWARGS = {
+    "use_cache",
+    "coalesce",
+    "task_type",
+    "hedge",
+    "overflow",
+    "continue_truncated",
+    "adaptive_max_tokens",
+    "stream_result",
+}
+
+def strip_control_kwargs(kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    移除适配器层的控制参数，返回可以发送给供应商的参数
+    """
+    return {k: v for k, v in kwargs.items() if k not in CONTROL_KWARGS}
+
+def set_stream_result(kwargs: Dict[str, Any], **values: Any) -> None:
+    """
+    流式调用结束时回填结果信息（如finish_reason）
+    流式接口只能逐块返回文本，调用方通过stream_result参数传入一个字典接收这些信息，没有传入时忽略
+    """
+    result = kwargs.get("stream_result")
+    if result is not None:
+        result.update(values)
+
+def request_key_params(
+    max_tokens: int,
+    temperature: float,
+    stop: Optional[List[str]],
+    kwargs: Dict[str, Any]
+) -> Dict[str, Any]:
+    """
+    缓存键和合并键使用的请求参数
+    按预测值设置的max_tokens（adaptive_max_tokens）随样本变化，记为"auto"，
+    否则相同的请求会因预测值不同而无法命中缓存或合并；截断的结果由OutputLengthAdapter续写
+    """
+    return {
+        "max_tokens": "auto" if kwargs.get("adaptive_max_tokens") else max_tokens,
+        "temperature": temperature,
+        "stop": stop,
+        **strip_control_kwargs(kwargs),
+    }
+
+# 当前正在处理的Agent任务类型，由AgentManager在执行任务时设置，
+# 供按任务类型配置的包装层（如对冲请求）读取
+current_task_type: ContextVar[Optional[str]] = ContextVar("current_task_type", default=None)
+
+def get_task_type(kwargs: Dict[str, Any]) -> Optional[str]:
+    """
+    获取调用所属的任务类型：优先使用task_type参数，其次使用当前任务上下文
+    """
+    return kwargs.get("task_type") or current_task_type.get()
+
 class BaseModelAdapter(ABC):
     """
     AI模型适配器基类
     定义了所有模型适配器必须实现的接口
+    分类、情感分析等分析方法基于generate_text实现，包装适配器可以统一拦截
     """
 
+    # 单次嵌入请求的输入条数和token总量上限，由具体供应商覆盖
+    embedding_batch_size: int = 100
+    embedding_batch_tokens: int = 8000
+    # 模型上下文窗口（提示与输出token数之和的上限）
+    context_window: int = 8192
+    # 长文本分析分块后同时处理的块数
+    analysis_max_concurrency: int = 4
+
     @abstractmethod
     async def generate_text(
         self,
@@ -37,6 +140,29 @@ class BaseModelAdapter(ABC):
         """
         pass
 
+    async def generate_text_stream(
+        self,
+        prompt: str,
+        max_tokens: int = 1000,
+        temperature: float = 0.7,
+        stop: Optional[List[str]] = None,
+        **kwargs: Any
+    ) -> AsyncIterator[str]:
+        """
+        流式生成文本
+        逐块返回生成的文本片段；调用方提前结束迭代即可取消生成
+        默认实现退化为一次性返回完整结果，支持流式输出的适配器应覆盖此方法
+        """
+        response = await self.generate_text(
+            prompt=prompt,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            stop=stop,
+            **kwargs
+        )
+        set_stream_result(kwargs, finish_reason=response.metadata.get("finish_reason"))
+        yield response.content
+
     @abstractmethod
     async def generate_embedding(
         self,
@@ -47,7 +173,130 @@ class BaseModelAdapter(ABC):
         """
         pass
 
-    @abstractmethod
+    async def generate_embeddings(
+        self,
+        texts: List[str],
+        max_concurrency: int = 4
+    ) -> List[List[float]]:
+        """
+        批量生成文本嵌入向量
+        按条数和token预算把输入打包成批次，并发请求后按输入顺序返回
+        """
+        if not texts:
+            return []
+
+        batches = pack_batches(
+            texts,
+            max_items=self.embedding_batch_size,
+            max_tokens=self.embedding_batch_tokens,
+            token_counts=count_tokens_batch(texts)
+        )
+        results: List[Optional[List[float]]] = [None] * len(texts)
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def run_batch(indices: List[int]) -> None:
+            async with semaphore:
+                vectors = await self._embed_batch([texts[i] for i in indices])
+            for index, vector in zip(indices, vectors):
+                results[index] = vector
+
+        await asyncio.gather(*(run_batch(batch) for batch in batches))
+        return results
+
+    async def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """
+        为一个批次生成嵌入向量
+        默认逐条调用generate_embedding，支持批量接口的适配器应覆盖此方法
+        """
+        return list(await asyncio.gather(
+            *(self.generate_embedding(text) for text in texts)
+        ))
+
+    async def generate_json_fields(
+        self,
+        prompt: str,
+        max_tokens: int = 1000,
+        temperature: float = 0.7,
+        **kwargs: Any
+    ) -> AsyncIterator[Tuple[FieldKey, Any]]:
+        """
+        流式生成JSON，每个顶层字段闭合后立即返回(字段名, 值)
+        调用方可以在整个响应结束前开始处理已完成的字段；JSON闭合后关闭上游流
+        """
+        stream = self.generate_text_stream(
+            prompt=prompt,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            **kwargs
+        )
+        async for item in iter_json_fields(stream):
+            yield item
+
+    @property
+    def analysis_chunk_tokens(self) -> int:
+        """
+        分析方法单次调用的文本token上限，超出时分块并发处理再归并结果
+        """
+        return max(512, self.context_window // 4)
+
+    def _is_long_text(self, text: str) -> bool:
+        # 与分块使用同一分词器计数，保证超出上限的文本至少切成两块
+        return count_tokens(text, self.model_name) > self.analysis_chunk_tokens
+
+    async def map_reduce_text(
+        self,
+        text: str,
+        map_func: Callable[[str], Awaitable[Any]],
+        reducer: Any = "concat"
+    ) -> Any:
+        """
+        按本模型的分块大小和并发数对长文本执行map-reduce
+        """
+        return await map_reduce(
+            text,
+            map_func,
+            reducer,
+            chunk_tokens=self.analysis_chunk_tokens,
+            model=self.model_name,
+            max_concurrency=self.analysis_max_concurrency
+        )
+
+    async def _split_on_overflow(
+        self,
+        error: "TokenLimitError",
+        text: str,
+        map_func: Callable[[str], Awaitable[Any]],
+        reducer: Any,
+        task_type: Optional[str] = None
+    ) -> Any:
+        """
+        单次分析超出上下文窗口时（本地token计数比供应商的偏小）改为按一半的长度分块map-reduce
+        各块仍然超限时继续对半分块，文本已经很短时抛出原来的错误
+        """
+        chunk_tokens = count_tokens(text, self.model_name) // 2
+        if chunk_tokens < 64:
+            raise error
+        task_type = task_type or get_task_type({})
+        logger.warning(
+            f"Context overflow on {self.model_name} (task {task_type}): "
+            f"retrying as map-reduce with {chunk_tokens}-token chunks"
+        )
+        try:
+            result = await map_reduce(
+                text,
+                map_func,
+                reducer,
+                chunk_tokens=chunk_tokens,
+                boundary_window=min(100, chunk_tokens // 4),
+                model=self.model_name,
+                max_concurrency=self.analysis_max_concurrency
+            )
+        except TokenLimitError:
+            overflow_stats.record(task_type, "map_reduce", recovered=False)
+            raise
+        overflow_stats.record(task_type, "map_reduce", recovered=True)
+        return result
+
     async def classify_text(
         self,
         text: str,
@@ -55,21 +304,82 @@ class BaseModelAdapter(ABC):
     ) -> Dict[str, float]:
         """
         文本分类
-        返回每个标签的概率
+        使用few-shot方式进行分类，长文本各块的概率取平均
         """
-        pass
+        if self._is_long_text(text):
+            return await self.map_reduce_text(
+                text, lambda chunk: self.classify_text(chunk, labels), "average"
+            )
+
+        prompt = f"""
+        请对以下文本进行分类，可能的类别有：{', '.join(labels)}
+        
+        文本内容：
+        {text}
+        
+        请以JSON格式返回每个类别的概率，概率之和应为1。
+        """
+        
+        try:
+            response = await self.generate_text(
+                prompt=prompt,
+                temperature=0.3,
+                task_type="classify_text",
+                overflow=False
+            )
+        except TokenLimitError as e:
+            return await self._split_on_overflow(
+                e, text, lambda chunk: self.classify_text(chunk, labels), "average", "classify_text"
+            )
+        
+        try:
+            probabilities = extract_json(response.content)
+            return probabilities
+        except Exception:
+            return {label: 0.0 for label in labels}
 
-    @abstractmethod
     async def analyze_sentiment(
         self,
         text: str
     ) -> Dict[str, float]:
         """
         情感分析
+        长文本各块的概率取平均
         """
-        pass
+        if self._is_long_text(text):
+            return await self.map_reduce_text(text, self.analyze_sentiment, "average")
+
+        prompt = """
+        请对以下文本进行情感分析，返回积极、消极和中性的概率值。
+        
+        文本内容：
+        {text}
+        
+        请以JSON格式返回分析结果，包含positive、negative和neutral三个字段，值为0-1之间的浮点数，总和为1。
+        """
+        
+        try:
+            response = await self.generate_text(
+                prompt=prompt.format(text=text),
+                temperature=0.3,
+                task_type="analyze_sentiment",
+                overflow=False
+            )
+        except TokenLimitError as e:
+            return await self._split_on_overflow(
+                e, text, self.analyze_sentiment, "average", "analyze_sentiment"
+            )
+        
+        try:
+            sentiment = extract_json(response.content)
+            return sentiment
+        except Exception:
+            return {
+                "positive": 0.0,
+                "negative": 0.0,
+                "neutral": 1.0
+            }
 
-    @abstractmethod
     async def extract_keywords(
         self,
         text: str,
@@ -77,18 +387,214 @@ class BaseModelAdapter(ABC):
     ) -> List[str]:
         """
         关键词提取
+        长文本合并各块的关键词，在多个块中出现的排在前面
         """
-        pass
+        if self._is_long_text(text):
+            keywords = await self.map_reduce_text(
+                text, lambda chunk: self.extract_keywords(chunk, max_keywords), "union"
+            )
+            return keywords[:max_keywords]
+
+        prompt = f"""
+        请从以下文本中提取最多{max_keywords}个关键词，以JSON数组格式返回。
+        
+        文本内容：
+        {text}
+        """
+        
+        try:
+            response = await self.generate_text(
+                prompt=prompt,
+                temperature=0.3,
+                task_type="extract_keywords",
+                overflow=False
+            )
+        except TokenLimitError as e:
+            keywords = await self._split_on_overflow(
+                e, text, lambda chunk: self.extract_keywords(chunk, max_keywords), "union", "extract_keywords"
+            )
+            return keywords[:max_keywords]
+        
+        try:
+            keywords = extract_json(response.content)
+            return keywords[:max_keywords]
+        except Exception:
+            return []
 
-    @abstractmethod
     async def check_content_safety(
         self,
         text: str
     ) -> Dict[str, Any]:
         """
         内容安全检查
+        长文本任一块不安全则整体不安全
         """
-        pass
+        if self._is_long_text(text):
+            return await self.map_reduce_text(text, self.check_content_safety, "max_risk")
+
+        prompt = """
+        请对以下内容进行安全检查，检查是否包含：
+        1. 暴力内容
+        2. 色情内容
+        3. 仇恨言论
+        4. 歧视内容
+        5. 有害信息
+        
+        文本内容：
+        {text}
+        
+        请以JSON格式返回检查结果，包含is_safe字段和各项具体检查结果。
+        """
+        
+        try:
+            response = await self.generate_text(
+                prompt=prompt.format(text=text),
+                temperature=0.3,
+                task_type="check_content_safety",
+                overflow=False
+            )
+        except TokenLimitError as e:
+            return await self._split_on_overflow(
+                e, text, self.check_content_safety, "max_risk", "check_content_safety"
+            )
+        
+        try:
+            check_result = extract_json(response.content)
+            return check_result
+        except Exception:
+            return {
+                "is_safe": False,
+                "reason": "检查失败"
+            }
+
+    # 长文本组合分析时各分析项的归并方式
+    ANALYSIS_REDUCERS: Dict[str, str] = {
+        "classification": "average",
+        "sentiment": "average",
+        "keywords": "union",
+        "safety": "max_risk",
+    }
+
+    # analyze_text支持的分析项：名称 -> (提示中的要求, 结果类型)
+    ANALYSES: Dict[str, tuple] = {
+        "classification": (
+            "对文本进行分类，可能的类别有：{labels}，返回每个类别的概率（对象），概率之和为1",
+            dict,
+        ),
+        "sentiment": (
+            "情感分析，返回包含positive、negative和neutral三个字段的对象，值为0-1之间的浮点数，总和为1",
+            dict,
+        ),
+        "keywords": (
+            "提取最多{max_keywords}个关键词，返回字符串数组",
+            list,
+        ),
+        "safety": (
+            "安全检查，检查是否包含暴力、色情、仇恨言论、歧视或有害信息，"
+            "返回包含is_safe字段和各项具体检查结果的对象",
+            dict,
+        ),
+    }
+
+    async def analyze_text(
+        self,
+        text: str,
+        analyses: Optional[List[str]] = None,
+        labels: Optional[List[str]] = None,
+        max_keywords: int = 10
+    ) -> Dict[str, Any]:
+        """
+        组合分析
+        在一次调用中完成多项分析（classification、sentiment、keywords、safety），
+        文本只发送一次。返回以分析项为键的结果，解析失败的项改用对应的单项方法。
+        长文本分块并发分析，各项按ANALYSIS_REDUCERS归并
+        """
+        analyses = list(analyses or self.ANALYSES)
+        unknown = [name for name in analyses if name not in self.ANALYSES]
+        if unknown:
+            raise ValueError(f"不支持的分析项: {', '.join(unknown)}")
+        if "classification" in analyses and not labels:
+            raise ValueError("classification分析需要提供labels")
+
+        if self._is_long_text(text):
+            results = await self.map_reduce_text(
+                text,
+                lambda chunk: self.analyze_text(chunk, analyses, labels, max_keywords),
+                by_key(self.ANALYSIS_REDUCERS)
+            )
+            if "keywords" in results:
+                results["keywords"] = results["keywords"][:max_keywords]
+            return results
+
+        requirements = "\n".join(
+            f"        - {name}：" + self.ANALYSES[name][0].format(
+                labels=", ".join(labels or []),
+                max_keywords=max_keywords
+            )
+            for name in analyses
+        )
+        prompt = f"""
+        请对以下文本完成多项分析：
+{requirements}
+
+        文本内容：
+        {text}
+
+        请以一个JSON对象返回结果，键为上面的分析项名称（{', '.join(analyses)}），值为对应的分析结果。
+        """
+
+        parsed: Dict[str, Any] = {}
+        try:
+            response = await self.generate_text(
+                prompt=prompt,
+                max_tokens=250 * len(analyses) + 10 * max_keywords,
+                temperature=0.3,
+                overflow=False
+            )
+            parsed = extract_json(response.content)
+            if not isinstance(parsed, dict):
+                parsed = {}
+        except TokenLimitError as e:
+            results = await self._split_on_overflow(
+                e,
+                text,
+                lambda chunk: self.analyze_text(chunk, analyses, labels, max_keywords),
+                by_key(self.ANALYSIS_REDUCERS)
+            )
+            if "keywords" in results:
+                results["keywords"] = results["keywords"][:max_keywords]
+            return results
+        except ModelError:
+            raise
+        except Exception as e:
+            logger.warning(f"Combined analysis parse failed, falling back: {e}")
+
+        results: Dict[str, Any] = {}
+        for name in analyses:
+            value = parsed.get(name)
+            if isinstance(value, self.ANALYSES[name][1]):
+                results[name] = value[:max_keywords] if name == "keywords" else value
+            else:
+                results[name] = await self._analyze_single(name, text, labels, max_keywords)
+        return results
+
+    async def _analyze_single(
+        self,
+        name: str,
+        text: str,
+        labels: Optional[List[str]],
+        max_keywords: int
+    ) -> Any:
+        """
+        使用单项方法完成一项分析
+        """
+        if name == "classification":
+            return await self.classify_text(text, labels or [])
+        if name == "sentiment":
+            return await self.analyze_sentiment(text)
+        if name == "keywords":
+            return await self.extract_keywords(text, max_keywords)
+        return await self.check_content_safety(text)
 
     @abstractmethod
     def get_token_count(self, text: str) -> int:
@@ -97,6 +603,86 @@ class BaseModelAdapter(ABC):
         """
         pass
 
+    async def aclose(self) -> None:
+        """
+        释放连接池等资源，持有网络连接的适配器应覆盖此方法
+        """
+        pass
+
+class ModelAdapterWrapper(BaseModelAdapter):
+    """
+    包装适配器基类
+    把调用转发给内部适配器，子类只需覆盖需要拦截的方法（缓存、熔断等）
+    """
+
+    def __init__(self, model: BaseModelAdapter):
+        self.model = model
+
+    @property
+    def model_name(self) -> str:
+        return self.model.model_name
+
+    @property
+    def embedding_batch_size(self) -> int:
+        return self.model.embedding_batch_size
+
+    @property
+    def embedding_batch_tokens(self) -> int:
+        return self.model.embedding_batch_tokens
+
+    @property
+    def context_window(self) -> int:
+        return self.model.context_window
+
+    async def aclose(self) -> None:
+        await self.model.aclose()
+
+    async def generate_text(
+        self,
+        prompt: str,
+        max_tokens: int = 1000,
+        temperature: float = 0.7,
+        stop: Optional[List[str]] = None,
+        **kwargs: Any
+    ) -> ModelResponse:
+        return await self.model.generate_text(
+            prompt=prompt,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            stop=stop,
+            **kwargs
+        )
+
+    async def generate_text_stream(
+        self,
+        prompt: str,
+        max_tokens: int = 1000,
+        temperature: float = 0.7,
+        stop: Optional[List[str]] = None,
+        **kwargs: Any
+    ) -> AsyncIterator[str]:
+        stream = self.model.generate_text_stream(
+            prompt=prompt,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            stop=stop,
+            **kwargs
+        )
+        try:
+            async for chunk in stream:
+                yield chunk
+        finally:
+            await stream.aclose()
+
+    async def generate_embedding(self, text: str) -> List[float]:
+        return await self.model.generate_embedding(text)
+
+    async def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        return await self.model._embed_batch(texts)
+
+    def get_token_count(self, text: str) -> int:
+        return self.model.get_token_count(text)
+
 class ModelError(Exception):
     """
     模型错误基类
@@ -146,26 +732,390 @@ class ModelRateLimitError(ModelError):
     """
     pass
 
+class CircuitOpenError(ModelError):
+    """
+    熔断器打开，调用被快速拒绝
+    """
+    pass
+
+class CircuitState(enum.Enum):
+    """
+    熔断器状态
+    """
+    CLOSED = "closed"        # 正常放行
+    OPEN = "open"            # 快速失败
+    HALF_OPEN = "half_open"  # 放行少量探测请求
+
+class CircuitBreaker:
+    """
+    熔断器
+    连续失败达到阈值后打开，经过recovery_timeout秒进入半开状态放行探测请求，
+    探测成功则关闭，失败则重新打开
+    """
+
+    # 计入失败的错误类型；参数错误、token超限等请求本身的问题不代表供应商故障
+    failure_error_types = {"rate_limit", "timeout", "api_error"}
+    # 请求本身有问题的错误类型，说明供应商正常响应，按成功处理
+    client_error_types = {"token_limit", "invalid_request", "content_filter"}
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        recovery_timeout: float = 30.0,
+        half_open_max_calls: int = 1,
+        on_state_change: Optional[Callable[["CircuitBreaker", CircuitState, CircuitState], None]] = None
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.on_state_change = on_state_change or publish_circuit_state
+
+        self._state = CircuitState.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._half_open_calls = 0
+
+    @property
+    def state(self) -> CircuitState:
+        """
+        当前状态，打开超过recovery_timeout后自动进入半开状态
+        """
+        if (
+            self._state == CircuitState.OPEN
+            and time.monotonic() - self._opened_at >= self.recovery_timeout
+        ):
+            self._transition(CircuitState.HALF_OPEN)
+        return self._state
+
+    def allow_request(self) -> bool:
+        """
+        判断是否放行请求
+        """
+        state = self.state
+        if state == CircuitState.CLOSED:
+            return True
+        if state == CircuitState.HALF_OPEN and self._half_open_calls < self.half_open_max_calls:
+            self._half_open_calls += 1
+            return True
+        return False
+
+    def is_failure(self, error: Exception) -> bool:
+        """
+        判断异常是否计入熔断失败
+        """
+        if not isinstance(error, ModelError) or isinstance(error, CircuitOpenError):
+            return False
+        if error.error_code == "invalid_request":
+            return False
+        return error.error_type in self.failure_error_types
+
+    def is_client_error(self, error: BaseException) -> bool:
+        """
+        判断异常是否为请求本身的错误（token超限、无效请求等）
+        """
+        if not isinstance(error, ModelError) or isinstance(error, CircuitOpenError):
+            return False
+        return error.error_code == "invalid_request" or error.error_type in self.client_error_types
+
+    def record_error(self, error: BaseException) -> bool:
+        """
+        按异常记录调用结果：供应商故障计入失败，请求本身的错误按成功处理；
+        取消、非模型异常等不改变状态，返回False
+        """
+        if self.is_failure(error):
+            self.record_failure()
+            return True
+        if self.is_client_error(error):
+            self.record_success()
+            return True
+        return False
+
+    def release_probe(self) -> None:
+        """
+        归还半开状态的探测名额
+        探测请求被取消、流被提前关闭或抛出不计入状态的异常时调用，否则名额用完后熔断器会一直拒绝请求
+        """
+        if self._state == CircuitState.HALF_OPEN and self._half_open_calls > 0:
+            self._half_open_calls -= 1
+
+    def record_success(self) -> None:
+        """
+        记录成功调用
+        """
+        self._failures = 0
+        if self._state != CircuitState.CLOSED:
+            self._transition(CircuitState.CLOSED)
+
+    def record_failure(self) -> None:
+        """
+        记录失败调用
+        """
+        self._failures += 1
+        if self._state == CircuitState.HALF_OPEN or self._failures >= self.failure_threshold:
+            self._opened_at = time.monotonic()
+            self._transition(CircuitState.OPEN)
+
+    def open_error(self) -> CircuitOpenError:
+        """
+        构造熔断拒绝异常
+        """
+        retry_after = max(0.0, self.recovery_timeout - (time.monotonic() - self._opened_at))
+        return CircuitOpenError(
+            message=f"Circuit breaker for {self.name} is open",
+            model_name=self.name,
+            error_code="circuit_open",
+            error_type="circuit_open",
+            metadata={"retry_after": retry_after}
+        )
+
+    def _transition(self, new_state: CircuitState) -> None:
+        old_state = self._state
+        if old_state == new_state:
+            return
+        self._state = new_state
+        self._half_open_calls = 0
+        if new_state == CircuitState.CLOSED:
+            self._failures = 0
+        logger.warning(
+            f"Circuit breaker {self.name}: {old_state.value} -> {new_state.value}"
+        )
+        if self.on_state_change is not None:
+            try:
+                self.on_state_change(self, old_state, new_state)
+            except Exception as e:
+                logger.error(f"Circuit breaker state callback failed: {e}")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "state": self.state.value,
+            "failures": self._failures,
+            "failure_threshold": self.failure_threshold,
+            "recovery_timeout": self.recovery_timeout,
+        }
+
+def publish_circuit_state(
+    breaker: CircuitBreaker,
+    old_state: CircuitState,
+    new_state: CircuitState
+) -> None:
+    """
+    把熔断器状态变化发布到事件总线的model_events主题
+    事件总线未初始化或不在事件循环中时忽略
+    """
+    from app.core.event_bus import Message, get_event_bus
+
+    try:
+        event_bus = get_event_bus()
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return
+
+    message = Message(
+        topic="model_events",
+        payload={
+            "event_type": "circuit_state_changed",
+            "model_name": breaker.name,
+            "old_state": old_state.value,
+            "new_state": new_state.value,
+        }
+    )
+    loop.create_task(event_bus.publish(message))
+
+class CircuitBreakerAdapter(ModelAdapterWrapper):
+    """
+    带熔断器的模型适配器
+    熔断器打开时直接抛出CircuitOpenError，不再占用连接和重试时间
+    """
+
+    def __init__(
+        self,
+        model: BaseModelAdapter,
+        breaker: Optional[CircuitBreaker] = None,
+        **breaker_options: Any
+    ):
+        super().__init__(model)
+        self.circuit_breaker = breaker or CircuitBreaker(model.model_name, **breaker_options)
+
+    def _acquire(self) -> bool:
+        """
+        申请放行，返回本次调用是否占用了半开状态的探测名额
+        """
+        breaker = self.circuit_breaker
+        if not breaker.allow_request():
+            raise breaker.open_error()
+        return breaker.state == CircuitState.HALF_OPEN
+
+    async def _guard(self, call: Callable[[], Awaitable[Any]]) -> Any:
+        probing = self._acquire()
+        recorded = False
+        try:
+            result = await call()
+            self.circuit_breaker.record_success()
+            recorded = True
+            return result
+        except BaseException as e:
+            recorded = self.circuit_breaker.record_error(e)
+            raise
+        finally:
+            if probing and not recorded:
+                self.circuit_breaker.release_probe()
+
+    async def generate_text(
+        self,
+        prompt: str,
+        max_tokens: int = 1000,
+        temperature: float = 0.7,
+        stop: Optional[List[str]] = None,
+        **kwargs: Any
+    ) -> ModelResponse:
+        return await self._guard(lambda: self.model.generate_text(
+            prompt=prompt,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            stop=stop,
+            **kwargs
+        ))
+
+    async def generate_text_stream(
+        self,
+        prompt: str,
+        max_tokens: int = 1000,
+        temperature: float = 0.7,
+        stop: Optional[List[str]] = None,
+        **kwargs: Any
+    ) -> AsyncIterator[str]:
+        probing = self._acquire()
+        recorded = False
+        stream = self.model.generate_text_stream(
+            prompt=prompt,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            stop=stop,
+            **kwargs
+        )
+        try:
+            async for chunk in stream:
+                yield chunk
+            self.circuit_breaker.record_success()
+            recorded = True
+        except BaseException as e:
+            # 包括调用方提前关闭流（GeneratorExit）和取消，这两种情况不改变状态
+            recorded = self.circuit_breaker.record_error(e)
+            raise
+        finally:
+            if probing and not recorded:
+                self.circuit_breaker.release_probe()
+            await stream.aclose()
+
+    async def generate_embedding(self, text: str) -> List[float]:
+        return await self._guard(lambda: self.model.generate_embedding(text))
+
+    async def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        return await self._guard(lambda: self.model._embed_batch(texts))
+
+def find_circuit_breaker(model: BaseModelAdapter) -> Optional[CircuitBreaker]:
+    """
+    沿包装链查找适配器上的熔断器
+    """
+    while model is not None:
+        breaker = getattr(model, "circuit_breaker", None)
+        if breaker is not None:
+            return breaker
+        model = getattr(model, "model", None) if isinstance(model, ModelAdapterWrapper) else None
+    return None
+
+@dataclass
+class RoutingDecision:
+    """
+    路由决策记录
+    """
+    model_name: str
+    reason: str
+    candidates: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    fallback_from: Optional[str] = None
+    timestamp: float = field(default_factory=time.time)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
 class ModelManager:
     """
     模型管理器
     负责模型的初始化、切换和负载均衡
+    根据权重、滚动延迟和错误率在候选模型之间路由，并在限流或超时时切换到备用模型
     """
+
+    # 错误率超过该值的模型在有其他健康候选时不参与路由
+    max_error_rate: float = 0.5
+    # 触发故障转移的异常类型
+    failover_errors = (ModelRateLimitError, ModelTimeoutError, CircuitOpenError)
     
     def __init__(self):
         self._models: Dict[str, BaseModelAdapter] = {}
         self._default_model: Optional[str] = None
+        self._weights: Dict[str, float] = {}
+        self._fallbacks: Dict[str, str] = {}
+        self._stats: Dict[str, RollingStats] = {}
+        self._task_stats: Dict[str, Dict[str, RollingStats]] = {}
+        self._providers: Dict[str, Callable[..., BaseModelAdapter]] = {}
+        self.routing_history: Deque[RoutingDecision] = deque(maxlen=100)
+
+    async def aclose(self) -> None:
+        """
+        关闭所有已注册模型持有的连接
+        """
+        for name, model in self._models.items():
+            try:
+                await model.aclose()
+            except Exception as e:
+                logger.warning(f"Failed to close model {name}: {e}")
+
+    def register_provider(
+        self,
+        provider: str,
+        factory: Callable[..., BaseModelAdapter]
+    ) -> None:
+        """
+        注册模型供应商
+        factory接收model_name、api_key、organization、base_url、extra_params等关键字参数，
+        返回该供应商的模型适配器，ModelConfig.provider按名称选择供应商
+        """
+        self._providers[provider] = factory
+
+    def has_provider(self, provider: str) -> bool:
+        return provider in self._providers
+
+    def list_providers(self) -> List[str]:
+        return list(self._providers.keys())
+
+    def create_adapter(self, provider: str, **options: Any) -> BaseModelAdapter:
+        """
+        使用已注册的供应商创建模型适配器
+        """
+        if provider not in self._providers:
+            raise ValueError(f"Provider {provider} not found")
+        return self._providers[provider](**options)
 
     def register_model(
         self,
         name: str,
         model: BaseModelAdapter,
-        is_default: bool = False
+        is_default: bool = False,
+        weight: float = 1.0,
+        fallback: Optional[str] = None
     ) -> None:
         """
         注册模型
+        weight为路由权重，fallback为限流或超时时切换到的模型名称
         """
         self._models[name] = model
+        self._weights[name] = weight
+        self._stats.setdefault(name, RollingStats())
+        if fallback:
+            self._fallbacks[name] = fallback
         if is_default or self._default_model is None:
             self._default_model = name
 
@@ -181,6 +1131,159 @@ class ModelManager:
             raise ValueError(f"Model {model_name} not found")
         return self._models[model_name]
 
+    def get_router(
+        self,
+        candidates: Optional[List[str]] = None,
+        fallback: Optional[str] = None
+    ) -> "RoutedModelAdapter":
+        """
+        获取路由适配器
+        每次调用时在候选模型中选择，未指定候选时使用默认模型
+        """
+        return RoutedModelAdapter(self, candidates=candidates, fallback=fallback)
+
+    def find_model(self, name_or_provider: Optional[str]) -> Optional[str]:
+        """
+        按模型名称或供应商前缀查找已注册的模型
+        """
+        if not name_or_provider:
+            return None
+        if name_or_provider in self._models:
+            return name_or_provider
+        prefix = f"{name_or_provider}_"
+        return next((n for n in self._models if n.startswith(prefix)), None)
+
+    def get_fallback(self, name: str) -> Optional[str]:
+        """
+        获取模型的备用模型名称
+        """
+        return self._fallbacks.get(name)
+
+    def get_stats(self, name: str) -> RollingStats:
+        """
+        获取模型的滚动统计
+        """
+        return self._stats.setdefault(name, RollingStats())
+
+    def get_task_stats(self, name: str) -> Dict[str, RollingStats]:
+        """
+        获取模型按任务类型的延迟统计（任务类型 -> 滚动统计），由对冲适配器记录
+        """
+        return self._task_stats.setdefault(name, {})
+
+    def get_circuit_breaker(self, name: str) -> Optional[CircuitBreaker]:
+        """
+        获取模型上的熔断器（未配置时返回None）
+        """
+        model = self._models.get(name)
+        return find_circuit_breaker(model) if model is not None else None
+
+    def record_call(self, name: str, latency: float, success: bool) -> None:
+        """
+        记录一次模型调用的延迟和结果
+        """
+        self.get_stats(name).record(latency, success)
+
+    def select_model(
+        self,
+        candidates: Optional[List[str]] = None,
+        exclude: Optional[List[str]] = None
+    ) -> RoutingDecision:
+        """
+        在候选模型中选择一个
+        有效权重 = 配置权重 × 延迟因子（最快p50/自身p50）× (1 - 错误率)，
+        错误率超过max_error_rate的模型仅在没有其他健康候选时使用
+        """
+        names = [
+            n for n in (candidates or [self.get_default_model()])
+            if n in self._models and n not in (exclude or [])
+        ]
+        if not names:
+            raise ValueError("No available model to route to")
+
+        # 熔断器打开的模型改走其备用模型
+        rerouted = []
+        for index, name in enumerate(names):
+            breaker = self.get_circuit_breaker(name)
+            if breaker is None or breaker.state != CircuitState.OPEN:
+                continue
+            fallback = self._fallbacks.get(name)
+            if fallback in self._models and fallback not in names:
+                breaker_fallback = self.get_circuit_breaker(fallback)
+                if breaker_fallback is None or breaker_fallback.state != CircuitState.OPEN:
+                    names[index] = fallback
+                    rerouted.append(f"{name}->{fallback}")
+        if rerouted:
+            decision = self.select_model(names, exclude=exclude)
+            decision.reason = f"circuit open, rerouted {', '.join(rerouted)}; {decision.reason}"
+            return decision
+
+        if len(names) == 1:
+            decision = RoutingDecision(
+                model_name=names[0],
+                reason="single candidate",
+                candidates={names[0]: self.get_stats(names[0]).to_dict()}
+            )
+            self.routing_history.append(decision)
+            return decision
+
+        snapshot = {n: self.get_stats(n).to_dict() for n in names}
+        healthy = [n for n in names if snapshot[n]["error_rate"] <= self.max_error_rate]
+        pool = healthy or names
+
+        latencies = [snapshot[n]["p50"] for n in pool if snapshot[n]["p50"]]
+        fastest = min(latencies) if latencies else None
+
+        scores: Dict[str, float] = {}
+        for n in pool:
+            latency_factor = 1.0
+            if fastest and snapshot[n]["p50"]:
+                latency_factor = fastest / snapshot[n]["p50"]
+            health_factor = max(0.05, 1.0 - snapshot[n]["error_rate"])
+            scores[n] = self._weights.get(n, 1.0) * latency_factor * health_factor
+            snapshot[n]["score"] = scores[n]
+
+        chosen = random.choices(pool, weights=[scores[n] for n in pool])[0]
+        excluded = [n for n in names if n not in pool]
+        reason = (
+            f"weighted choice (score={scores[chosen]:.3f}, "
+            f"p50={snapshot[chosen]['p50']}, "
+            f"error_rate={snapshot[chosen]['error_rate']:.2f})"
+        )
+        if excluded:
+            reason += f"; excluded unhealthy: {', '.join(excluded)}"
+
+        decision = RoutingDecision(model_name=chosen, reason=reason, candidates=snapshot)
+        self.routing_history.append(decision)
+        return decision
+
+    @property
+    def last_decision(self) -> Optional[RoutingDecision]:
+        """
+        最近一次路由决策
+        """
+        return self.routing_history[-1] if self.routing_history else None
+
+    def get_routing_stats(self) -> Dict[str, Any]:
+        """
+        获取各模型的路由统计和最近的路由决策
+        """
+        return {
+            "models": {
+                name: {
+                    "weight": self._weights.get(name, 1.0),
+                    "fallback": self._fallbacks.get(name),
+                    "circuit_breaker": (
+                        self.get_circuit_breaker(name).to_dict()
+                        if self.get_circuit_breaker(name) else None
+                    ),
+                    **self.get_stats(name).to_dict(),
+                }
+                for name in self._models
+            },
+            "recent_decisions": [d.to_dict() for d in list(self.routing_history)[-10:]],
+        }
+
     def list_models(self) -> List[str]:
         """
         获取所有可用模型列表
@@ -201,4 +1304,157 @@ class ModelManager:
         """
         if name not in self._models:
             raise ValueError(f"Model {name} not found")
-        self._default_model = name
\ No newline at end of file
+        self._default_model = name
+
+class RoutedModelAdapter(BaseModelAdapter):
+    """
+    路由适配器
+    每次调用通过ModelManager选择模型，记录延迟和错误，
+    遇到限流或超时时切换到备用模型重试一次
+    """
+
+    def __init__(
+        self,
+        manager: ModelManager,
+        candidates: Optional[List[str]] = None,
+        fallback: Optional[str] = None
+    ):
+        self.manager = manager
+        self.candidates = candidates
+        self.fallback = fallback
+
+    @property
+    def model_name(self) -> str:
+        return self._primary().model_name
+
+    @property
+    def embedding_batch_size(self) -> int:
+        return self._primary().embedding_batch_size
+
+    @property
+    def embedding_batch_tokens(self) -> int:
+        return self._primary().embedding_batch_tokens
+
+    @property
+    def context_window(self) -> int:
+        """
+        取主模型及其备用模型中较小的窗口，故障转移后提示仍然放得下
+        """
+        names = self.candidates or [self.manager.get_default_model()]
+        windows = []
+        for name in names:
+            windows.append(self.manager.get_model(name).context_window)
+            fallback = self._fallback_for(name)
+            if fallback:
+                windows.append(self.manager.get_model(fallback).context_window)
+        return min(windows)
+
+    def _primary(self) -> BaseModelAdapter:
+        names = self.candidates or [self.manager.get_default_model()]
+        return self.manager.get_model(names[0])
+
+    def _fallback_for(self, name: str) -> Optional[str]:
+        fallback = self.manager.get_fallback(name) or self.fallback
+        if fallback and fallback != name and fallback in self.manager.list_models():
+            return fallback
+        return None
+
+    async def _call(self, name: str, method: str, *args: Any, **kwargs: Any) -> Any:
+        model = self.manager.get_model(name)
+        started = time.monotonic()
+        try:
+            result = await getattr(model, method)(*args, **kwargs)
+        except ModelError:
+            self.manager.record_call(name, time.monotonic() - started, success=False)
+            raise
+        self.manager.record_call(name, time.monotonic() - started, success=True)
+        return result
+
+    async def generate_text(
+        self,
+        prompt: str,
+        max_tokens: int = 1000,
+        temperature: float = 0.7,
+        stop: Optional[List[str]] = None,
+        **kwargs: Any
+    ) -> ModelResponse:
+        decision = self.manager.select_model(self.candidates)
+        params = dict(
+            prompt=prompt,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            stop=stop,
+            **kwargs
+        )
+        try:
+            response = await self._call(decision.model_name, "generate_text", **params)
+        except self.manager.failover_errors as e:
+            fallback = self._fallback_for(decision.model_name)
+            if fallback is None:
+                raise
+            decision = RoutingDecision(
+                model_name=fallback,
+                reason=f"failover after {type(e).__name__} from {decision.model_name}",
+                fallback_from=decision.model_name
+            )
+            self.manager.routing_history.append(decision)
+            logger.warning(f"Model routing: {decision.reason}")
+            response = await self._call(fallback, "generate_text", **params)
+
+        response.metadata["routing"] = decision.to_dict()
+        return response
+
+    async def generate_text_stream(
+        self,
+        prompt: str,
+        max_tokens: int = 1000,
+        temperature: float = 0.7,
+        stop: Optional[List[str]] = None,
+        **kwargs: Any
+    ) -> AsyncIterator[str]:
+        decision = self.manager.select_model(self.candidates)
+        names = [decision.model_name]
+        fallback = self._fallback_for(decision.model_name)
+        if fallback:
+            names.append(fallback)
+
+        for index, name in enumerate(names):
+            stream = self.manager.get_model(name).generate_text_stream(
+                prompt=prompt,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                stop=stop,
+                **kwargs
+            )
+            started = time.monotonic()
+            emitted = False
+            try:
+                async for chunk in stream:
+                    emitted = True
+                    yield chunk
+            except self.manager.failover_errors as e:
+                self.manager.record_call(name, time.monotonic() - started, success=False)
+                # 已经输出过内容时无法无缝切换
+                if emitted or index == len(names) - 1:
+                    raise
+                self.manager.routing_history.append(RoutingDecision(
+                    model_name=names[index + 1],
+                    reason=f"failover after {type(e).__name__} from {name}",
+                    fallback_from=name
+                ))
+                continue
+            finally:
+                await stream.aclose()
+            self.manager.record_call(name, time.monotonic() - started, success=True)
+            return
+
+    async def generate_embedding(self, text: str) -> List[float]:
+        decision = self.manager.select_model(self.candidates)
+        return await self._call(decision.model_name, "generate_embedding", text)
+
+    async def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        decision = self.manager.select_model(self.candidates)
+        return await self._call(decision.model_name, "_embed_batch", texts)
+
+    def get_token_count(self, text: str) -> int:
+        return self._primary().get_token_count(text)
@@ -0,0 +1,391 @@
+"""
+离线批量推理
+不需要即时返回的请求（质量检查、连贯性分析等）写入JSONL批次文件，
+通过支持批量接口的适配器提交，完成后按custom_id取回结果。
+文件格式与OpenAI Batch API一致：每行一个chat completions请求，结果文件每行一个响应
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from abc import ABC, abstractmethod
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional
+
+from .base import BaseModelAdapter, ModelError, ModelResponse
+
+logger = logging.getLogger(__name__)
+
+# 批次状态，与OpenAI Batch API的取值一致
+IN_PROGRESS = "in_progress"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED_STATUSES = (COMPLETED, FAILED, CANCELLED)
+
+CHAT_COMPLETIONS_URL = "/v1/chat/completions"
+
+@dataclass
+class BatchRequest:
+    """
+    批次中的一条请求
+    custom_id用于把结果对应回请求方（如"task-42"），metadata随请求保存但不发给模型
+    """
+    custom_id: str
+    prompt: str
+    max_tokens: int = 1000
+    temperature: float = 0.7
+    stop: Optional[List[str]] = None
+    metadata: Dict[str, Any] = field(default_factory=dict)
+
+    def to_line(self, model_name: str) -> Dict[str, Any]:
+        body: Dict[str, Any] = {
+            "model": model_name,
+            "messages": [{"role": "user", "content": self.prompt}],
+            "max_tokens": self.max_tokens,
+            "temperature": self.temperature,
+        }
+        if self.stop:
+            body["stop"] = self.stop
+        line = {
+            "custom_id": self.custom_id,
+            "method": "POST",
+            "url": CHAT_COMPLETIONS_URL,
+            "body": body,
+        }
+        if self.metadata:
+            line["metadata"] = self.metadata
+        return line
+
+    @classmethod
+    def from_line(cls, line: Dict[str, Any]) -> "BatchRequest":
+        body = line["body"]
+        return cls(
+            custom_id=line["custom_id"],
+            prompt=body["messages"][-1]["content"],
+            max_tokens=body.get("max_tokens", 1000),
+            temperature=body.get("temperature", 0.7),
+            stop=body.get("stop"),
+            metadata=line.get("metadata", {}),
+        )
+
+@dataclass
+class BatchResult:
+    """
+    批次中一条请求的结果，失败时response为None
+    """
+    custom_id: str
+    response: Optional[ModelResponse] = None
+    error: Optional[str] = None
+
+    @property
+    def succeeded(self) -> bool:
+        return self.response is not None
+
+@dataclass
+class BatchJob:
+    """
+    批次任务状态
+    """
+    batch_id: str
+    input_path: str
+    status: str = IN_PROGRESS
+    output_path: Optional[str] = None
+    request_count: int = 0
+    completed_count: int = 0
+    failed_count: int = 0
+    created_at: float = field(default_factory=time.time)
+    completed_at: Optional[float] = None
+    error: Optional[str] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATUSES
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "BatchJob":
+        return cls(**data)
+
+def write_batch_file(requests: List[BatchRequest], path: str, model_name: str) -> int:
+    """
+    把请求写入JSONL批次文件，返回请求条数
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        for request in requests:
+            f.write(json.dumps(request.to_line(model_name), ensure_ascii=False) + "\n")
+    return len(requests)
+
+def read_batch_file(path: str) -> List[BatchRequest]:
+    """
+    读取JSONL批次文件
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        return [BatchRequest.from_line(json.loads(line)) for line in f if line.strip()]
+
+def read_batch_results(path: str) -> List[BatchResult]:
+    """
+    读取批次结果文件，每行按OpenAI Batch API的输出格式解析
+    """
+    results: List[BatchResult] = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            results.append(_parse_result(entry))
+    return results
+
+def _parse_result(entry: Dict[str, Any]) -> BatchResult:
+    custom_id = entry["custom_id"]
+    if entry.get("error"):
+        return BatchResult(custom_id, error=entry["error"].get("message", str(entry["error"])))
+
+    response = entry.get("response") or {}
+    body = response.get("body") or {}
+    if response.get("status_code", 200) >= 400 or not body.get("choices"):
+        message = (body.get("error") or {}).get("message", "empty batch response")
+        return BatchResult(custom_id, error=message)
+
+    choice = body["choices"][0]
+    return BatchResult(
+        custom_id,
+        response=ModelResponse(
+            content=choice["message"]["content"],
+            tokens_used=(body.get("usage") or {}).get("total_tokens", 0),
+            model_name=body.get("model", ""),
+            metadata={"finish_reason": choice.get("finish_reason"), "batch": True}
+        )
+    )
+
+class BatchModelAdapter(ABC):
+    """
+    支持离线批量推理的适配器接口
+    """
+
+    # 写入批次文件时使用的模型名称
+    model_name: str = ""
+
+    @abstractmethod
+    async def submit_batch(self, input_path: str) -> BatchJob:
+        """
+        提交JSONL批次文件，立即返回批次状态
+        """
+        pass
+
+    @abstractmethod
+    async def get_batch(self, batch_id: str) -> BatchJob:
+        """
+        查询批次状态
+        """
+        pass
+
+    @abstractmethod
+    async def get_results(self, job: BatchJob) -> List[BatchResult]:
+        """
+        获取已完成批次的结果
+        """
+        pass
+
+    async def wait(
+        self,
+        batch_id: str,
+        poll_interval: float = 30.0,
+        timeout: Optional[float] = None
+    ) -> BatchJob:
+        """
+        轮询直到批次结束，超时时抛出asyncio.TimeoutError
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            job = await self.get_batch(batch_id)
+            if job.finished:
+                return job
+            if deadline is not None and time.monotonic() >= deadline:
+                raise asyncio.TimeoutError(f"Batch {batch_id} did not finish in {timeout}s")
+            await asyncio.sleep(poll_interval)
+
+    async def aclose(self) -> None:
+        pass
+
+class LocalBatchAdapter(BatchModelAdapter):
+    """
+    本地批量推理
+    在后台用普通模型适配器以有限并发执行批次文件中的请求，结果按Batch API的格式写入输出文件。
+    作为没有批量接口的供应商和开发环境的替代实现；批次状态保存在work_dir中，
+    进程重启后查询到未完成的批次会重新执行
+    """
+
+    def __init__(
+        self,
+        model: BaseModelAdapter,
+        work_dir: str,
+        max_concurrency: int = 2
+    ):
+        self.model = model
+        self.work_dir = work_dir
+        self.max_concurrency = max_concurrency
+        self._jobs: Dict[str, BatchJob] = {}
+        self._runs: Dict[str, "asyncio.Task[None]"] = {}
+
+    @property
+    def model_name(self) -> str:
+        return self.model.model_name
+
+    def _job_path(self, batch_id: str) -> str:
+        return os.path.join(self.work_dir, f"{batch_id}.json")
+
+    def _save(self, job: BatchJob) -> None:
+        os.makedirs(self.work_dir, exist_ok=True)
+        with open(self._job_path(job.batch_id), "w", encoding="utf-8") as f:
+            json.dump(job.to_dict(), f, ensure_ascii=False)
+
+    async def submit_batch(self, input_path: str) -> BatchJob:
+        batch_id = f"batch_{uuid.uuid4().hex}"
+        job = BatchJob(
+            batch_id=batch_id,
+            input_path=input_path,
+            output_path=os.path.join(self.work_dir, f"{batch_id}_output.jsonl"),
+        )
+        self._start(job)
+        return job
+
+    def _start(self, job: BatchJob) -> None:
+        self._jobs[job.batch_id] = job
+        self._save(job)
+        self._runs[job.batch_id] = asyncio.ensure_future(self._run(job))
+
+    async def get_batch(self, batch_id: str) -> BatchJob:
+        job = self._jobs.get(batch_id)
+        if job is None:
+            path = self._job_path(batch_id)
+            if not os.path.exists(path):
+                raise ValueError(f"Batch {batch_id} not found")
+            with open(path, "r", encoding="utf-8") as f:
+                job = BatchJob.from_dict(json.load(f))
+            if not job.finished:
+                # 执行批次的进程已经退出，重新执行
+                logger.info(f"Restarting interrupted batch {batch_id}")
+                self._start(job)
+        return job
+
+    async def get_results(self, job: BatchJob) -> List[BatchResult]:
+        if job.status != COMPLETED or not job.output_path:
+            raise ValueError(f"Batch {job.batch_id} is not completed")
+        return read_batch_results(job.output_path)
+
+    async def _run(self, job: BatchJob) -> None:
+        try:
+            requests = read_batch_file(job.input_path)
+            job.request_count = len(requests)
+            semaphore = asyncio.Semaphore(self.max_concurrency)
+
+            async def run_one(request: BatchRequest) -> Dict[str, Any]:
+                async with semaphore:
+                    return await self._execute(request)
+
+            entries = await asyncio.gather(*[run_one(r) for r in requests])
+            with open(job.output_path, "w", encoding="utf-8") as f:
+                for entry in entries:
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+            job.failed_count = sum(1 for entry in entries if entry["error"])
+            job.completed_count = len(entries) - job.failed_count
+            job.status = COMPLETED
+        except asyncio.CancelledError:
+            # 进程退出时被取消，保持in_progress以便重启后重新执行
+            raise
+        except Exception as e:
+            logger.error(f"Batch {job.batch_id} failed: {e}")
+            job.status = FAILED
+            job.error = str(e)
+        finally:
+            self._runs.pop(job.batch_id, None)
+
+        job.completed_at = time.time()
+        self._save(job)
+
+    async def _execute(self, request: BatchRequest) -> Dict[str, Any]:
+        entry: Dict[str, Any] = {
+            "id": f"batch_req_{uuid.uuid4().hex}",
+            "custom_id": request.custom_id,
+            "response": None,
+            "error": None,
+        }
+        try:
+            response = await self.model.generate_text(
+                prompt=request.prompt,
+                max_tokens=request.max_tokens,
+                temperature=request.temperature,
+                stop=request.stop,
+                task_type=request.metadata.get("task_type"),
+                # 批量请求不在乎延迟，不需要对冲
+                hedge=False
+            )
+        except ModelError as e:
+            entry["error"] = {"code": e.error_code or e.error_type, "message": str(e)}
+            return entry
+
+        entry["response"] = {
+            "status_code": 200,
+            "body": {
+                "model": response.model_name,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": response.content},
+                    "finish_reason": response.metadata.get("finish_reason", "stop"),
+                }],
+                "usage": {"total_tokens": response.tokens_used},
+            },
+        }
+        return entry
+
+    async def aclose(self) -> None:
+        for run in list(self._runs.values()):
+            run.cancel()
+        self._runs.clear()
+
+# 模型键 -> 批量推理适配器，None为默认模型；首次使用时按配置创建
+_batch_adapters: Dict[Optional[str], BatchModelAdapter] = {}
+
+def init_batch_adapter(
+    adapter: BatchModelAdapter,
+    model_key: Optional[str] = None
+) -> BatchModelAdapter:
+    """
+    设置模型的批量推理适配器，model_key为None时设置默认模型的适配器
+    """
+    _batch_adapters[model_key] = adapter
+    return adapter
+
+def get_batch_adapter(model_key: Optional[str] = None) -> BatchModelAdapter:
+    """
+    获取模型的批量推理适配器，未设置时使用该模型的本地批量实现
+    model_key为model_manager中注册的模型（如Agent配置的模型），None时使用默认模型
+    """
+    adapter = _batch_adapters.get(model_key)
+    if adapter is None:
+        from app.core.config import settings
+        from . import model_manager
+        router = model_manager.get_router([model_key] if model_key else None)
+        adapter = LocalBatchAdapter(
+            router,
+            settings.BATCH_WORK_DIR,
+            max_concurrency=settings.BATCH_MAX_CONCURRENCY
+        )
+        _batch_adapters[model_key] = adapter
+    return adapter
+
+async def close_batch_adapters() -> None:
+    """
+    关闭所有批量推理适配器
+    """
+    for adapter in list(_batch_adapters.values()):
+        await adapter.aclose()
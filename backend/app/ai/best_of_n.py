@@ -0,0 +1,244 @@
+"""
+Best-of-N并行采样
+用不同的温度（和seed）并发生成N个候选，按完成顺序用本地评分函数打分，取得分最高的结果；
+设置了阈值时第一个达到阈值的候选直接胜出并取消其余请求。
+用并行吞吐换取质量，不需要串行的"生成-检查-重新生成"循环
+"""
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+from .base import BaseModelAdapter, ModelError, ModelResponse
+from .cascade import local_quality_score
+
+logger = logging.getLogger(__name__)
+
+# 评分函数：返回0-1之间的分数，越高越好
+Scorer = Callable[[ModelResponse], float]
+
+def length_scorer(target: int, tolerance: float = 0.5) -> Scorer:
+    """
+    长度评分：字数等于target时为1，偏离target的比例达到tolerance时降为0
+    """
+    def score(response: ModelResponse) -> float:
+        deviation = abs(len(response.content.strip()) - target) / max(target, 1)
+        return max(0.0, 1.0 - deviation / tolerance)
+    return score
+
+def repetition_scorer(n: int = 3) -> Scorer:
+    """
+    重复惩罚：字符n-gram中不重复的比例，没有重复时为1
+    """
+    def score(response: ModelResponse) -> float:
+        text = "".join(response.content.split())
+        grams = [text[i:i + n] for i in range(len(text) - n + 1)]
+        if not grams:
+            return 1.0 if text else 0.0
+        return len(set(grams)) / len(grams)
+    return score
+
+def keyword_scorer(keywords: Sequence[str]) -> Scorer:
+    """
+    关键词覆盖率：结果中出现的关键词比例，如场景中的人物名和地点
+    """
+    def score(response: ModelResponse) -> float:
+        if not keywords:
+            return 1.0
+        return sum(1 for keyword in keywords if keyword in response.content) / len(keywords)
+    return score
+
+def quality_scorer() -> Scorer:
+    """
+    本地质量评分（拒答、截断、重复行扣分），与级联的验收检查相同
+    """
+    return local_quality_score
+
+def combine_scorers(*scorers: Union[Scorer, Tuple[Scorer, float]]) -> Scorer:
+    """
+    按权重平均多个评分函数，参数为评分函数或(评分函数, 权重)
+    """
+    weighted = [item if isinstance(item, tuple) else (item, 1.0) for item in scorers]
+    total = sum(weight for _, weight in weighted) or 1.0
+
+    def score(response: ModelResponse) -> float:
+        return sum(scorer(response) * weight for scorer, weight in weighted) / total
+    return score
+
+# 配置中的评分类型 -> 评分函数工厂，如{"type": "length", "target": 2000, "weight": 2}
+SCORER_TYPES: Dict[str, Callable[..., Scorer]] = {
+    "length": length_scorer,
+    "repetition": repetition_scorer,
+    "keywords": keyword_scorer,
+    "quality": quality_scorer,
+}
+
+def build_scorer(specs: List[Dict[str, Any]]) -> Scorer:
+    """
+    按配置创建加权组合的评分函数
+    """
+    scorers = []
+    for spec in specs:
+        options = dict(spec)
+        scorer_type = options.pop("type")
+        weight = options.pop("weight", 1.0)
+        if scorer_type not in SCORER_TYPES:
+            raise ValueError(f"不支持的评分方式: {scorer_type}")
+        scorers.append((SCORER_TYPES[scorer_type](**options), weight))
+    return combine_scorers(*scorers)
+
+# 未指定评分函数时使用本地质量评分和重复惩罚
+default_scorer = combine_scorers(quality_scorer(), repetition_scorer())
+
+def sample_temperatures(n: int, temperature: float = 0.7, spread: float = 0.3) -> List[float]:
+    """
+    在temperature±spread范围内均匀取N个温度（限制在0-2之间）
+    """
+    if n <= 1:
+        return [temperature]
+    low = temperature - spread
+    step = 2 * spread / (n - 1)
+    return [round(min(2.0, max(0.0, low + step * i)), 3) for i in range(n)]
+
+@dataclass
+class Sample:
+    """
+    一个候选结果
+    """
+    index: int
+    temperature: float
+    response: ModelResponse
+    score: float = 0.0
+
+@dataclass
+class BestOfNResult:
+    """
+    Best-of-N的结果
+    samples按完成顺序排列，只包含成功且已打分的候选；提前结束时未完成的候选已被取消
+    """
+    best: Sample
+    samples: List[Sample] = field(default_factory=list)
+    early_stopped: bool = False
+    failed: int = 0
+    tokens_used: int = 0
+
+    @property
+    def response(self) -> ModelResponse:
+        return self.best.response
+
+async def iter_samples(
+    model: BaseModelAdapter,
+    prompt: str,
+    temperatures: List[float],
+    seed: Optional[int] = None,
+    errors: Optional[List[ModelError]] = None,
+    **kwargs: Any
+) -> AsyncIterator[Sample]:
+    """
+    按每个温度并发生成一个候选，按完成顺序逐个返回
+    失败的候选跳过并记入errors；调用方提前结束迭代时取消仍在进行的请求
+    """
+    # 每个候选都必须真正调用模型，不能命中缓存或与其他候选合并；N个候选本身已经并发，不再对冲
+    call_kwargs = {"use_cache": False, "coalesce": False, "hedge": False, **kwargs}
+
+    async def run(index: int, temperature: float) -> Sample:
+        options = dict(call_kwargs)
+        if seed is not None:
+            options["seed"] = seed + index
+        response = await model.generate_text(prompt, temperature=temperature, **options)
+        return Sample(index, temperature, response)
+
+    pending = {
+        asyncio.ensure_future(run(index, temperature))
+        for index, temperature in enumerate(temperatures)
+    }
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                error = task.exception()
+                if error is None:
+                    yield task.result()
+                elif isinstance(error, ModelError):
+                    logger.warning(f"Best-of-N sample failed: {error}")
+                    if errors is not None:
+                        errors.append(error)
+                else:
+                    raise error
+    finally:
+        for task in pending:
+            task.cancel()
+
+async def best_of_n(
+    model: BaseModelAdapter,
+    prompt: str,
+    n: int = 4,
+    scorer: Optional[Scorer] = None,
+    threshold: Optional[float] = None,
+    temperature: float = 0.7,
+    spread: float = 0.3,
+    seed: Optional[int] = None,
+    **kwargs: Any
+) -> BestOfNResult:
+    """
+    并发生成N个候选并返回得分最高的一个
+    threshold不为None时第一个得分达到阈值的候选直接胜出。n小于1时抛出ValueError；
+    全部候选失败时抛出最后一个错误，没有任何候选也没有错误时抛出ModelError。
+    胜出结果的tokens_used为所有已完成候选的总消耗，metadata["best_of_n"]记录评分情况
+    """
+    if n < 1:
+        raise ValueError(f"n必须大于等于1: {n}")
+    scorer = scorer or default_scorer
+    errors: List[ModelError] = []
+    samples: List[Sample] = []
+    best: Optional[Sample] = None
+    early_stopped = False
+
+    stream = iter_samples(
+        model,
+        prompt,
+        sample_temperatures(n, temperature, spread),
+        seed=seed,
+        errors=errors,
+        **kwargs
+    )
+    try:
+        async for sample in stream:
+            sample.score = scorer(sample.response)
+            samples.append(sample)
+            if best is None or sample.score > best.score:
+                best = sample
+            if threshold is not None and sample.score >= threshold:
+                early_stopped = len(samples) < n - len(errors)
+                break
+    finally:
+        await stream.aclose()
+
+    if best is None:
+        if errors:
+            raise errors[-1]
+        raise ModelError(
+            message="Best-of-N produced no samples",
+            model_name=model.model_name,
+            error_code="no_samples",
+            error_type="best_of_n"
+        )
+
+    result = BestOfNResult(
+        best=best,
+        samples=samples,
+        early_stopped=early_stopped,
+        failed=len(errors),
+        tokens_used=sum(sample.response.tokens_used for sample in samples)
+    )
+    response = best.response
+    response.metadata["best_of_n"] = {
+        "n": n,
+        "completed": len(samples),
+        "failed": len(errors),
+        "score": best.score,
+        "temperature": best.temperature,
+        "early_stopped": early_stopped,
+    }
+    response.tokens_used = result.tokens_used
+    return result
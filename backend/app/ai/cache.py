@@ -0,0 +1,306 @@
+"""
+模型响应缓存
+对低温度（确定性）的generate_text调用按模型、提示和采样参数缓存结果，
+支持进程内LRU+TTL缓存和可选的Redis共享缓存两级存储
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from .base import (
+    BaseModelAdapter,
+    ModelAdapterWrapper,
+    ModelResponse,
+    request_key_params,
+)
+
+logger = logging.getLogger(__name__)
+
+def make_cache_key(
+    model_name: str,
+    prompt: str,
+    params: Dict[str, Any]
+) -> str:
+    """
+    根据模型、提示和采样参数生成缓存键
+    """
+    payload = json.dumps(
+        {"model": model_name, "prompt": prompt, "params": params},
+        sort_keys=True,
+        ensure_ascii=False,
+        default=str
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class CacheBackend(ABC):
+    """
+    缓存存储后端抽象基类
+    """
+
+    name: str = "backend"
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        读取缓存，不存在或已过期时返回None
+        """
+        ...
+
+    @abstractmethod
+    async def set(self, key: str, value: Dict[str, Any]) -> None:
+        """
+        写入缓存
+        """
+        ...
+
+    @abstractmethod
+    async def clear(self) -> None:
+        """
+        清空缓存
+        """
+        ...
+
+class MemoryCacheBackend(CacheBackend):
+    """
+    进程内LRU+TTL缓存
+    """
+
+    name = "memory"
+
+    def __init__(self, max_size: int = 1024, ttl: float = 3600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._items: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        item = self._items.get(key)
+        if item is None:
+            return None
+
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            del self._items[key]
+            return None
+
+        self._items.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: Dict[str, Any]) -> None:
+        self._items[key] = (time.monotonic() + self.ttl, value)
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    async def clear(self) -> None:
+        self._items.clear()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+class RedisCacheBackend(CacheBackend):
+    """
+    基于Redis的共享缓存
+    复用应用的Redis连接（app.state.redis），同时兼容同步和异步客户端
+    """
+
+    name = "redis"
+
+    def __init__(
+        self,
+        redis: Any,
+        ttl: int = 24 * 3600,
+        prefix: str = "verseforge:model_cache:"
+    ):
+        self.redis = redis
+        self.ttl = ttl
+        self.prefix = prefix
+
+    async def _call(self, method: str, *args: Any, **kwargs: Any) -> Any:
+        func = getattr(self.redis, method)
+        if asyncio.iscoroutinefunction(func):
+            return await func(*args, **kwargs)
+        # 同步客户端放到线程池中执行，避免阻塞事件循环
+        return await asyncio.to_thread(func, *args, **kwargs)
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        raw = await self._call("get", self.prefix + key)
+        if raw is None:
+            return None
+        return json.loads(raw)
+
+    async def set(self, key: str, value: Dict[str, Any]) -> None:
+        await self._call(
+            "set",
+            self.prefix + key,
+            json.dumps(value, ensure_ascii=False),
+            ex=self.ttl
+        )
+
+    async def clear(self) -> None:
+        keys = await self._call("keys", self.prefix + "*")
+        if keys:
+            await self._call("delete", *keys)
+
+class ResponseCache:
+    """
+    多级响应缓存
+    按顺序查询各级存储，命中下级时回填上级
+    """
+
+    def __init__(
+        self,
+        backends: Optional[List[CacheBackend]] = None,
+        max_temperature: float = 0.3
+    ):
+        self.backends: List[CacheBackend] = backends or [MemoryCacheBackend()]
+        # 只缓存温度不高于该值的调用，高温度采样的结果本身不可复现
+        self.max_temperature = max_temperature
+        self.hits: Dict[str, int] = {}
+        self.misses = 0
+        self.errors = 0
+
+    def attach_redis(self, redis: Any, **kwargs: Any) -> None:
+        """
+        添加Redis共享缓存层
+        """
+        if any(isinstance(b, RedisCacheBackend) for b in self.backends):
+            return
+        self.backends.append(RedisCacheBackend(redis, **kwargs))
+
+    def is_cacheable(self, temperature: float) -> bool:
+        """
+        判断调用是否可以缓存
+        """
+        return temperature <= self.max_temperature
+
+    async def get(self, key: str) -> Optional[ModelResponse]:
+        """
+        查询缓存
+        """
+        for level, backend in enumerate(self.backends):
+            try:
+                value = await backend.get(key)
+            except Exception as e:
+                self.errors += 1
+                logger.warning(f"Response cache {backend.name} get failed: {e}")
+                continue
+
+            if value is None:
+                continue
+
+            self.hits[backend.name] = self.hits.get(backend.name, 0) + 1
+            for upper in self.backends[:level]:
+                await self._safe_set(upper, key, value)
+            return ModelResponse.from_dict(value)
+
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, response: ModelResponse) -> None:
+        """
+        写入所有缓存层
+        """
+        value = response.to_dict()
+        for backend in self.backends:
+            await self._safe_set(backend, key, value)
+
+    async def _safe_set(
+        self,
+        backend: CacheBackend,
+        key: str,
+        value: Dict[str, Any]
+    ) -> None:
+        try:
+            await backend.set(key, value)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Response cache {backend.name} set failed: {e}")
+
+    async def clear(self) -> None:
+        """
+        清空所有缓存层
+        """
+        for backend in self.backends:
+            await backend.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取命中统计
+        """
+        total_hits = sum(self.hits.values())
+        total = total_hits + self.misses
+        return {
+            "hits": total_hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "hits_by_backend": dict(self.hits),
+            "hit_rate": total_hits / total if total else 0.0,
+        }
+
+    def reset_stats(self) -> None:
+        """
+        重置命中统计
+        """
+        self.hits = {}
+        self.misses = 0
+        self.errors = 0
+
+class CachedModelAdapter(ModelAdapterWrapper):
+    """
+    带响应缓存的模型适配器
+    调用时传入use_cache=False可以跳过缓存
+    """
+
+    def __init__(self, model: BaseModelAdapter, cache: ResponseCache):
+        super().__init__(model)
+        self.cache = cache
+
+    async def generate_text(
+        self,
+        prompt: str,
+        max_tokens: int = 1000,
+        temperature: float = 0.7,
+        stop: Optional[List[str]] = None,
+        **kwargs: Any
+    ) -> ModelResponse:
+        # use_cache继续向内传递，内层的语义缓存同样需要跳过
+        use_cache = kwargs.get("use_cache", True)
+        if not use_cache or not self.cache.is_cacheable(temperature):
+            return await self.model.generate_text(
+                prompt=prompt,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                stop=stop,
+                **kwargs
+            )
+
+        key = make_cache_key(
+            self.model_name,
+            prompt,
+            request_key_params(max_tokens, temperature, stop, kwargs)
+        )
+        cached = await self.cache.get(key)
+        if cached is not None:
+            # 命中缓存不消耗token
+            cached.metadata["cached"] = True
+            cached.metadata["cached_tokens"] = cached.tokens_used
+            cached.tokens_used = 0
+            return cached
+
+        response = await self.model.generate_text(
+            prompt=prompt,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            stop=stop,
+            **kwargs
+        )
+        await self.cache.set(key, response)
+        return response
+
+# 全局响应缓存实例，Redis层在应用启动时挂载
+response_cache = ResponseCache()
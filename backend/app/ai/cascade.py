@@ -0,0 +1,256 @@
+"""
+模型级联
+先用便宜、快速的草稿模型完成调用，只有结果未通过验收检查（JSON结构、本地质量评分、
+置信度字段）时才升级到更强的模型。按任务类型统计接受和升级的次数，便于调整阈值
+"""
+import logging
+import re
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .base import (
+    BaseModelAdapter,
+    ModelAdapterWrapper,
+    ModelError,
+    ModelResponse,
+    get_task_type,
+)
+from .json_stream import extract_json
+
+logger = logging.getLogger(__name__)
+
+# 默认的草稿模型，对应setup_default_models注册的gpt35
+DEFAULT_DRAFT_MODEL = "gpt35"
+
+# 验收检查：返回(是否通过, 未通过的原因)
+AcceptanceCheck = Callable[[ModelResponse], Tuple[bool, str]]
+
+# 拒答、敷衍等低质量输出的常见开头
+_REFUSAL_PATTERN = re.compile(r"^\s*(抱歉|对不起|很抱歉|作为一个?(AI|人工智能)|I'm sorry|I cannot|As an AI)", re.I)
+
+def json_check(
+    kind: str = "object",
+    required: Optional[List[str]] = None,
+    min_items: int = 0
+) -> AcceptanceCheck:
+    """
+    JSON结构检查：能解析出指定类型（object或array）的JSON，
+    对象包含required中的全部字段，数组至少有min_items个元素
+    """
+    expected = dict if kind == "object" else list
+
+    def check(response: ModelResponse) -> Tuple[bool, str]:
+        try:
+            value = extract_json(response.content)
+        except ValueError:
+            return False, "invalid_json"
+        if not isinstance(value, expected):
+            return False, "wrong_json_type"
+        if expected is dict:
+            missing = [name for name in required or [] if name not in value]
+            if missing:
+                return False, "missing_fields"
+        elif len(value) < min_items:
+            return False, "too_few_items"
+        return True, ""
+    return check
+
+def local_quality_score(response: ModelResponse) -> float:
+    """
+    不调用模型的质量评分（0-1）
+    空输出、拒答、因长度截断和大量重复的行都会扣分
+    """
+    text = response.content.strip()
+    if not text:
+        return 0.0
+
+    score = 1.0
+    if _REFUSAL_PATTERN.match(text):
+        score -= 0.6
+    if response.metadata.get("finish_reason") == "length":
+        score -= 0.3
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    if len(lines) > 3:
+        repeated = 1 - len(set(lines)) / len(lines)
+        score -= repeated
+    return max(0.0, score)
+
+def quality_check(threshold: float = 0.6) -> AcceptanceCheck:
+    """
+    本地质量评分检查
+    """
+    def check(response: ModelResponse) -> Tuple[bool, str]:
+        if local_quality_score(response) < threshold:
+            return False, "low_quality"
+        return True, ""
+    return check
+
+def confidence_check(field_name: str = "confidence", threshold: float = 0.7) -> AcceptanceCheck:
+    """
+    置信度检查：JSON结果中的置信度字段不低于threshold，没有该字段时不通过
+    """
+    def check(response: ModelResponse) -> Tuple[bool, str]:
+        try:
+            value = extract_json(response.content)
+        except ValueError:
+            return False, "invalid_json"
+        confidence = value.get(field_name) if isinstance(value, dict) else None
+        if not isinstance(confidence, (int, float)) or confidence < threshold:
+            return False, "low_confidence"
+        return True, ""
+    return check
+
+# 配置中的检查类型 -> 检查工厂，如{"type": "json", "required": ["title"]}
+CHECK_TYPES: Dict[str, Callable[..., AcceptanceCheck]] = {
+    "json": json_check,
+    "quality": quality_check,
+    "confidence": confidence_check,
+}
+
+def build_check(spec: Dict[str, Any]) -> AcceptanceCheck:
+    """
+    按配置创建验收检查
+    """
+    options = dict(spec)
+    check_type = options.pop("type")
+    if check_type not in CHECK_TYPES:
+        raise ValueError(f"不支持的验收检查: {check_type}")
+    return CHECK_TYPES[check_type](**options)
+
+@dataclass
+class CascadePolicy:
+    """
+    任务类型的级联策略
+    草稿结果需要通过全部检查才会被接受
+    """
+    checks: List[AcceptanceCheck] = field(default_factory=lambda: [quality_check()])
+    enabled: bool = True
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "CascadePolicy":
+        checks = [build_check(spec) for spec in config.get("checks", [{"type": "quality"}])]
+        return cls(checks=checks, enabled=config.get("enabled", True))
+
+    def accept(self, response: ModelResponse) -> Tuple[bool, str]:
+        for check in self.checks:
+            passed, reason = check(response)
+            if not passed:
+                return False, reason
+        return True, ""
+
+# 默认使用级联的任务类型：大纲和关键词提取通常不需要最强的模型
+DEFAULT_CASCADE_POLICIES: Dict[str, CascadePolicy] = {
+    "generate_outline": CascadePolicy(checks=[json_check("object"), quality_check()]),
+    "extract_keywords": CascadePolicy(checks=[json_check("array", min_items=1)]),
+}
+
+class CascadeStats:
+    """
+    按任务类型统计级联结果
+    """
+
+    def __init__(self):
+        self._stats: Dict[str, Dict[str, Any]] = {}
+
+    def record(self, task_type: str, accepted: bool, reason: str = "") -> None:
+        stats = self._stats.setdefault(
+            task_type, {"drafts": 0, "accepted": 0, "escalated": 0, "reasons": {}}
+        )
+        stats["drafts"] += 1
+        if accepted:
+            stats["accepted"] += 1
+        else:
+            stats["escalated"] += 1
+            stats["reasons"][reason] = stats["reasons"].get(reason, 0) + 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            task_type: {
+                **stats,
+                "reasons": dict(stats["reasons"]),
+                "acceptance_rate": stats["accepted"] / stats["drafts"] if stats["drafts"] else 0.0,
+            }
+            for task_type, stats in self._stats.items()
+        }
+
+    def reset(self) -> None:
+        self._stats.clear()
+
+class CascadeModelAdapter(ModelAdapterWrapper):
+    """
+    级联模型适配器
+    policies中配置了的任务类型先调用draft_model，草稿未通过验收检查或调用失败时升级到被包装的模型；
+    其他调用直接使用被包装的模型。升级时tokens_used包含草稿消耗的token
+    """
+
+    def __init__(
+        self,
+        model: BaseModelAdapter,
+        draft_model: BaseModelAdapter,
+        policies: Optional[Dict[str, CascadePolicy]] = None,
+        stats: Optional[CascadeStats] = None
+    ):
+        super().__init__(model)
+        self.draft_model = draft_model
+        self.policies = DEFAULT_CASCADE_POLICIES if policies is None else policies
+        self.stats = stats or cascade_stats
+
+    async def generate_text(
+        self,
+        prompt: str,
+        max_tokens: int = 1000,
+        temperature: float = 0.7,
+        stop: Optional[List[str]] = None,
+        **kwargs: Any
+    ) -> ModelResponse:
+        task_type = get_task_type(kwargs)
+        policy = self.policies.get(task_type)
+        call_kwargs = dict(
+            prompt=prompt,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            stop=stop,
+            **kwargs
+        )
+        if policy is None or not policy.enabled:
+            return await self.model.generate_text(**call_kwargs)
+
+        draft_tokens = 0
+        try:
+            draft = await self.draft_model.generate_text(**call_kwargs)
+            draft_tokens = draft.tokens_used
+            accepted, reason = policy.accept(draft)
+        except ModelError as e:
+            draft, accepted, reason = None, False, f"draft_error:{e.error_type}"
+
+        self.stats.record(task_type, accepted, reason)
+        if accepted:
+            draft.metadata["cascade"] = {"tier": "draft", "model": draft.model_name}
+            return draft
+
+        logger.info(f"Escalating {task_type} from draft model: {reason}")
+        response = await self.model.generate_text(**call_kwargs)
+        response.tokens_used += draft_tokens
+        response.metadata["cascade"] = {
+            "tier": "escalated",
+            "reason": reason,
+            "draft_tokens": draft_tokens,
+        }
+        return response
+
+def build_cascade_policies(
+    overrides: Optional[Dict[str, Optional[Dict[str, Any]]]] = None
+) -> Dict[str, CascadePolicy]:
+    """
+    在默认策略上应用按任务类型的配置（如ModelConfig.extra_params.cascade.tasks），值为None时关闭
+    """
+    policies = dict(DEFAULT_CASCADE_POLICIES)
+    for task_type, config in (overrides or {}).items():
+        if config is None:
+            policies.pop(task_type, None)
+        else:
+            policies[task_type] = CascadePolicy.from_config(config)
+    return policies
+
+# 全局级联统计
+cascade_stats = CascadeStats()
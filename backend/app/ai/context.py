@@ -0,0 +1,174 @@
+"""
+按token预算组装提示上下文
+大纲、人物设定、前文、场景等上下文片段按优先级和最小长度分配预算，
+放不下的片段截断或摘要，使提示第一次就尽量贴近预算而不超出模型窗口
+"""
+import logging
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from .utils import count_tokens, truncate_to_tokens
+
+logger = logging.getLogger(__name__)
+
+# 摘要函数：(文本, 目标token数) -> 摘要
+Summarizer = Callable[[str, int], Awaitable[str]]
+
+@dataclass
+class ContextSection:
+    """
+    上下文片段
+    priority越大越先分配预算；min_tokens为保留该片段所需的最少token数，
+    连最少长度都放不下时整段丢弃（min_tokens为0表示可以整段丢弃）；
+    keep决定截断时保留开头（head）还是结尾（tail）；summarize为True时用摘要代替截断
+    """
+    name: str
+    text: str
+    priority: int = 0
+    min_tokens: int = 0
+    max_tokens: Optional[int] = None
+    keep: str = "head"
+    summarize: bool = False
+    _token_counts: Dict[str, int] = field(default_factory=dict, repr=False, compare=False)
+
+    def token_count(self, model: str = "gpt-4") -> int:
+        """
+        片段的token数，每个模型只计算一次
+        """
+        count = self._token_counts.get(model)
+        if count is None:
+            count = count_tokens(self.text, model)
+            self._token_counts[model] = count
+        return count
+
+@dataclass
+class BuiltContext:
+    """
+    组装结果
+    sections按添加顺序保存各片段最终的文本，可以直接作为模板变量渲染
+    """
+    sections: Dict[str, str]
+    tokens: int
+    budget: int
+    truncated: List[str] = field(default_factory=list)
+    summarized: List[str] = field(default_factory=list)
+    dropped: List[str] = field(default_factory=list)
+
+    def render(self, separator: str = "\n\n") -> str:
+        """
+        按添加顺序拼接非空片段
+        """
+        return separator.join(text for text in self.sections.values() if text)
+
+class ContextBuilder:
+    """
+    上下文组装器
+    先按优先级为每个片段分配最小长度，再按优先级贪心分配剩余预算，
+    分配不足的片段按keep截断，标记了summarize且提供了摘要函数的片段改为摘要
+    """
+
+    def __init__(
+        self,
+        budget: int,
+        model: str = "gpt-4",
+        summarizer: Optional[Summarizer] = None
+    ):
+        self.budget = budget
+        self.model = model
+        self.summarizer = summarizer
+        self.sections: List[ContextSection] = []
+
+    def add(
+        self,
+        name: str,
+        text: str,
+        priority: int = 0,
+        min_tokens: int = 0,
+        **kwargs
+    ) -> "ContextBuilder":
+        """
+        添加片段，返回自身以便链式调用
+        """
+        self.sections.append(
+            ContextSection(name, text or "", priority, min_tokens, **kwargs)
+        )
+        return self
+
+    def add_section(self, section: ContextSection) -> "ContextBuilder":
+        self.sections.append(section)
+        return self
+
+    def allocate(self) -> Dict[str, int]:
+        """
+        计算每个片段分到的token数，未分到预算的片段为0
+        """
+        ordered = sorted(self.sections, key=lambda s: -s.priority)
+        wanted = {
+            s.name: min(s.token_count(self.model), s.max_tokens or s.token_count(self.model))
+            for s in ordered
+        }
+        allocation = {s.name: 0 for s in ordered}
+        remaining = self.budget
+
+        # 第一轮：按优先级保证最小长度
+        for section in ordered:
+            minimum = min(section.min_tokens, wanted[section.name])
+            if minimum <= remaining:
+                allocation[section.name] = minimum
+                remaining -= minimum
+
+        # 第二轮：按优先级把剩余预算分给保留下来的片段
+        for section in ordered:
+            if remaining <= 0:
+                break
+            if allocation[section.name] == 0 and section.min_tokens > 0:
+                # 连最小长度都放不下的片段不再分配
+                continue
+            extra = min(wanted[section.name] - allocation[section.name], remaining)
+            allocation[section.name] += extra
+            remaining -= extra
+
+        return allocation
+
+    async def build(self) -> BuiltContext:
+        """
+        按分配结果组装上下文
+        """
+        allocation = self.allocate()
+        result = BuiltContext(sections={}, tokens=0, budget=self.budget)
+
+        for section in self.sections:
+            allowed = allocation[section.name]
+            size = section.token_count(self.model)
+            if allowed <= 0:
+                result.sections[section.name] = ""
+                if size:
+                    result.dropped.append(section.name)
+                continue
+
+            text = section.text
+            if size > allowed:
+                text = await self._shrink(section, allowed, result)
+                size = count_tokens(text, self.model)
+            result.sections[section.name] = text
+            result.tokens += size
+
+        return result
+
+    async def _shrink(
+        self,
+        section: ContextSection,
+        allowed: int,
+        result: BuiltContext
+    ) -> str:
+        if section.summarize and self.summarizer is not None:
+            try:
+                summary = await self.summarizer(section.text, allowed)
+                result.summarized.append(section.name)
+                # 摘要可能超出目标长度，再截断一次保证不超预算
+                return truncate_to_tokens(summary, allowed, self.model, keep="head")
+            except Exception as e:
+                logger.warning(f"Summarizing context section {section.name} failed: {e}")
+
+        result.truncated.append(section.name)
+        return truncate_to_tokens(section.text, allowed, self.model, keep=section.keep)
@@ -0,0 +1,198 @@
+"""
+模拟模型适配器
+不调用任何外部服务，按可配置的延迟和吞吐分布返回确定性的输出，
+用于压力测试AgentManager和事件管道，以及离线性能基准测试
+"""
+import asyncio
+import hashlib
+import math
+import random
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from .base import (
+    BaseModelAdapter,
+    ModelResponse,
+    ModelRateLimitError,
+    ModelTimeoutError,
+    set_stream_result,
+)
+from .tokenizer import estimate_tokens
+
+# 生成文本使用的词表，每个词约一个token
+_VOCABULARY = (
+    "夜色 城门 少年 长剑 风雪 山谷 灯火 旧事 誓言 远方 "
+    "师父 江湖 客栈 马蹄 月光 秘密 书信 宫殿 商队 雨声 "
+    "他 她 我们 缓缓 忽然 终于 却 仍然 轻声 转身 "
+    "走进 望向 想起 拔出 说道 沉默 笑了 离开 等待 回答"
+).split()
+
+class FakeModelAdapter(BaseModelAdapter):
+    """
+    模拟模型适配器
+    相同的seed和提示总是得到相同的输出；延迟由首token延迟（对数正态分布）
+    和按tokens_per_second计算的生成时间组成，time_scale为0时不等待
+    """
+
+    def __init__(
+        self,
+        model_name: str = "fake",
+        seed: int = 0,
+        output_tokens: int = 200,
+        output_tokens_sigma: float = 0.3,
+        first_token_latency: float = 0.3,
+        first_token_latency_sigma: float = 0.5,
+        tokens_per_second: float = 50.0,
+        rate_limit_error_rate: float = 0.0,
+        timeout_error_rate: float = 0.0,
+        embedding_dim: int = 1536,
+        time_scale: float = 1.0
+    ):
+        self.model_name = model_name
+        self.seed = seed
+        # 输出长度：以output_tokens为中位数的对数正态分布，不超过max_tokens
+        self.output_tokens = output_tokens
+        self.output_tokens_sigma = output_tokens_sigma
+        self.first_token_latency = first_token_latency
+        self.first_token_latency_sigma = first_token_latency_sigma
+        self.tokens_per_second = tokens_per_second
+        self.rate_limit_error_rate = rate_limit_error_rate
+        self.timeout_error_rate = timeout_error_rate
+        self.embedding_dim = embedding_dim
+        self.time_scale = time_scale
+        # 错误注入按调用序号决定，同一seed下的错误序列可复现
+        self._error_rng = random.Random(seed)
+        self.calls = 0
+
+    def _rng(self, *parts: Any) -> random.Random:
+        digest = hashlib.sha256(
+            "\x00".join(str(p) for p in (self.seed, self.model_name) + parts).encode("utf-8")
+        ).digest()
+        return random.Random(int.from_bytes(digest[:8], "big"))
+
+    def _plan(self, prompt: str, max_tokens: int, temperature: float) -> Dict[str, Any]:
+        """
+        决定本次调用的输出内容和延迟
+        """
+        rng = self._rng(prompt, max_tokens, temperature)
+        length = int(self.output_tokens * math.exp(rng.gauss(0, self.output_tokens_sigma)))
+        length = max(1, min(max_tokens, length))
+        tokens = [rng.choice(_VOCABULARY) for _ in range(length)]
+        first_token = self.first_token_latency * math.exp(
+            rng.gauss(0, self.first_token_latency_sigma)
+        )
+        return {
+            "tokens": tokens,
+            "first_token_latency": first_token,
+            "token_interval": 1.0 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0,
+        }
+
+    async def _sleep(self, seconds: float) -> None:
+        if self.time_scale > 0 and seconds > 0:
+            await asyncio.sleep(seconds * self.time_scale)
+
+    async def _maybe_fail(self) -> None:
+        """
+        按配置的比例注入限流和超时错误
+        """
+        self.calls += 1
+        roll = self._error_rng.random()
+        if roll < self.rate_limit_error_rate:
+            raise ModelRateLimitError(
+                message="Simulated rate limit",
+                model_name=self.model_name,
+                error_code="rate_limit_exceeded",
+                error_type="rate_limit"
+            )
+        if roll < self.rate_limit_error_rate + self.timeout_error_rate:
+            await self._sleep(self.first_token_latency)
+            raise ModelTimeoutError(
+                message="Simulated timeout",
+                model_name=self.model_name,
+                error_code="timeout",
+                error_type="timeout"
+            )
+
+    async def generate_text(
+        self,
+        prompt: str,
+        max_tokens: int = 1000,
+        temperature: float = 0.7,
+        stop: Optional[List[str]] = None,
+        **kwargs: Any
+    ) -> ModelResponse:
+        """
+        生成文本
+        """
+        await self._maybe_fail()
+        plan = self._plan(prompt, max_tokens, temperature)
+        await self._sleep(
+            plan["first_token_latency"] + plan["token_interval"] * len(plan["tokens"])
+        )
+
+        return ModelResponse(
+            content="".join(plan["tokens"]),
+            tokens_used=self.get_token_count(prompt) + len(plan["tokens"]),
+            model_name=self.model_name,
+            metadata={
+                "finish_reason": "length" if len(plan["tokens"]) >= max_tokens else "stop",
+                "completion_tokens": len(plan["tokens"]),
+                "fake": True,
+            }
+        )
+
+    async def generate_text_stream(
+        self,
+        prompt: str,
+        max_tokens: int = 1000,
+        temperature: float = 0.7,
+        stop: Optional[List[str]] = None,
+        **kwargs: Any
+    ) -> AsyncIterator[str]:
+        """
+        流式生成文本，按吞吐量逐个token输出
+        """
+        await self._maybe_fail()
+        plan = self._plan(prompt, max_tokens, temperature)
+        await self._sleep(plan["first_token_latency"])
+        for token in plan["tokens"]:
+            yield token
+            await self._sleep(plan["token_interval"])
+        set_stream_result(
+            kwargs, finish_reason="length" if len(plan["tokens"]) >= max_tokens else "stop"
+        )
+
+    async def generate_embedding(self, text: str) -> List[float]:
+        """
+        生成确定性的单位向量
+        """
+        await self._maybe_fail()
+        await self._sleep(self.first_token_latency)
+        return self._embed(text)
+
+    async def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        await self._maybe_fail()
+        await self._sleep(self.first_token_latency)
+        return [self._embed(text) for text in texts]
+
+    def _embed(self, text: str) -> List[float]:
+        rng = self._rng("embedding", text)
+        vector = [rng.gauss(0, 1) for _ in range(self.embedding_dim)]
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    def get_token_count(self, text: str) -> int:
+        """
+        估算token数量
+        """
+        return estimate_tokens(text)
+
+def create_fake_adapter(
+    model_name: str = "fake",
+    extra_params: Optional[Dict[str, Any]] = None,
+    **kwargs: Any
+) -> FakeModelAdapter:
+    """
+    供应商工厂：延迟分布、错误率等参数从extra_params.fake读取
+    """
+    options = (extra_params or {}).get("fake", {})
+    return FakeModelAdapter(model_name=model_name, **options)
@@ -0,0 +1,232 @@
+"""
+对冲请求
+调用在观测到的延迟分位数内没有返回时，向同一模型或备用模型再发一个相同的请求，
+取先完成的结果并取消另一个，用少量额外的token换取更低的长尾延迟
+"""
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from .base import (
+    BaseModelAdapter,
+    ModelAdapterWrapper,
+    ModelResponse,
+    get_task_type,
+)
+from .metrics import RollingStats
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class HedgingPolicy:
+    """
+    对冲策略
+    percentile：等待到该延迟分位数仍未返回时发出对冲请求；
+    min_samples：样本不足时使用initial_delay；
+    min_delay：对冲等待时间的下限，避免对本来就很快的调用对冲
+    """
+    enabled: bool = True
+    percentile: float = 95.0
+    min_samples: int = 20
+    initial_delay: float = 30.0
+    min_delay: float = 1.0
+
+    def delay(self, stats: RollingStats) -> float:
+        """
+        计算发出对冲请求前的等待时间
+        """
+        if stats.sample_count < self.min_samples:
+            return self.initial_delay
+        observed = stats.latency_percentile(self.percentile)
+        if observed is None:
+            return self.initial_delay
+        return max(self.min_delay, observed)
+
+# 默认不对冲任何任务类型：目前真正调用模型的只有正文生成（generate_content），
+# 它以流式输出为主（流式调用不对冲），多候选模式本身已经并发发出多个请求。
+# 大纲、场景和角色等任务接入模型后，在ModelConfig.extra_params.hedging中按任务类型启用
+DEFAULT_HEDGING_POLICIES: Dict[str, HedgingPolicy] = {}
+
+class HedgeBudget:
+    """
+    对冲的额外token预算
+    对冲请求估算消耗的token数不超过正常请求token数的max_extra_ratio倍（外加burst_tokens的余量）
+    """
+
+    def __init__(self, max_extra_ratio: float = 0.1, burst_tokens: int = 4000):
+        self.max_extra_ratio = max_extra_ratio
+        self.burst_tokens = burst_tokens
+        self.base_tokens = 0
+        self.extra_tokens = 0
+        self.hedged = 0
+        self.denied = 0
+        self.hedge_wins = 0
+
+    def record_base(self, tokens: int) -> None:
+        self.base_tokens += tokens
+
+    def try_spend(self, tokens: int) -> bool:
+        """
+        预留一次对冲请求的token，预算不足时返回False
+        """
+        limit = self.base_tokens * self.max_extra_ratio + self.burst_tokens
+        if self.extra_tokens + tokens > limit:
+            self.denied += 1
+            return False
+        self.extra_tokens += tokens
+        self.hedged += 1
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "base_tokens": self.base_tokens,
+            "extra_tokens": self.extra_tokens,
+            "hedged": self.hedged,
+            "denied": self.denied,
+            "hedge_wins": self.hedge_wins,
+        }
+
+class HedgedModelAdapter(ModelAdapterWrapper):
+    """
+    带对冲请求的模型适配器
+    按调用的任务类型选择策略（见get_task_type），未配置的任务类型使用default_policy（默认不对冲）；
+    调用时传入hedge=False可以跳过，hedge=True强制使用默认的启用策略。
+    hedge_model为对冲请求使用的模型，未指定时对冲到同一个模型。
+    对冲阈值按任务类型分别统计延迟（大纲生成和关键词提取的延迟相差一个数量级）；流式调用不对冲
+    """
+
+    def __init__(
+        self,
+        model: BaseModelAdapter,
+        hedge_model: Optional[BaseModelAdapter] = None,
+        policies: Optional[Dict[str, HedgingPolicy]] = None,
+        default_policy: Optional[HedgingPolicy] = None,
+        stats: Optional[Dict[str, RollingStats]] = None,
+        budget: Optional[HedgeBudget] = None
+    ):
+        super().__init__(model)
+        self.hedge_model = hedge_model or model
+        self.policies = DEFAULT_HEDGING_POLICIES if policies is None else policies
+        self.default_policy = default_policy or HedgingPolicy(enabled=False)
+        # 任务类型 -> 延迟统计，可以在使用同一模型的适配器之间共享
+        self.stats = {} if stats is None else stats
+        self.budget = budget or hedge_budget
+
+    def policy_for(self, kwargs: Dict[str, Any]) -> HedgingPolicy:
+        hedge = kwargs.pop("hedge", None)
+        if hedge is False:
+            return HedgingPolicy(enabled=False)
+        policy = self.policies.get(get_task_type(kwargs), self.default_policy)
+        if hedge is True and not policy.enabled:
+            return HedgingPolicy()
+        return policy
+
+    def stats_for(self, task_type: Optional[str]) -> RollingStats:
+        """
+        任务类型的延迟统计，没有任务类型的调用共用一组
+        """
+        return self.stats.setdefault(task_type or "", RollingStats())
+
+    async def generate_text(
+        self,
+        prompt: str,
+        max_tokens: int = 1000,
+        temperature: float = 0.7,
+        stop: Optional[List[str]] = None,
+        **kwargs: Any
+    ) -> ModelResponse:
+        policy = self.policy_for(kwargs)
+        stats = self.stats_for(get_task_type(kwargs))
+        call_kwargs = dict(
+            prompt=prompt,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            stop=stop,
+            **kwargs
+        )
+        started = time.monotonic()
+        if not policy.enabled:
+            response = await self._call(self.model, call_kwargs)
+            stats.record(time.monotonic() - started)
+            return response
+
+        delay = policy.delay(stats)
+        primary = asyncio.ensure_future(self._call(self.model, call_kwargs))
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if done:
+                response = primary.result()
+                stats.record(time.monotonic() - started)
+                return response
+
+            # 按提示长度加预期输出估算对冲的额外花费
+            cost = self.get_token_count(prompt) + max_tokens // 2
+            if not self.budget.try_spend(cost):
+                response = await primary
+                stats.record(time.monotonic() - started)
+                return response
+
+            logger.info(f"Hedging {self.model_name} call after {delay:.2f}s")
+            # 对冲请求不能与仍在进行的原请求合并
+            hedge = asyncio.ensure_future(
+                self._call(self.hedge_model, {**call_kwargs, "coalesce": False})
+            )
+            response, winner = await self._first_success({primary: "primary", hedge: "hedge"})
+        except BaseException:
+            primary.cancel()
+            raise
+
+        # 记录调用方实际等待的时间（对冲胜出时原请求的完整延迟已无法观测）
+        stats.record(time.monotonic() - started)
+        if winner == "hedge":
+            self.budget.hedge_wins += 1
+        response.metadata["hedge"] = {"hedged": True, "winner": winner, "delay": delay}
+        return response
+
+    async def _call(
+        self,
+        model: BaseModelAdapter,
+        call_kwargs: Dict[str, Any]
+    ) -> ModelResponse:
+        response = await model.generate_text(**call_kwargs)
+        self.budget.record_base(response.tokens_used)
+        return response
+
+    @staticmethod
+    async def _first_success(tasks: Dict["asyncio.Future[ModelResponse]", str]) -> tuple:
+        """
+        返回最先成功的结果并取消其余请求；全部失败时抛出最后一个错误
+        """
+        pending = set(tasks)
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    # 被取消的请求调用exception()会抛出CancelledError
+                    if task.cancelled():
+                        error = asyncio.CancelledError()
+                        continue
+                    if task.exception() is None:
+                        return task.result(), tasks[task]
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+def build_hedging_policies(
+    overrides: Optional[Dict[str, Dict[str, Any]]] = None
+) -> Dict[str, HedgingPolicy]:
+    """
+    在默认策略上应用按任务类型的配置（如ModelConfig.extra_params.hedging）
+    """
+    policies = dict(DEFAULT_HEDGING_POLICIES)
+    for task_type, options in (overrides or {}).items():
+        policies[task_type] = HedgingPolicy(**options)
+    return policies
+
+# 全局对冲预算，所有对冲适配器共享
+hedge_budget = HedgeBudget()
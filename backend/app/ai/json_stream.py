@@ -0,0 +1,172 @@
+"""
+增量JSON解析
+从模型输出中提取JSON：跳过代码块标记和前后的说明文字，
+流式输入时每个顶层字段（或数组元素）一闭合就立即返回，不必等待整个响应结束
+"""
+import json
+from typing import Any, AsyncIterator, Iterable, List, Optional, Tuple, Union
+
+# 顶层字段的键：对象为字段名，数组为元素下标
+FieldKey = Union[str, int]
+
+_OPENERS = {"{": "}", "[": "]"}
+
+class JSONStreamParser:
+    """
+    增量JSON解析器
+    逐块调用feed，返回本块中新闭合的顶层字段；每个字符只扫描一次。
+    第一个"{"或"["之前的内容（说明文字、```json标记）会被跳过，
+    顶层值闭合之后的内容会被忽略
+    """
+
+    def __init__(self):
+        self._buffer: List[str] = []
+        self._length = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._container: Optional[str] = None
+        # 当前顶层成员在缓冲区中的起始位置
+        self._member_start = 0
+        self._index = 0
+        self.done = False
+        self.fields: List[Tuple[FieldKey, Any]] = []
+
+    @property
+    def started(self) -> bool:
+        return self._container is not None
+
+    @property
+    def text(self) -> str:
+        """
+        已读取的JSON文本（从顶层的"{"或"["开始）
+        """
+        return "".join(self._buffer)
+
+    def feed(self, chunk: str) -> List[Tuple[FieldKey, Any]]:
+        """
+        输入一段文本，返回新闭合的顶层字段列表
+        """
+        completed: List[Tuple[FieldKey, Any]] = []
+        for char in chunk:
+            if self.done:
+                break
+
+            if self._container is None:
+                if char in _OPENERS:
+                    self._container = char
+                    self._depth = 1
+                    self._append(char)
+                    self._member_start = self._length
+                continue
+
+            self._append(char)
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+
+            if char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._close_member(self._length - 1, completed)
+                    self.done = True
+            elif char == "," and self._depth == 1:
+                self._close_member(self._length - 1, completed)
+                self._member_start = self._length
+
+        self.fields.extend(completed)
+        return completed
+
+    def _append(self, char: str) -> None:
+        self._buffer.append(char)
+        self._length += 1
+
+    def _close_member(self, end: int, completed: List[Tuple[FieldKey, Any]]) -> None:
+        """
+        解析刚结束的顶层成员，格式不合法的成员被跳过
+        """
+        member = "".join(self._buffer[self._member_start:end]).strip()
+        if not member:
+            return
+
+        try:
+            if self._container == "{":
+                completed.extend(json.loads("{" + member + "}").items())
+            else:
+                completed.append((self._index, json.loads(member)))
+                self._index += 1
+        except json.JSONDecodeError:
+            pass
+
+    def result(self) -> Any:
+        """
+        返回完整的解析结果
+        顶层值尚未闭合或不是合法JSON时抛出ValueError
+        """
+        if not self.done:
+            raise ValueError("JSON value is incomplete")
+        return json.loads(self.text)
+
+def extract_json(text: str, max_attempts: int = 5) -> Any:
+    """
+    从模型输出中提取第一个完整的JSON对象或数组
+    可以处理代码块标记、前置说明和尾随文字；找不到时抛出ValueError
+    """
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        pass
+
+    start = 0
+    for _ in range(max_attempts):
+        positions = [p for p in (text.find("{", start), text.find("[", start)) if p >= 0]
+        if not positions:
+            break
+        start = min(positions)
+
+        parser = JSONStreamParser()
+        parser.feed(text[start:])
+        try:
+            return parser.result()
+        except ValueError:
+            # 前面的括号可能只是说明文字的一部分，从下一个括号重新尝试
+            start += 1
+
+    raise ValueError("No JSON value found in model output")
+
+async def iter_json_fields(
+    chunks: Union[AsyncIterator[str], Iterable[str]],
+    parser: Optional[JSONStreamParser] = None
+) -> AsyncIterator[Tuple[FieldKey, Any]]:
+    """
+    从流式输出中逐个返回闭合的顶层字段
+    传入parser时可以在迭代结束后通过parser.result()获取完整结果
+    """
+    parser = parser or JSONStreamParser()
+    if not hasattr(chunks, "__aiter__"):
+        for chunk in chunks:
+            for item in parser.feed(chunk):
+                yield item
+            if parser.done:
+                return
+        return
+
+    try:
+        async for chunk in chunks:
+            for item in parser.feed(chunk):
+                yield item
+            if parser.done:
+                break
+    finally:
+        # 顶层值闭合后不再需要尾随文字，关闭上游流
+        if hasattr(chunks, "aclose"):
+            await chunks.aclose()
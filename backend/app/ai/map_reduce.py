@@ -0,0 +1,55 @@
+"""
+长文本map-reduce
+把超出单次调用预算的文本按句子边界分块，在信号量限制下并发处理每一块，
+再用归并函数（见reducers）合并各块的结果
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, List, TypeVar, Union
+
+from .reducers import Reducer, get_reducer
+from .utils import chunk_text
+
+T = TypeVar("T")
+
+async def map_reduce(
+    text: str,
+    map_func: Callable[[str], Awaitable[T]],
+    reducer: Union[str, Reducer] = "concat",
+    chunk_tokens: int = 2000,
+    boundary_window: int = 100,
+    model: str = "gpt-4",
+    max_concurrency: int = 4
+) -> Any:
+    """
+    分块并发处理长文本并归并结果
+    文本只有一块时直接返回map_func的结果；任一块失败时取消其余块并抛出异常
+    """
+    chunks = chunk_text(
+        text, max_tokens=chunk_tokens, boundary_window=boundary_window, model=model
+    )
+    if len(chunks) <= 1:
+        return await map_func(text)
+
+    results = await map_chunks(chunks, map_func, max_concurrency)
+    return get_reducer(reducer)(results)
+
+async def map_chunks(
+    chunks: List[str],
+    map_func: Callable[[str], Awaitable[T]],
+    max_concurrency: int = 4
+) -> List[T]:
+    """
+    并发处理各块，结果保持块的顺序
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def run(chunk: str) -> T:
+        async with semaphore:
+            return await map_func(chunk)
+
+    tasks = [asyncio.ensure_future(run(chunk)) for chunk in chunks]
+    try:
+        return list(await asyncio.gather(*tasks))
+    finally:
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,117 @@
+"""
+模型调用指标统计
+维护滚动窗口内的延迟分位数和错误率，供路由、对冲请求等功能使用；
+并统计上下文超限的恢复情况
+"""
+import math
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Sequence, Tuple
+
+def percentile(values: Sequence[float], q: float) -> Optional[float]:
+    """
+    计算分位数（最近秩法），q取值0-100，没有数据时返回None
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, int(math.ceil(q / 100.0 * len(ordered))))
+    return ordered[min(rank, len(ordered)) - 1]
+
+class RollingStats:
+    """
+    滚动窗口统计
+    记录最近window次调用的延迟和成功与否，并按max_age秒淘汰过旧的样本
+    """
+
+    def __init__(self, window: int = 100, max_age: float = 300.0):
+        self.window = window
+        self.max_age = max_age
+        # (时间戳, 延迟秒数, 是否成功)
+        self._samples: Deque[Tuple[float, float, bool]] = deque(maxlen=window)
+        self.total_calls = 0
+        self.total_errors = 0
+
+    def record(self, latency: float, success: bool = True) -> None:
+        """
+        记录一次调用
+        """
+        self._samples.append((time.monotonic(), latency, success))
+        self.total_calls += 1
+        if not success:
+            self.total_errors += 1
+
+    def _recent(self) -> List[Tuple[float, float, bool]]:
+        cutoff = time.monotonic() - self.max_age
+        while self._samples and self._samples[0][0] < cutoff:
+            self._samples.popleft()
+        return list(self._samples)
+
+    @property
+    def sample_count(self) -> int:
+        return len(self._recent())
+
+    def latency_percentile(self, q: float) -> Optional[float]:
+        """
+        成功调用的延迟分位数
+        """
+        return percentile([s[1] for s in self._recent() if s[2]], q)
+
+    @property
+    def p50(self) -> Optional[float]:
+        return self.latency_percentile(50)
+
+    @property
+    def p95(self) -> Optional[float]:
+        return self.latency_percentile(95)
+
+    @property
+    def error_rate(self) -> float:
+        """
+        窗口内的错误率
+        """
+        samples = self._recent()
+        if not samples:
+            return 0.0
+        return sum(1 for s in samples if not s[2]) / len(samples)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        导出统计信息
+        """
+        return {
+            "samples": self.sample_count,
+            "p50": self.p50,
+            "p95": self.p95,
+            "error_rate": self.error_rate,
+            "total_calls": self.total_calls,
+            "total_errors": self.total_errors,
+        }
+
+class OverflowStats:
+    """
+    按任务类型统计上下文超限（TokenLimitError）及其恢复方式
+    """
+
+    def __init__(self):
+        self._stats: Dict[str, Dict[str, Any]] = {}
+
+    def record(self, task_type: Optional[str], strategy: str, recovered: bool) -> None:
+        stats = self._stats.setdefault(
+            task_type or "unknown", {"overflows": 0, "recovered": 0, "failed": 0, "strategies": {}}
+        )
+        stats["overflows"] += 1
+        stats["recovered" if recovered else "failed"] += 1
+        stats["strategies"][strategy] = stats["strategies"].get(strategy, 0) + 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            task_type: {**stats, "strategies": dict(stats["strategies"])}
+            for task_type, stats in self._stats.items()
+        }
+
+    def reset(self) -> None:
+        self._stats.clear()
+
+# 全局上下文超限统计
+overflow_stats = OverflowStats()
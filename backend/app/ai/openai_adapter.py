@@ -1,10 +1,16 @@
-from typing import Any, Dict, List, Optional
+from typing import Any, AsyncIterator, Dict, List, Optional
+import asyncio
+import contextlib
+import aiohttp
 import openai
-from tenacity import retry, stop_after_attempt, wait_random_exponential
 
 from app.core.config import settings
+from .retry import RetryPolicy, default_retry_policy, parse_retry_after, with_retry
+from .utils import count_tokens
 from .base import (
     BaseModelAdapter,
+    set_stream_result,
+    strip_control_kwargs,
     ModelResponse,
     ModelError,
     TokenLimitError,
@@ -13,32 +19,117 @@ from .base import (
     ModelRateLimitError,
 )
 
+# 各模型的上下文窗口，未登记的模型使用基类的默认值
+CONTEXT_WINDOWS: Dict[str, int] = {
+    "gpt-4": 8192,
+    "gpt-4-32k": 32768,
+    "gpt-4-turbo": 128000,
+    "gpt-4o": 128000,
+    "gpt-4o-mini": 128000,
+    "gpt-3.5-turbo": 16385,
+    "gpt-3.5-turbo-16k": 16385,
+}
+
 class OpenAIAdapter(BaseModelAdapter):
     """
     OpenAI GPT模型适配器
     """
+
+    # 嵌入模型及其单次请求上限
+    embedding_model: str = "text-embedding-ada-002"
+    embedding_batch_size: int = 2048
+    embedding_batch_tokens: int = 300000
+    # 连接池大小和超时的默认值（秒）
+    max_connections: int = 100
+    keepalive_timeout: float = 30.0
+    connect_timeout: float = 10.0
+    request_timeout: float = 120.0
     
     def __init__(
         self,
         api_key: Optional[str] = None,
         model_name: str = "gpt-4",
-        organization: Optional[str] = None
+        organization: Optional[str] = None,
+        base_url: Optional[str] = None,
+        max_connections: Optional[int] = None,
+        max_concurrency: Optional[int] = None,
+        connect_timeout: Optional[float] = None,
+        request_timeout: Optional[float] = None,
+        retry_policy: Optional[RetryPolicy] = None
     ):
         """
         初始化OpenAI客户端
+        凭据随每个请求发送，不修改openai模块的全局状态，不同配置的适配器互不影响；
+        每个适配器使用独立的keep-alive连接池，并用信号量限制并发请求数；
+        失败的调用按retry_policy（默认按错误类型重试，见retry模块）重试
         """
         self.api_key = api_key or settings.AI_MODEL_API_KEY
         self.model_name = model_name
         self.organization = organization
+        self.base_url = base_url
+        self.context_window = CONTEXT_WINDOWS.get(model_name, BaseModelAdapter.context_window)
         
-        openai.api_key = self.api_key
-        if organization:
-            openai.organization = organization
+        if max_connections is not None:
+            self.max_connections = max_connections
+        if connect_timeout is not None:
+            self.connect_timeout = connect_timeout
+        if request_timeout is not None:
+            self.request_timeout = request_timeout
+        self.max_concurrency = max_concurrency or self.max_connections
+        self.retry_policy = retry_policy or default_retry_policy
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._session_loop: Optional[asyncio.AbstractEventLoop] = None
 
-    @retry(
-        wait=wait_random_exponential(min=1, max=60),
-        stop=stop_after_attempt(3)
-    )
+    def _request_options(self) -> Dict[str, Any]:
+        """
+        每个请求携带的凭据、地址和超时
+        """
+        options: Dict[str, Any] = {
+            "api_key": self.api_key,
+            "request_timeout": (self.connect_timeout, self.request_timeout),
+        }
+        if self.organization:
+            options["organization"] = self.organization
+        if self.base_url:
+            options["api_base"] = self.base_url
+        return options
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """
+        获取当前事件循环上的连接池，不存在或已关闭时创建
+        """
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._session_loop is not loop:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=self.max_connections,
+                    keepalive_timeout=self.keepalive_timeout
+                )
+            )
+            self._session_loop = loop
+        return self._session
+
+    @contextlib.contextmanager
+    def _use_session(self):
+        """
+        让openai在本次请求中使用适配器自己的连接池
+        """
+        token = openai.aiosession.set(self._get_session())
+        try:
+            yield
+        finally:
+            openai.aiosession.reset(token)
+
+    async def aclose(self) -> None:
+        """
+        关闭连接池
+        """
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    @with_retry
     async def generate_text(
         self,
         prompt: str,
@@ -51,14 +142,17 @@ class OpenAIAdapter(BaseModelAdapter):
         生成文本
         """
         try:
-            response = await openai.ChatCompletion.acreate(
-                model=self.model_name,
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=max_tokens,
-                temperature=temperature,
-                stop=stop,
-                **kwargs
-            )
+            async with self._semaphore:
+                with self._use_session():
+                    response = await openai.ChatCompletion.acreate(
+                        model=self.model_name,
+                        messages=[{"role": "user", "content": prompt}],
+                        max_tokens=max_tokens,
+                        temperature=temperature,
+                        stop=stop,
+                        **self._request_options(),
+                        **strip_control_kwargs(kwargs)
+                    )
             
             content = response.choices[0].message.content
             tokens_used = response.usage.total_tokens
@@ -70,63 +164,137 @@ class OpenAIAdapter(BaseModelAdapter):
                 metadata={
                     "finish_reason": response.choices[0].finish_reason,
                     "response_id": response.id,
+                    "completion_tokens": response.usage.get("completion_tokens"),
                 }
             )
             
-        except openai.error.InvalidRequestError as e:
+        except openai.error.OpenAIError as e:
+            raise self._convert_error(e)
+
+    async def generate_text_stream(
+        self,
+        prompt: str,
+        max_tokens: int = 1000,
+        temperature: float = 0.7,
+        stop: Optional[List[str]] = None,
+        **kwargs: Any
+    ) -> AsyncIterator[str]:
+        """
+        流式生成文本
+        逐块返回增量内容，调用方关闭迭代器时同时关闭上游连接
+        整个流读取期间占用一个并发名额
+        """
+        async with self._semaphore:
+            try:
+                with self._use_session():
+                    stream = await openai.ChatCompletion.acreate(
+                        model=self.model_name,
+                        messages=[{"role": "user", "content": prompt}],
+                        max_tokens=max_tokens,
+                        temperature=temperature,
+                        stop=stop,
+                        stream=True,
+                        **self._request_options(),
+                        **strip_control_kwargs(kwargs)
+                    )
+            except openai.error.OpenAIError as e:
+                raise self._convert_error(e)
+
+            try:
+                async for chunk in stream:
+                    if not chunk.choices:
+                        continue
+                    choice = chunk.choices[0]
+                    # 最后一个增量带有finish_reason，截断（length）时调用方据此续写
+                    finish_reason = getattr(choice, "finish_reason", None)
+                    if finish_reason:
+                        set_stream_result(kwargs, finish_reason=finish_reason)
+                    content = choice.delta.get("content")
+                    if content:
+                        yield content
+            except openai.error.OpenAIError as e:
+                raise self._convert_error(e)
+            finally:
+                # 提前结束时关闭上游流，避免为未读取的token付费
+                aclose = getattr(stream, "aclose", None)
+                if aclose is not None:
+                    await aclose()
+
+    def _convert_error(self, e: Exception) -> ModelError:
+        """
+        将OpenAI异常转换为统一的模型异常
+        error_type决定重试方式，响应头中的Retry-After记入metadata["retry_after"]
+        """
+        metadata = {}
+        retry_after = parse_retry_after(getattr(e, "headers", None))
+        if retry_after is not None:
+            metadata["retry_after"] = retry_after
+
+        if isinstance(e, openai.error.InvalidRequestError):
             if "maximum context length" in str(e):
-                raise TokenLimitError(
+                return TokenLimitError(
                     message=str(e),
                     model_name=self.model_name,
                     error_code="token_limit_exceeded",
                     error_type="token_limit"
                 )
-            raise ModelAPIError(
+            return ModelAPIError(
                 message=str(e),
                 model_name=self.model_name,
                 error_code="invalid_request",
-                error_type="api_error"
+                error_type="invalid_request"
             )
-            
-        except openai.error.RateLimitError as e:
-            raise ModelRateLimitError(
+
+        if isinstance(e, (openai.error.AuthenticationError, openai.error.PermissionError)):
+            return ModelAPIError(
                 message=str(e),
                 model_name=self.model_name,
-                error_code="rate_limit_exceeded",
-                error_type="rate_limit"
+                error_code="authentication_failed",
+                error_type="authentication"
             )
-            
-        except openai.error.Timeout as e:
-            raise ModelTimeoutError(
+
+        if isinstance(e, openai.error.RateLimitError):
+            return ModelRateLimitError(
                 message=str(e),
                 model_name=self.model_name,
-                error_code="timeout",
-                error_type="timeout"
+                error_code="rate_limit_exceeded",
+                error_type="rate_limit",
+                metadata=metadata
             )
-            
-        except openai.error.APIError as e:
-            raise ModelAPIError(
+
+        if isinstance(e, openai.error.Timeout):
+            return ModelTimeoutError(
                 message=str(e),
                 model_name=self.model_name,
-                error_code="api_error",
-                error_type="api_error"
+                error_code="timeout",
+                error_type="timeout"
             )
 
-    @retry(
-        wait=wait_random_exponential(min=1, max=60),
-        stop=stop_after_attempt(3)
-    )
+        return ModelAPIError(
+            message=str(e),
+            model_name=self.model_name,
+            error_code="api_error",
+            error_type="api_error",
+            metadata=metadata
+        )
+
+    @with_retry
     async def generate_embedding(self, text: str) -> List[float]:
         """
         生成文本嵌入向量
         """
         try:
-            response = await openai.Embedding.acreate(
-                model="text-embedding-ada-002",
-                input=text
-            )
+            async with self._semaphore:
+                with self._use_session():
+                    response = await openai.Embedding.acreate(
+                        model=self.embedding_model,
+                        input=text,
+                        **self._request_options()
+                    )
             return response.data[0].embedding
             
+        except openai.error.OpenAIError as e:
+            raise self._convert_error(e)
         except Exception as e:
             raise ModelAPIError(
                 message=str(e),
@@ -135,140 +303,35 @@ class OpenAIAdapter(BaseModelAdapter):
                 error_type="api_error"
             )
 
-    async def classify_text(
-        self,
-        text: str,
-        labels: List[str]
-    ) -> Dict[str, float]:
+    @with_retry
+    async def _embed_batch(self, texts: List[str]) -> List[List[float]]:
         """
-        文本分类
-        使用few-shot方式进行分类
+        一次请求为整个批次生成嵌入向量
         """
-        prompt = f"""
-        请对以下文本进行分类，可能的类别有：{', '.join(labels)}
-        
-        文本内容：
-        {text}
-        
-        请以JSON格式返回每个类别的概率，概率之和应为1。
-        """
-        
-        response = await self.generate_text(
-            prompt=prompt,
-            temperature=0.3
-        )
-        
         try:
-            import json
-            probabilities = json.loads(response.content)
-            return probabilities
-        except Exception:
-            return {label: 0.0 for label in labels}
-
-    async def analyze_sentiment(
-        self,
-        text: str
-    ) -> Dict[str, float]:
-        """
-        情感分析
-        """
-        prompt = """
-        请对以下文本进行情感分析，返回积极、消极和中性的概率值。
-        
-        文本内容：
-        {text}
-        
-        请以JSON格式返回分析结果，包含positive、negative和neutral三个字段，值为0-1之间的浮点数，总和为1。
-        """
-        
-        response = await self.generate_text(
-            prompt=prompt.format(text=text),
-            temperature=0.3
-        )
-        
-        try:
-            import json
-            sentiment = json.loads(response.content)
-            return sentiment
-        except Exception:
-            return {
-                "positive": 0.0,
-                "negative": 0.0,
-                "neutral": 1.0
-            }
-
-    async def extract_keywords(
-        self,
-        text: str,
-        max_keywords: int = 10
-    ) -> List[str]:
-        """
-        关键词提取
-        """
-        prompt = f"""
-        请从以下文本中提取最多{max_keywords}个关键词，以JSON数组格式返回。
-        
-        文本内容：
-        {text}
-        """
-        
-        response = await self.generate_text(
-            prompt=prompt,
-            temperature=0.3
-        )
-        
-        try:
-            import json
-            keywords = json.loads(response.content)
-            return keywords[:max_keywords]
-        except Exception:
-            return []
-
-    async def check_content_safety(
-        self,
-        text: str
-    ) -> Dict[str, Any]:
-        """
-        内容安全检查
-        """
-        prompt = """
-        请对以下内容进行安全检查，检查是否包含：
-        1. 暴力内容
-        2. 色情内容
-        3. 仇恨言论
-        4. 歧视内容
-        5. 有害信息
-        
-        文本内容：
-        {text}
-        
-        请以JSON格式返回检查结果，包含is_safe字段和各项具体检查结果。
-        """
-        
-        response = await self.generate_text(
-            prompt=prompt.format(text=text),
-            temperature=0.3
-        )
-        
-        try:
-            import json
-            check_result = json.loads(response.content)
-            return check_result
-        except Exception:
-            return {
-                "is_safe": False,
-                "reason": "检查失败"
-            }
+            async with self._semaphore:
+                with self._use_session():
+                    response = await openai.Embedding.acreate(
+                        model=self.embedding_model,
+                        input=texts,
+                        **self._request_options()
+                    )
+            data = sorted(response.data, key=lambda item: item.index)
+            return [item.embedding for item in data]
+            
+        except openai.error.OpenAIError as e:
+            raise self._convert_error(e)
+        except Exception as e:
+            raise ModelAPIError(
+                message=str(e),
+                model_name=self.model_name,
+                error_code="embedding_error",
+                error_type="api_error"
+            )
 
     def get_token_count(self, text: str) -> int:
         """
         获取文本的token数量
-        使用tiktoken库进行计算
+        使用全局分词器注册表中缓存的编码进行计算
         """
-        try:
-            import tiktoken
-            encoding = tiktoken.encoding_for_model(self.model_name)
-            return len(encoding.encode(text))
-        except Exception:
-            # 如果无法使用tiktoken，使用简单的估算
-            return len(text.split()) * 1.3
\ No newline at end of file
+        return count_tokens(text, model=self.model_name)
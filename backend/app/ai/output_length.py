@@ -0,0 +1,306 @@
+"""
+输出长度预测
+按Agent和任务类型记录最近调用的输出token数，用其P95乘以安全系数作为max_tokens，
+避免固定上限导致部分任务被截断、其他任务又预留了远超所需的配额（供应商按max_tokens计入TPM限额）。
+输出因长度被截断（finish_reason为length）时续写一次，而不是整体重新生成
+"""
+import logging
+import math
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional
+
+from .base import (
+    BaseModelAdapter,
+    ModelAdapterWrapper,
+    ModelResponse,
+    TokenLimitError,
+    get_task_type,
+)
+from .metrics import percentile
+from .overflow import compress_prompt
+from .templates import template_registry
+from .utils import count_tokens, truncate_to_tokens
+
+logger = logging.getLogger(__name__)
+
+def completion_tokens(response: ModelResponse) -> int:
+    """
+    响应的输出token数，供应商没有返回时按内容估算
+    """
+    tokens = response.metadata.get("completion_tokens")
+    if tokens is None:
+        tokens = count_tokens(response.content, response.model_name)
+    return tokens
+
+class OutputLengthPredictor:
+    """
+    输出长度预测器
+    每个键（Agent类型:任务类型）保留最近window次的输出token数，样本不少于min_samples时
+    预测值为P{percentile}乘以margin，并限制在[min_tokens, 调用方给出的上限]之间
+    """
+
+    def __init__(
+        self,
+        window: int = 200,
+        percentile: float = 95.0,
+        margin: float = 1.2,
+        min_samples: int = 20,
+        min_tokens: int = 64
+    ):
+        self.window = window
+        self.percentile = percentile
+        self.margin = margin
+        self.min_samples = min_samples
+        self.min_tokens = min_tokens
+        self._samples: Dict[str, Deque[int]] = {}
+        self._truncated: Dict[str, int] = {}
+        self._continued: Dict[str, int] = {}
+
+    def record(self, key: str, tokens: int, truncated: bool = False, continued: bool = False) -> None:
+        """
+        记录一次调用的输出token数（续写时为两次输出之和）
+        """
+        self._samples.setdefault(key, deque(maxlen=self.window)).append(tokens)
+        if truncated:
+            self._truncated[key] = self._truncated.get(key, 0) + 1
+        if continued:
+            self._continued[key] = self._continued.get(key, 0) + 1
+
+    def predict(self, key: str, default: int, ceiling: Optional[int] = None) -> int:
+        """
+        预测max_tokens，样本不足时返回default
+        """
+        samples = self._samples.get(key)
+        if not samples or len(samples) < self.min_samples:
+            return default
+        predicted = math.ceil(percentile(list(samples), self.percentile) * self.margin)
+        return max(self.min_tokens, min(predicted, ceiling or default * 2))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            key: {
+                "samples": len(samples),
+                "p50": percentile(list(samples), 50),
+                "p95": percentile(list(samples), self.percentile),
+                "truncated": self._truncated.get(key, 0),
+                "continued": self._continued.get(key, 0),
+            }
+            for key, samples in self._samples.items()
+        }
+
+    def reset(self) -> None:
+        self._samples.clear()
+        self._truncated.clear()
+        self._continued.clear()
+
+class OutputLengthAdapter(ModelAdapterWrapper):
+    """
+    自适应max_tokens的模型适配器
+    调用方没有指定max_tokens时按预测值设置（样本不足时使用default_max_tokens），并记录实际输出长度；
+    指定了max_tokens的调用（如摘要、组合分析）保持原样，也不计入样本。
+    输出因长度被截断时续写一次，续写结果拼接在原输出之后；调用时传入continue_truncated=False可以关闭
+    """
+
+    # 续写提示按本地计数留出的余量比例，本地计数可能比供应商的计数偏小
+    continuation_margin: float = 0.1
+
+    def __init__(
+        self,
+        model: BaseModelAdapter,
+        agent_type: str,
+        default_max_tokens: int = 2048,
+        predictor: Optional[OutputLengthPredictor] = None
+    ):
+        super().__init__(model)
+        self.agent_type = agent_type
+        self.default_max_tokens = default_max_tokens
+        self.predictor = predictor or output_length_predictor
+
+    def _key(self, kwargs: Dict[str, Any]) -> Optional[str]:
+        task_type = get_task_type(kwargs)
+        return f"{self.agent_type}:{task_type}" if task_type else None
+
+    def max_tokens_for(self, key: Optional[str]) -> int:
+        """
+        任务类型的max_tokens，上限为默认值的两倍且不超过模型窗口的一半
+        """
+        if key is None:
+            return self.default_max_tokens
+        ceiling = min(self.default_max_tokens * 2, self.context_window // 2)
+        return self.predictor.predict(key, self.default_max_tokens, ceiling)
+
+    def continuation_prompt(self, prompt: str, partial: str, max_tokens: int) -> str:
+        """
+        续写提示（原提示加已输出部分），连同max_tokens放不进模型窗口时
+        先压缩原提示的中间部分，已输出部分最多占一半预算且保留结尾（续写从结尾接上）
+        """
+        overhead = count_tokens(
+            template_registry.render("CONTINUATION_PROMPT", prompt="", partial=""), self.model_name
+        )
+        available = int((self.context_window - max_tokens) * (1 - self.continuation_margin)) - overhead
+        prompt_tokens = count_tokens(prompt, self.model_name)
+        partial_tokens = count_tokens(partial, self.model_name)
+        if prompt_tokens + partial_tokens > available:
+            available = max(0, available)
+            partial = truncate_to_tokens(
+                partial, max(available // 2, available - prompt_tokens), self.model_name, keep="tail"
+            )
+            prompt = compress_prompt(
+                prompt, available - count_tokens(partial, self.model_name), self.model_name
+            )
+        return template_registry.render("CONTINUATION_PROMPT", prompt=prompt, partial=partial)
+
+    async def _continue(
+        self,
+        prompt: str,
+        response: ModelResponse,
+        max_tokens: int,
+        temperature: float,
+        stop: Optional[List[str]],
+        kwargs: Dict[str, Any]
+    ) -> Optional[ModelResponse]:
+        """
+        续写被截断的输出，仍然超出上下文窗口时返回None（保留截断的结果）
+        """
+        # 续写不做超限恢复：恢复时会按原提示重新生成，拼接后内容重复
+        try:
+            return await self.model.generate_text(
+                prompt=self.continuation_prompt(prompt, response.content, max_tokens),
+                max_tokens=max_tokens,
+                temperature=temperature,
+                stop=stop,
+                **{**kwargs, "overflow": False}
+            )
+        except TokenLimitError as e:
+            logger.warning(f"Continuation of {self.model_name} exceeded the context window: {e}")
+            return None
+
+    async def generate_text(
+        self,
+        prompt: str,
+        max_tokens: Optional[int] = None,
+        temperature: float = 0.7,
+        stop: Optional[List[str]] = None,
+        **kwargs: Any
+    ) -> ModelResponse:
+        continue_truncated = kwargs.pop("continue_truncated", True)
+        key = self._key(kwargs)
+        adaptive = max_tokens is None
+        if adaptive:
+            max_tokens = self.max_tokens_for(key)
+            # 预测值不计入缓存键和合并键
+            kwargs["adaptive_max_tokens"] = True
+
+        response = await self.model.generate_text(
+            prompt=prompt,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            stop=stop,
+            **kwargs
+        )
+        truncated = response.metadata.get("finish_reason") == "length"
+        tokens = completion_tokens(response)
+
+        continuation = None
+        if truncated and continue_truncated:
+            logger.info(f"Output of {key or self.model_name} truncated at {max_tokens} tokens, continuing")
+            continuation = await self._continue(prompt, response, max_tokens, temperature, stop, kwargs)
+        if continuation is not None:
+            tokens += completion_tokens(continuation)
+            response = ModelResponse(
+                content=response.content + continuation.content,
+                tokens_used=response.tokens_used + continuation.tokens_used,
+                model_name=response.model_name,
+                metadata={
+                    **response.metadata,
+                    "finish_reason": continuation.metadata.get("finish_reason"),
+                    "completion_tokens": tokens,
+                    "continued": True,
+                }
+            )
+
+        continued = continuation is not None
+        if adaptive and key is not None:
+            self.predictor.record(key, tokens, truncated=truncated, continued=continued)
+        response.metadata["max_tokens"] = max_tokens
+        return response
+
+    async def generate_text_stream(
+        self,
+        prompt: str,
+        max_tokens: Optional[int] = None,
+        temperature: float = 0.7,
+        stop: Optional[List[str]] = None,
+        **kwargs: Any
+    ) -> AsyncIterator[str]:
+        """
+        流式生成
+        按预测值设置max_tokens，流结束时通过stream_result取得finish_reason；
+        因长度被截断时接着流式输出一次续写，调用方看到的是一条连续的流
+        """
+        continue_truncated = kwargs.pop("continue_truncated", True)
+        caller_result = kwargs.pop("stream_result", None)
+        key = self._key(kwargs)
+        adaptive = max_tokens is None
+        if adaptive:
+            max_tokens = self.max_tokens_for(key)
+            # 预测值不计入缓存键和合并键
+            kwargs["adaptive_max_tokens"] = True
+
+        pieces: List[str] = []
+        result: Dict[str, Any] = {}
+        stream = self.model.generate_text_stream(
+            prompt=prompt,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            stop=stop,
+            stream_result=result,
+            **kwargs
+        )
+        try:
+            async for chunk in stream:
+                pieces.append(chunk)
+                yield chunk
+        finally:
+            await stream.aclose()
+        truncated = result.get("finish_reason") == "length"
+
+        continued = False
+        if truncated and continue_truncated:
+            logger.info(f"Output of {key or self.model_name} truncated at {max_tokens} tokens, continuing")
+            emitted = False
+            result = {}
+            # 续写不做超限恢复：恢复时会按原提示重新生成，拼接后内容重复
+            stream = self.model.generate_text_stream(
+                prompt=self.continuation_prompt(prompt, "".join(pieces), max_tokens),
+                max_tokens=max_tokens,
+                temperature=temperature,
+                stop=stop,
+                stream_result=result,
+                **{**kwargs, "overflow": False}
+            )
+            try:
+                async for chunk in stream:
+                    emitted = True
+                    pieces.append(chunk)
+                    yield chunk
+                continued = True
+            except TokenLimitError as e:
+                if emitted:
+                    raise
+                logger.warning(f"Continuation of {self.model_name} exceeded the context window: {e}")
+                result = {"finish_reason": "length"}
+            finally:
+                await stream.aclose()
+
+        if caller_result is not None:
+            caller_result.update(result, continued=continued)
+        if adaptive and key is not None:
+            tokens = count_tokens("".join(pieces), self.model_name)
+            if result.get("finish_reason") is None:
+                # 供应商没有返回finish_reason时按输出长度判断是否截断
+                truncated = tokens >= max_tokens
+            self.predictor.record(key, tokens, truncated=truncated, continued=continued)
+
+# 全局输出长度预测器
+output_length_predictor = OutputLengthPredictor()
@@ -0,0 +1,205 @@
+"""
+上下文超限恢复
+调用因超出模型上下文窗口（TokenLimitError）失败时自动缩小请求并重试一次：
+调用方提供了重建函数时按更小的预算重建提示（低优先级片段摘要或截断），
+提示本身放得下时缩小输出长度，否则压缩提示中间的部分。每次恢复都记录日志和统计
+"""
+import logging
+import re
+from typing import Any, AsyncIterator, Awaitable, Callable, List, Optional, Tuple
+
+from .base import (
+    BaseModelAdapter,
+    ModelAdapterWrapper,
+    ModelResponse,
+    TokenLimitError,
+    get_task_type,
+)
+from .metrics import OverflowStats, overflow_stats
+from .utils import count_tokens, truncate_to_tokens
+
+logger = logging.getLogger(__name__)
+
+# 提示重建函数：提示的目标token数 -> 新的提示
+PromptRebuilder = Callable[[int], Awaitable[str]]
+
+_LIMIT_PATTERN = re.compile(r"maximum context length is (\d+) tokens")
+_REQUESTED_PATTERN = re.compile(r"(?:requested|resulted in) (\d+) tokens")
+
+# 压缩提示时替换被删去部分的标记
+COMPRESSION_MARKER = "\n……\n"
+
+def parse_token_limit(error: TokenLimitError) -> Tuple[Optional[int], Optional[int]]:
+    """
+    从错误中解析模型的上下文窗口和本次请求的token数（供应商计数），解析不到的值为None
+    """
+    limit = error.metadata.get("context_limit")
+    requested = error.metadata.get("requested_tokens")
+    message = str(error)
+    if limit is None:
+        match = _LIMIT_PATTERN.search(message)
+        limit = int(match.group(1)) if match else None
+    if requested is None:
+        match = _REQUESTED_PATTERN.search(message)
+        requested = int(match.group(1)) if match else None
+    return limit, requested
+
+def compress_prompt(
+    prompt: str,
+    max_tokens: int,
+    model: str = "gpt-4",
+    head_ratio: float = 0.3
+) -> str:
+    """
+    把提示压缩到max_tokens个token以内
+    保留开头的指令和结尾的输出要求，去掉中间的部分（通常是最长、优先级最低的上下文）
+    """
+    if count_tokens(prompt, model) <= max_tokens:
+        return prompt
+    available = max(0, max_tokens - count_tokens(COMPRESSION_MARKER, model))
+    head = truncate_to_tokens(prompt, int(available * head_ratio), model, keep="head")
+    tail = truncate_to_tokens(prompt, available - count_tokens(head, model), model, keep="tail")
+    return head + COMPRESSION_MARKER + tail
+
+class OverflowRecoveryAdapter(ModelAdapterWrapper):
+    """
+    上下文超限恢复适配器
+    调用时可以传入overflow控制参数：重建函数（提示的目标token数 -> 新提示）时优先用它缩小提示；
+    False时不恢复，直接抛出TokenLimitError（如分析方法改用map-reduce）。
+    恢复只重试一次，仍然超限时抛出错误
+    """
+
+    # 重试时在换算出的可用token数上再留出的余量比例
+    safety_margin: float = 0.1
+    # 缩小输出长度时至少保留的输出token数
+    min_output_tokens: int = 256
+
+    def __init__(self, model: BaseModelAdapter, stats: Optional[OverflowStats] = None):
+        super().__init__(model)
+        self.stats = stats or overflow_stats
+
+    async def shrink(
+        self,
+        prompt: str,
+        max_tokens: int,
+        error: TokenLimitError,
+        rebuild: Optional[PromptRebuilder] = None
+    ) -> Tuple[str, int, str]:
+        """
+        计算缩小后的请求，返回(提示, 输出token数, 恢复方式)
+        """
+        limit, requested = parse_token_limit(error)
+        limit = limit or self.context_window
+        prompt_tokens = self.get_token_count(prompt)
+        # 本地计数可能比供应商的计数偏小，按供应商报告的请求token数换算可用预算
+        scale = max(1.0, requested / (prompt_tokens + max_tokens)) if requested else 1.0
+        available = int(limit / scale * (1 - self.safety_margin))
+
+        if rebuild is not None:
+            output = min(max_tokens, available // 2)
+            return await rebuild(available - output), output, "rebuild"
+        if available - prompt_tokens >= self.min_output_tokens:
+            return prompt, min(max_tokens, available - prompt_tokens), "max_tokens"
+        output = min(max_tokens, max(self.min_output_tokens, available // 4))
+        return compress_prompt(prompt, available - output, self.model_name), output, "compress"
+
+    def _log(self, task_type: Optional[str], strategy: str, error: TokenLimitError, max_tokens: int) -> None:
+        limit, requested = parse_token_limit(error)
+        logger.warning(
+            f"Context overflow on {self.model_name} (task {task_type}, limit {limit}, "
+            f"requested {requested}): retrying with {strategy}, max_tokens={max_tokens}"
+        )
+
+    async def generate_text(
+        self,
+        prompt: str,
+        max_tokens: int = 1000,
+        temperature: float = 0.7,
+        stop: Optional[List[str]] = None,
+        **kwargs: Any
+    ) -> ModelResponse:
+        rebuild = kwargs.pop("overflow", None)
+        try:
+            return await self.model.generate_text(
+                prompt=prompt,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                stop=stop,
+                **kwargs
+            )
+        except TokenLimitError as e:
+            if rebuild is False:
+                raise
+            error = e
+
+        task_type = get_task_type(kwargs)
+        prompt, max_tokens, strategy = await self.shrink(prompt, max_tokens, error, rebuild or None)
+        self._log(task_type, strategy, error, max_tokens)
+        try:
+            response = await self.model.generate_text(
+                prompt=prompt,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                stop=stop,
+                **kwargs
+            )
+        except TokenLimitError:
+            self.stats.record(task_type, strategy, recovered=False)
+            raise
+
+        self.stats.record(task_type, strategy, recovered=True)
+        response.metadata["overflow"] = {"strategy": strategy, "max_tokens": max_tokens}
+        return response
+
+    async def generate_text_stream(
+        self,
+        prompt: str,
+        max_tokens: int = 1000,
+        temperature: float = 0.7,
+        stop: Optional[List[str]] = None,
+        **kwargs: Any
+    ) -> AsyncIterator[str]:
+        """
+        流式生成
+        超限错误在收到第一个增量之前抛出，此时缩小请求重新开始；已经输出内容后的错误原样抛出
+        """
+        rebuild = kwargs.pop("overflow", None)
+        started = False
+        stream = self.model.generate_text_stream(
+            prompt=prompt,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            stop=stop,
+            **kwargs
+        )
+        try:
+            async for chunk in stream:
+                started = True
+                yield chunk
+            return
+        except TokenLimitError as e:
+            if started or rebuild is False:
+                raise
+            error = e
+        finally:
+            await stream.aclose()
+
+        task_type = get_task_type(kwargs)
+        prompt, max_tokens, strategy = await self.shrink(prompt, max_tokens, error, rebuild or None)
+        self._log(task_type, strategy, error, max_tokens)
+        stream = self.model.generate_text_stream(
+            prompt=prompt,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            stop=stop,
+            **kwargs
+        )
+        try:
+            async for chunk in stream:
+                yield chunk
+        except TokenLimitError:
+            self.stats.record(task_type, strategy, recovered=False)
+            raise
+        finally:
+            await stream.aclose()
+        self.stats.record(task_type, strategy, recovered=True)
@@ -120,6 +120,24 @@ COHERENCE_PROMPT = """
 3. 修改建议
 """
 
+# 内容质量检查
+QUALITY_CHECK_PROMPT = """
+请检查以下章节内容的文字质量：
+
+{content}
+
+检查要点：
+1. 语法
+2. 用词
+3. 句式结构
+4. 可读性
+
+请以JSON格式返回检查结果，包含：
+1. overall_score：总体评分（0-10）
+2. aspects：grammar、vocabulary、sentence_structure、readability各项的score和问题或建议
+3. improvement_suggestions：改进建议列表
+"""
+
 # 风格调整
 STYLE_PROMPT = """
 请将以下内容调整为{target_style}风格：
@@ -203,4 +221,21 @@ ENDING_PROMPT = """
 2. 完整的人物归宿
 3. 留下余味和思考
 4. 符合故事主题
-"""
\ No newline at end of file
+"""
+
+# 上下文摘要
+CONTEXT_SUMMARY_PROMPT = """
+请把以下小说创作资料压缩为不超过{max_tokens}个token的摘要，保留人物、关键情节和设定细节：
+
+{text}
+"""
+
+# 截断输出的续写
+CONTINUATION_PROMPT = """
+{prompt}
+
+你对上面请求的回答因长度限制被截断，已输出的部分如下：
+{partial}
+
+请从截断处继续输出剩余内容，不要重复已输出的部分，也不要添加任何说明。
+"""
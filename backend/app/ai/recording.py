@@ -0,0 +1,343 @@
+"""
+模型调用录制与回放
+录制模式把请求/响应对（含tokens_used和延迟）追加写入本地JSONL文件，
+回放模式从文件中读取并返回录制的结果，可以按录制时的耗时回放，也可以不等待直接返回。
+用于在真实的提示和响应规模下对AgentManager、CRUD和事件总线做基准测试
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import defaultdict, deque
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional
+
+from . import base
+from .base import (
+    BaseModelAdapter,
+    ModelAdapterWrapper,
+    ModelError,
+    ModelResponse,
+    set_stream_result,
+    strip_control_kwargs,
+)
+from .cache import make_cache_key
+
+logger = logging.getLogger(__name__)
+
+RECORD = "record"
+REPLAY = "replay"
+
+class CassetteMissError(ModelError):
+    """
+    回放时找不到对应的录制记录
+    """
+    pass
+
+class RecordingAdapter(ModelAdapterWrapper):
+    """
+    录制/回放模型适配器
+    mode为record时调用内部适配器并追加写入录制文件；
+    mode为replay时按请求内容查找录制记录，相同请求按录制顺序依次返回，
+    用完后重复最后一条。找不到记录时passthrough为True则调用内部适配器，否则抛出CassetteMissError。
+    time_scale为1时按录制的耗时等待，为0时立即返回
+    """
+
+    def __init__(
+        self,
+        model: BaseModelAdapter,
+        path: str,
+        mode: str = RECORD,
+        time_scale: float = 1.0,
+        passthrough: bool = False
+    ):
+        if mode not in (RECORD, REPLAY):
+            raise ValueError(f"不支持的录制模式: {mode}")
+        super().__init__(model)
+        self.path = path
+        self.mode = mode
+        self.time_scale = time_scale
+        self.passthrough = passthrough
+        self._entries: Dict[str, Deque[Dict[str, Any]]] = defaultdict(deque)
+        self._last: Dict[str, Dict[str, Any]] = {}
+        # 写文件在线程中进行，用锁保证并发调用的记录按完成顺序逐行写入
+        self._write_lock = asyncio.Lock()
+        self.hits = 0
+        self.misses = 0
+        if mode == REPLAY:
+            self.load()
+
+    def load(self) -> int:
+        """
+        读取录制文件，返回记录条数
+        只在创建适配器时同步读取一次，请求路径上不读文件
+        """
+        self._entries.clear()
+        self._last.clear()
+        count = 0
+        if not os.path.exists(self.path):
+            return count
+
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # 录制进程中断时最后一行可能不完整
+                    logger.warning(f"Skipping malformed cassette line in {self.path}")
+                    continue
+                self._entries[entry["key"]].append(entry)
+                count += 1
+        return count
+
+    async def _append(self, entry: Dict[str, Any]) -> None:
+        """
+        在线程中追加写入一条记录，不阻塞事件循环
+        """
+        async with self._write_lock:
+            await asyncio.to_thread(self._write_line, json.dumps(entry, ensure_ascii=False))
+
+    def _write_line(self, line: str) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+    def _key(self, kind: str, payload: Any, params: Dict[str, Any]) -> str:
+        return make_cache_key(self.model_name, json.dumps([kind, payload], ensure_ascii=False), params)
+
+    def _find(self, key: str) -> Optional[Dict[str, Any]]:
+        entries = self._entries.get(key)
+        if entries:
+            self._last[key] = entries.popleft()
+        entry = self._last.get(key)
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    async def _wait(self, seconds: float) -> None:
+        if self.time_scale > 0 and seconds > 0:
+            await asyncio.sleep(seconds * self.time_scale)
+
+    @staticmethod
+    def _error_entry(e: Exception) -> Dict[str, Any]:
+        return {
+            "type": type(e).__name__,
+            "message": str(e),
+            "model_name": getattr(e, "model_name", ""),
+            "error_code": getattr(e, "error_code", ""),
+            "error_type": getattr(e, "error_type", ""),
+        }
+
+    @staticmethod
+    def _raise_recorded(error: Dict[str, Any]) -> None:
+        """
+        重新抛出录制的模型错误，未知类型按ModelError抛出
+        """
+        error_class = getattr(base, error["type"], None)
+        if not (isinstance(error_class, type) and issubclass(error_class, ModelError)):
+            error_class = ModelError
+        raise error_class(
+            message=error["message"],
+            model_name=error["model_name"],
+            error_code=error["error_code"],
+            error_type=error["error_type"],
+            metadata={"replayed": True}
+        )
+
+    def _miss(self, kind: str) -> CassetteMissError:
+        return CassetteMissError(
+            message=f"No recorded {kind} call in {self.path}",
+            model_name=self.model_name,
+            error_code="cassette_miss",
+            error_type="replay"
+        )
+
+    async def _record_call(self, key: str, kind: str, request: Dict[str, Any], call) -> Any:
+        """
+        调用内部适配器并写入一条记录，错误也会被录制
+        """
+        started = time.monotonic()
+        entry: Dict[str, Any] = {"key": key, "kind": kind, "request": request}
+        try:
+            result = await call()
+        except ModelError as e:
+            entry["latency"] = time.monotonic() - started
+            entry["error"] = self._error_entry(e)
+            await self._append(entry)
+            raise
+
+        entry["latency"] = time.monotonic() - started
+        if isinstance(result, ModelResponse):
+            entry["response"] = result.to_dict()
+        else:
+            entry["response"] = result
+        await self._append(entry)
+        return result
+
+    async def _replay(self, key: str, kind: str) -> Optional[Dict[str, Any]]:
+        entry = self._find(key)
+        if entry is None:
+            if self.passthrough:
+                return None
+            raise self._miss(kind)
+
+        await self._wait(entry.get("latency", 0.0))
+        if "error" in entry:
+            self._raise_recorded(entry["error"])
+        return entry
+
+    async def generate_text(
+        self,
+        prompt: str,
+        max_tokens: int = 1000,
+        temperature: float = 0.7,
+        stop: Optional[List[str]] = None,
+        **kwargs: Any
+    ) -> ModelResponse:
+        params = {
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "stop": stop,
+            **strip_control_kwargs(kwargs),
+        }
+        key = self._key("generate_text", prompt, params)
+
+        async def call() -> ModelResponse:
+            return await self.model.generate_text(
+                prompt=prompt,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                stop=stop,
+                **kwargs
+            )
+
+        if self.mode == REPLAY:
+            entry = await self._replay(key, "generate_text")
+            if entry is not None:
+                response = ModelResponse.from_dict(entry["response"])
+                response.metadata["replayed"] = True
+                return response
+            return await call()
+
+        return await self._record_call(
+            key, "generate_text", {"prompt": prompt, **params}, call
+        )
+
+    async def generate_text_stream(
+        self,
+        prompt: str,
+        max_tokens: int = 1000,
+        temperature: float = 0.7,
+        stop: Optional[List[str]] = None,
+        **kwargs: Any
+    ) -> AsyncIterator[str]:
+        params = {
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "stop": stop,
+            **strip_control_kwargs(kwargs),
+        }
+        key = self._key("generate_text_stream", prompt, params)
+        # 录制时需要拿到流结束时的finish_reason，调用方没有传入stream_result时自己接收
+        result = kwargs.get("stream_result")
+        if result is None:
+            result = kwargs["stream_result"] = {}
+
+        def stream() -> AsyncIterator[str]:
+            return self.model.generate_text_stream(
+                prompt=prompt,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                stop=stop,
+                **kwargs
+            )
+
+        if self.mode == REPLAY:
+            entry = self._find(key)
+            if entry is None:
+                if not self.passthrough:
+                    raise self._miss("generate_text_stream")
+                async for chunk in stream():
+                    yield chunk
+                return
+
+            # 按录制的到达时间逐块回放
+            elapsed = 0.0
+            for chunk, offset in zip(entry["response"], entry.get("offsets", [])):
+                await self._wait(offset - elapsed)
+                elapsed = offset
+                yield chunk
+            if "error" in entry:
+                await self._wait(entry.get("latency", 0.0) - elapsed)
+                self._raise_recorded(entry["error"])
+            set_stream_result(kwargs, finish_reason=entry.get("finish_reason"))
+            return
+
+        # 录制每个片段相对请求开始的时间，只有完整读完的流才写入文件
+        started = time.monotonic()
+        chunks: List[str] = []
+        offsets: List[float] = []
+        entry: Dict[str, Any] = {
+            "key": key,
+            "kind": "generate_text_stream",
+            "request": {"prompt": prompt, **params},
+        }
+        completed = False
+        try:
+            async for chunk in stream():
+                chunks.append(chunk)
+                offsets.append(time.monotonic() - started)
+                yield chunk
+            completed = True
+        except ModelError as e:
+            entry["error"] = self._error_entry(e)
+            raise
+        finally:
+            if completed or "error" in entry:
+                entry.update(
+                    latency=time.monotonic() - started,
+                    response=chunks,
+                    offsets=offsets,
+                    finish_reason=result.get("finish_reason")
+                )
+                await self._append(entry)
+
+    async def generate_embedding(self, text: str) -> List[float]:
+        key = self._key("generate_embedding", text, {})
+
+        async def call() -> List[float]:
+            return await self.model.generate_embedding(text)
+
+        if self.mode == REPLAY:
+            entry = await self._replay(key, "generate_embedding")
+            return entry["response"] if entry is not None else await call()
+        return await self._record_call(key, "generate_embedding", {"text": text}, call)
+
+    async def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        key = self._key("embed_batch", texts, {})
+
+        async def call() -> List[List[float]]:
+            return await self.model._embed_batch(texts)
+
+        if self.mode == REPLAY:
+            entry = await self._replay(key, "embed_batch")
+            return entry["response"] if entry is not None else await call()
+        return await self._record_call(key, "embed_batch", {"texts": texts}, call)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        回放命中统计
+        """
+        return {
+            "mode": self.mode,
+            "path": self.path,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
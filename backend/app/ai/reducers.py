@@ -0,0 +1,157 @@
+"""
+结果归并
+把同一调用在多个文本块上的结果合并为一个结果，供map-reduce和merge_generations使用。
+内置：concat、first、longest、shortest、vote（多数表决）、average（平均分）、
+max_risk（取最高风险）、union（去重合并列表）
+"""
+import json
+from collections import Counter
+from typing import Any, Callable, Dict, List, Union
+
+Reducer = Callable[[List[Any]], Any]
+
+def _concat(values: List[Any]) -> Any:
+    if all(isinstance(v, list) for v in values):
+        return [item for value in values for item in value]
+    return "\n".join(str(v) for v in values)
+
+def _first(values: List[Any]) -> Any:
+    return values[0] if values else ""
+
+def _longest(values: List[Any]) -> Any:
+    return max(values, key=len) if values else ""
+
+def _shortest(values: List[Any]) -> Any:
+    return min(values, key=len) if values else ""
+
+def _vote(values: List[Any]) -> Any:
+    """
+    多数表决，票数相同时取先出现的值
+    值为{标签: 概率}时每块投给概率最高的标签，返回各标签的得票比例
+    """
+    if not values:
+        return None
+    if all(isinstance(v, dict) and v for v in values) and all(
+        _is_number(x) for v in values for x in v.values()
+    ):
+        labels = {label: 0.0 for value in values for label in value}
+        for value in values:
+            labels[max(value, key=value.get)] += 1
+        return {label: count / len(values) for label, count in labels.items()}
+
+    counts = Counter(_hashable(v) for v in values)
+    winner = max(counts.values())
+    return next(v for v in values if counts[_hashable(v)] == winner)
+
+def _average(values: List[Any]) -> Any:
+    """
+    数值取平均；字典按键递归合并；列表拼接；其他类型取第一个
+    """
+    values = [v for v in values if v is not None]
+    if not values:
+        return None
+    if all(_is_number(v) for v in values):
+        return sum(values) / len(values)
+    if all(isinstance(v, dict) for v in values):
+        return _merge_dicts(values, _average)
+    if all(isinstance(v, list) for v in values):
+        return _concat(values)
+    return values[0]
+
+def _max_risk(values: List[Any]) -> Any:
+    """
+    取各块中最高的风险：任一块不安全则不安全（is_safe、safe等"安全"字段取与，
+    其他布尔字段取或），数值取最大，字典按键递归合并，列表去重合并
+    """
+    values = [v for v in values if v is not None]
+    if not values:
+        return None
+    if all(isinstance(v, bool) for v in values):
+        return any(values)
+    if all(_is_number(v) for v in values):
+        return max(values)
+    if all(isinstance(v, dict) for v in values):
+        merged: Dict[str, Any] = {}
+        for key in _keys(values):
+            present = [v[key] for v in values if key in v]
+            if all(isinstance(p, bool) for p in present) and "safe" in key.lower():
+                merged[key] = all(present)
+            else:
+                merged[key] = _max_risk(present)
+        return merged
+    if all(isinstance(v, list) for v in values):
+        return _union(values)
+    return values[0]
+
+def _union(values: List[Any]) -> List[Any]:
+    """
+    合并列表并去重，出现次数多的排在前面，次数相同时保持先出现的顺序
+    """
+    counts: Counter = Counter()
+    first_seen: Dict[Any, Any] = {}
+    for value in values:
+        for item in value or []:
+            key = _hashable(item)
+            counts[key] += 1
+            first_seen.setdefault(key, item)
+    order = {key: index for index, key in enumerate(first_seen)}
+    return [first_seen[key] for key in sorted(first_seen, key=lambda k: (-counts[k], order[k]))]
+
+def _merge_dicts(values: List[Dict[str, Any]], reducer: Reducer) -> Dict[str, Any]:
+    return {
+        key: reducer([v[key] for v in values if key in v])
+        for key in _keys(values)
+    }
+
+def _keys(values: List[Dict[str, Any]]) -> List[str]:
+    keys: Dict[str, None] = {}
+    for value in values:
+        keys.update(dict.fromkeys(value))
+    return list(keys)
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def _hashable(value: Any) -> Any:
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, sort_keys=True, ensure_ascii=False, default=str)
+    return value
+
+REDUCERS: Dict[str, Reducer] = {
+    "concat": _concat,
+    "first": _first,
+    "longest": _longest,
+    "shortest": _shortest,
+    "vote": _vote,
+    "average": _average,
+    "max_risk": _max_risk,
+    "union": _union,
+}
+
+def register_reducer(name: str, reducer: Reducer) -> None:
+    """
+    注册自定义归并方式
+    """
+    REDUCERS[name] = reducer
+
+def get_reducer(reducer: Union[str, Reducer]) -> Reducer:
+    """
+    按名称获取归并函数，传入函数时原样返回
+    """
+    if callable(reducer):
+        return reducer
+    if reducer not in REDUCERS:
+        raise ValueError(f"不支持的归并方式: {reducer}")
+    return REDUCERS[reducer]
+
+def by_key(reducers: Dict[str, Union[str, Reducer]], default: Union[str, Reducer] = "first") -> Reducer:
+    """
+    按字段分别归并字典结果，如组合分析中各分析项使用不同的归并方式
+    """
+    def reduce(values: List[Dict[str, Any]]) -> Dict[str, Any]:
+        values = [v for v in values if isinstance(v, dict)]
+        return {
+            key: get_reducer(reducers.get(key, default))([v[key] for v in values if key in v])
+            for key in _keys(values)
+        }
+    return reduce
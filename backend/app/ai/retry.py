@@ -0,0 +1,218 @@
+"""
+重试策略
+按ModelError.error_type决定是否重试以及重试次数：限流、超时和服务端错误可以重试，
+token超限、无效请求、认证失败等永远不会成功的错误立即抛出。
+退避时间优先使用供应商返回的Retry-After，否则使用带抖动的指数退避；
+所有重试共享进程级的重试预算，重试次数不超过请求数的一定比例，避免故障时放大流量
+"""
+import asyncio
+import functools
+import logging
+import random
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Deque, Dict, Mapping, Optional, TypeVar
+
+from .base import ModelError
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+@dataclass
+class RetryRule:
+    """
+    一类错误的重试规则
+    max_attempts：包括第一次调用在内的最大调用次数；
+    base_delay/max_delay：指数退避的初始值和上限（秒），实际等待时间在[0, 退避值]之间随机（full jitter）
+    """
+    max_attempts: int = 3
+    base_delay: float = 1.0
+    max_delay: float = 30.0
+
+    def backoff(self, attempt: int) -> float:
+        """
+        第attempt次调用失败后的退避时间
+        """
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+# 默认按错误类型配置，未列出的错误类型（token_limit、invalid_request、authentication、
+# content_filter、circuit_open等）不重试
+DEFAULT_RETRY_RULES: Dict[str, RetryRule] = {
+    "rate_limit": RetryRule(max_attempts=4, base_delay=1.0, max_delay=30.0),
+    "timeout": RetryRule(max_attempts=2, base_delay=0.5, max_delay=5.0),
+    "api_error": RetryRule(max_attempts=3, base_delay=1.0, max_delay=20.0),
+}
+
+# 无论错误类型如何都不重试的错误码
+NON_RETRYABLE_CODES = {"invalid_request", "token_limit_exceeded"}
+
+def parse_retry_after(headers: Optional[Mapping[str, Any]]) -> Optional[float]:
+    """
+    从响应头解析服务端建议的等待秒数（retry-after-ms或retry-after），没有或无法解析时返回None
+    """
+    if not headers:
+        return None
+    lowered = {str(key).lower(): value for key, value in headers.items()}
+    for name, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        value = lowered.get(name)
+        if value is None:
+            continue
+        try:
+            return max(0.0, float(value) * scale)
+        except (TypeError, ValueError):
+            continue
+    return None
+
+class RetryBudget:
+    """
+    进程级重试预算
+    window秒内的重试次数不超过同期请求数的ratio倍，另有min_retries次的余量，保证低流量时也能重试
+    """
+
+    def __init__(self, ratio: float = 0.1, min_retries: int = 10, window: float = 60.0):
+        self.ratio = ratio
+        self.min_retries = min_retries
+        self.window = window
+        self._requests: Deque[float] = deque()
+        self._retries: Deque[float] = deque()
+        self.requests = 0
+        self.retries = 0
+        self.denied = 0
+        self.retries_by_type: Dict[str, int] = {}
+        self.not_retryable_by_type: Dict[str, int] = {}
+        self.exhausted_by_type: Dict[str, int] = {}
+
+    def _trim(self, now: float) -> None:
+        cutoff = now - self.window
+        for samples in (self._requests, self._retries):
+            while samples and samples[0] < cutoff:
+                samples.popleft()
+
+    def record_request(self) -> None:
+        now = time.monotonic()
+        self._trim(now)
+        self._requests.append(now)
+        self.requests += 1
+
+    def try_retry(self, error_type: str) -> bool:
+        """
+        预留一次重试，预算不足时返回False
+        """
+        now = time.monotonic()
+        self._trim(now)
+        if len(self._retries) >= len(self._requests) * self.ratio + self.min_retries:
+            self.denied += 1
+            return False
+        self._retries.append(now)
+        self.retries += 1
+        self.retries_by_type[error_type] = self.retries_by_type.get(error_type, 0) + 1
+        return True
+
+    def record_not_retryable(self, error_type: str) -> None:
+        self.not_retryable_by_type[error_type] = self.not_retryable_by_type.get(error_type, 0) + 1
+
+    def record_exhausted(self, error_type: str) -> None:
+        self.exhausted_by_type[error_type] = self.exhausted_by_type.get(error_type, 0) + 1
+
+    def stats(self) -> Dict[str, Any]:
+        self._trim(time.monotonic())
+        return {
+            "requests": self.requests,
+            "retries": self.retries,
+            "denied": self.denied,
+            "window_requests": len(self._requests),
+            "window_retries": len(self._retries),
+            "retries_by_type": dict(self.retries_by_type),
+            "not_retryable_by_type": dict(self.not_retryable_by_type),
+            "exhausted_by_type": dict(self.exhausted_by_type),
+        }
+
+class RetryPolicy:
+    """
+    重试策略
+    rules按错误类型配置重试规则；服务端要求等待超过max_retry_after秒时不再重试，
+    直接抛出错误由路由器切换到备用模型
+    """
+
+    def __init__(
+        self,
+        rules: Optional[Dict[str, RetryRule]] = None,
+        budget: Optional[RetryBudget] = None,
+        max_retry_after: float = 60.0
+    ):
+        self.rules = DEFAULT_RETRY_RULES if rules is None else rules
+        self.budget = budget or retry_budget
+        self.max_retry_after = max_retry_after
+
+    def next_delay(self, error: Exception, attempt: int) -> Optional[float]:
+        """
+        第attempt次调用失败后应等待的秒数，不应重试时返回None
+        """
+        if not isinstance(error, ModelError):
+            return None
+        rule = self.rules.get(error.error_type)
+        if rule is None or error.error_code in NON_RETRYABLE_CODES:
+            self.budget.record_not_retryable(error.error_type)
+            return None
+        if attempt >= rule.max_attempts:
+            self.budget.record_exhausted(error.error_type)
+            return None
+
+        retry_after = error.metadata.get("retry_after")
+        if retry_after is not None and retry_after > self.max_retry_after:
+            self.budget.record_exhausted(error.error_type)
+            return None
+        if not self.budget.try_retry(error.error_type):
+            return None
+        return retry_after if retry_after is not None else rule.backoff(attempt)
+
+    async def run(self, call: Callable[[], Awaitable[T]]) -> T:
+        """
+        执行调用，按规则重试
+        """
+        self.budget.record_request()
+        attempt = 1
+        while True:
+            try:
+                return await call()
+            except Exception as e:
+                delay = self.next_delay(e, attempt)
+                if delay is None:
+                    raise
+                logger.info(
+                    f"Retrying after {type(e).__name__} ({e.error_type}) in {delay:.2f}s, attempt {attempt}"
+                )
+            await asyncio.sleep(delay)
+            attempt += 1
+
+def with_retry(method: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+    """
+    适配器方法的重试装饰器，使用适配器的retry_policy
+    """
+    @functools.wraps(method)
+    async def wrapper(self: Any, *args: Any, **kwargs: Any) -> T:
+        return await self.retry_policy.run(lambda: method(self, *args, **kwargs))
+    return wrapper
+
+def build_retry_policy(overrides: Optional[Dict[str, Optional[Dict[str, Any]]]] = None) -> RetryPolicy:
+    """
+    在默认规则上应用按错误类型的配置（如ModelConfig.extra_params.retry），值为None时不重试该类错误；
+    max_retry_after键设置服务端等待时间的上限
+    """
+    overrides = dict(overrides or {})
+    max_retry_after = overrides.pop("max_retry_after", 60.0)
+    rules = dict(DEFAULT_RETRY_RULES)
+    for error_type, options in overrides.items():
+        if options is None:
+            rules.pop(error_type, None)
+        else:
+            rules[error_type] = RetryRule(**options)
+    return RetryPolicy(rules, max_retry_after=max_retry_after)
+
+# 全局重试预算，所有模型适配器共享
+retry_budget = RetryBudget()
+
+# 默认重试策略
+default_retry_policy = RetryPolicy()
@@ -0,0 +1,330 @@
+"""
+语义缓存
+对允许近似复用结果的任务（关键词提取、文本分类等），按提示的嵌入向量在本地索引中查找
+之前的相似提示，相似度超过该任务类型的阈值时直接返回缓存的响应。
+只有显式配置了任务类型的调用才会使用，默认不启用
+"""
+import asyncio
+import logging
+import math
+import operator
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from .base import (
+    BaseModelAdapter,
+    ModelAdapterWrapper,
+    ModelResponse,
+    get_task_type,
+    request_key_params,
+)
+from .cache import make_cache_key
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+
+def normalize_prompt(prompt: str) -> str:
+    """
+    合并连续空白，只有空白差异的提示规范化后相同
+    """
+    return _WHITESPACE.sub(" ", prompt).strip()
+
+def _unit(vector: List[float]) -> List[float]:
+    norm = math.sqrt(sum(x * x for x in vector))
+    return [x / norm for x in vector] if norm else list(vector)
+
+@dataclass
+class SemanticCachePolicy:
+    """
+    任务类型的语义缓存策略
+    threshold为命中所需的最小余弦相似度，ttl为缓存条目的有效期（秒）；
+    规范化后短于min_prompt_length个字符的提示只做精确匹配，不为其生成嵌入向量
+    （短文本的相似度不可靠，未命中时嵌入调用是纯额外开销）
+    """
+    threshold: float = 0.95
+    ttl: float = 24 * 3600
+    min_prompt_length: int = 32
+
+# 默认启用语义缓存的任务类型：这两类任务对提示的细微差异不敏感，近似复用可以接受
+DEFAULT_SEMANTIC_CACHE_POLICIES: Dict[str, SemanticCachePolicy] = {
+    "extract_keywords": SemanticCachePolicy(threshold=0.95),
+    "classify_text": SemanticCachePolicy(threshold=0.97),
+}
+
+def _best_match(
+    query: List[float],
+    candidates: List[Tuple[int, List[float]]],
+    threshold: float
+) -> Optional[Tuple[int, float]]:
+    """
+    返回相似度不低于threshold的最相似条目(条目id, 相似度)
+    """
+    best_id, best_score = None, threshold
+    for entry_id, vector in candidates:
+        score = sum(map(operator.mul, query, vector))
+        if score >= best_score:
+            best_id, best_score = entry_id, score
+    return None if best_id is None else (best_id, best_score)
+
+@dataclass
+class _Entry:
+    partition: str
+    prompt: str
+    vector: List[float]
+    value: Dict[str, Any]
+    expires_at: float
+
+class SemanticCache:
+    """
+    本地语义缓存索引
+    条目按模型、任务类型和采样参数分区，分区内对单位向量线性扫描（在线程中进行，不阻塞事件循环）；
+    规范化后完全相同的提示不需要计算相似度。
+    总条目数超过max_entries或单个分区超过max_partition_entries时淘汰最久未命中的条目，
+    过期条目在查询和写入时清理
+    """
+
+    def __init__(self, max_entries: int = 2000, max_partition_entries: int = 500):
+        self.max_entries = max_entries
+        self.max_partition_entries = max_partition_entries
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._partitions: Dict[str, Dict[int, _Entry]] = {}
+        self._exact: Dict[Tuple[str, str], int] = {}
+        self._next_id = 0
+        self.hits = 0
+        self.exact_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.embedding_calls = 0
+        self.short_prompts = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get_exact(self, partition: str, prompt: str) -> Optional[Dict[str, Any]]:
+        """
+        查找规范化后相同的提示
+        """
+        entry_id = self._exact.get((partition, prompt))
+        if entry_id is None:
+            return None
+        entry = self._entries[entry_id]
+        if entry.expires_at <= time.time():
+            self._remove(entry_id)
+            return None
+        self._touch(entry_id)
+        self.exact_hits += 1
+        return entry.value
+
+    async def search(
+        self,
+        partition: str,
+        vector: List[float],
+        threshold: float
+    ) -> Optional[Tuple[float, Dict[str, Any]]]:
+        """
+        查找分区内相似度不低于threshold的最相似条目，返回(相似度, 缓存值)
+        相似度计算在线程中对分区快照进行，索引的修改都在事件循环中完成
+        """
+        now = time.time()
+        candidates = []
+        for entry_id, entry in list(self._partitions.get(partition, {}).items()):
+            if entry.expires_at <= now:
+                self._remove(entry_id)
+            elif entry.vector:
+                candidates.append((entry_id, entry.vector))
+
+        best = None
+        if candidates:
+            best = await asyncio.to_thread(_best_match, _unit(vector), candidates, threshold)
+        # 扫描期间条目可能已被淘汰
+        if best is None or best[0] not in self._entries:
+            self.misses += 1
+            return None
+        best_id, best_score = best
+        self._touch(best_id)
+        self.hits += 1
+        return best_score, self._entries[best_id].value
+
+    def _touch(self, entry_id: int) -> None:
+        """
+        把条目标记为最近命中（全局和分区内都移到末尾）
+        """
+        self._entries.move_to_end(entry_id)
+        entry = self._entries[entry_id]
+        partition = self._partitions[entry.partition]
+        partition[entry_id] = partition.pop(entry_id)
+
+    def add(
+        self,
+        partition: str,
+        prompt: str,
+        vector: Optional[List[float]],
+        response: ModelResponse,
+        ttl: float
+    ) -> None:
+        """
+        写入缓存条目，vector为None时条目只参与精确匹配
+        """
+        previous = self._exact.get((partition, prompt))
+        if previous is not None:
+            self._remove(previous)
+
+        entry_id = self._next_id
+        self._next_id += 1
+        entry = _Entry(
+            partition, prompt, _unit(vector) if vector else [], response.to_dict(), time.time() + ttl
+        )
+        self._entries[entry_id] = entry
+        entries = self._partitions.setdefault(partition, {})
+        entries[entry_id] = entry
+        self._exact[(partition, prompt)] = entry_id
+
+        # 分区内按最近命中排序，先淘汰分区内最久未命中的条目，限制单次查询的扫描量
+        while len(entries) > self.max_partition_entries:
+            self._remove(next(iter(entries)))
+            self.evictions += 1
+        while len(self._entries) > self.max_entries:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, entry_id: int) -> None:
+        entry = self._entries.pop(entry_id, None)
+        if entry is None:
+            return
+        partition = self._partitions.get(entry.partition)
+        if partition is not None:
+            partition.pop(entry_id, None)
+            if not partition:
+                del self._partitions[entry.partition]
+        if self._exact.get((entry.partition, entry.prompt)) == entry_id:
+            del self._exact[(entry.partition, entry.prompt)]
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._partitions.clear()
+        self._exact.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取命中统计
+        """
+        total_hits = self.hits + self.exact_hits
+        total = total_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "exact_hits": self.exact_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "embedding_calls": self.embedding_calls,
+            "short_prompts": self.short_prompts,
+            "hit_rate": total_hits / total if total else 0.0,
+        }
+
+class SemanticCacheAdapter(ModelAdapterWrapper):
+    """
+    带语义缓存的模型适配器
+    只对policies中配置了的任务类型（见get_task_type）且温度不高于max_temperature的调用生效，
+    调用时传入use_cache=False可以跳过。提示的嵌入向量由embedding_model生成，默认使用被包装的模型
+    """
+
+    def __init__(
+        self,
+        model: BaseModelAdapter,
+        cache: "SemanticCache",
+        policies: Optional[Dict[str, SemanticCachePolicy]] = None,
+        embedding_model: Optional[BaseModelAdapter] = None,
+        max_temperature: float = 0.3
+    ):
+        super().__init__(model)
+        self.cache = cache
+        self.policies = DEFAULT_SEMANTIC_CACHE_POLICIES if policies is None else policies
+        self.embedding_model = embedding_model or model
+        self.max_temperature = max_temperature
+
+    async def generate_text(
+        self,
+        prompt: str,
+        max_tokens: int = 1000,
+        temperature: float = 0.7,
+        stop: Optional[List[str]] = None,
+        **kwargs: Any
+    ) -> ModelResponse:
+        task_type = get_task_type(kwargs)
+        policy = self.policies.get(task_type)
+        call_kwargs = dict(
+            prompt=prompt,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            stop=stop,
+            **kwargs
+        )
+        if (
+            policy is None
+            or not kwargs.get("use_cache", True)
+            or temperature > self.max_temperature
+        ):
+            return await self.model.generate_text(**call_kwargs)
+
+        partition = make_cache_key(
+            self.model_name,
+            task_type,
+            request_key_params(max_tokens, temperature, stop, kwargs)
+        )
+        normalized = normalize_prompt(prompt)
+        value = self.cache.get_exact(partition, normalized)
+        if value is not None:
+            return self._cached_response(value, 1.0)
+        if len(normalized) < policy.min_prompt_length:
+            self.cache.short_prompts += 1
+            response = await self.model.generate_text(**call_kwargs)
+            self.cache.add(partition, normalized, None, response, policy.ttl)
+            return response
+
+        # 每次未精确命中都需要一次嵌入调用，计入统计以便与节省的生成调用对比
+        self.cache.embedding_calls += 1
+        try:
+            vector = await self.embedding_model.generate_embedding(normalized)
+        except Exception as e:
+            # 嵌入失败不影响正常调用，只是不使用语义缓存
+            logger.warning(f"Semantic cache embedding failed: {e}")
+            return await self.model.generate_text(**call_kwargs)
+
+        found = await self.cache.search(partition, vector, policy.threshold)
+        if found is not None:
+            return self._cached_response(found[1], found[0])
+
+        response = await self.model.generate_text(**call_kwargs)
+        self.cache.add(partition, normalized, vector, response, policy.ttl)
+        return response
+
+    @staticmethod
+    def _cached_response(value: Dict[str, Any], similarity: float) -> ModelResponse:
+        # 命中缓存不消耗token
+        response = ModelResponse.from_dict(value)
+        response.metadata["semantic_cache"] = {"similarity": round(similarity, 4)}
+        response.metadata["cached_tokens"] = response.tokens_used
+        response.tokens_used = 0
+        return response
+
+def build_semantic_cache_policies(
+    overrides: Optional[Dict[str, Dict[str, Any]]] = None
+) -> Dict[str, SemanticCachePolicy]:
+    """
+    在默认策略上应用按任务类型的配置，值为None时关闭该任务类型
+    """
+    policies = dict(DEFAULT_SEMANTIC_CACHE_POLICIES)
+    for task_type, options in (overrides or {}).items():
+        if options is None:
+            policies.pop(task_type, None)
+        else:
+            policies[task_type] = SemanticCachePolicy(**options)
+    return policies
+
+# 全局语义缓存实例，条目按模型分区
+semantic_cache = SemanticCache()
@@ -0,0 +1,137 @@
+"""
+相同请求合并（single-flight）
+同一时刻发起的多个相同的确定性调用只向上游发送一次请求，其余调用共享结果
+"""
+import asyncio
+import copy
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from .base import (
+    BaseModelAdapter,
+    ModelAdapterWrapper,
+    ModelResponse,
+    request_key_params,
+)
+from .cache import make_cache_key
+
+logger = logging.getLogger(__name__)
+
+class SingleFlight:
+    """
+    按key合并并发调用
+    第一个调用者发起请求，请求完成前到达的相同key的调用等待同一个结果
+    """
+
+    def __init__(self):
+        self._inflight: Dict[str, "asyncio.Future[Any]"] = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    async def do(
+        self,
+        key: str,
+        func: Callable[[], Awaitable[Any]]
+    ) -> Tuple[Any, bool]:
+        """
+        执行调用，返回(结果, 是否为合并的调用)
+        上游请求在独立的任务中执行，某个调用者被取消不会影响其他调用者
+        """
+        self.calls += 1
+        future = self._inflight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            return await asyncio.shield(future), True
+
+        future = asyncio.ensure_future(func())
+        self._inflight[key] = future
+        future.add_done_callback(lambda _: self._forget(key, future))
+        return await asyncio.shield(future), False
+
+    def _forget(self, key: str, future: "asyncio.Future[Any]") -> None:
+        if self._inflight.get(key) is future:
+            del self._inflight[key]
+        if not future.cancelled():
+            # 取出异常，避免所有调用者都已取消时出现未获取异常的警告
+            future.exception()
+
+    @property
+    def inflight(self) -> int:
+        return len(self._inflight)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取合并统计
+        """
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "inflight": self.inflight,
+            "coalesce_rate": self.coalesced / self.calls if self.calls else 0.0,
+        }
+
+    def reset_stats(self) -> None:
+        """
+        重置统计
+        """
+        self.calls = 0
+        self.coalesced = 0
+
+class SingleFlightAdapter(ModelAdapterWrapper):
+    """
+    合并相同请求的模型适配器
+    只合并温度不高于max_temperature的generate_text调用，调用时传入coalesce=False可以跳过
+    """
+
+    def __init__(
+        self,
+        model: BaseModelAdapter,
+        group: Optional[SingleFlight] = None,
+        max_temperature: float = 0.3
+    ):
+        super().__init__(model)
+        self.group = group or request_coalescer
+        self.max_temperature = max_temperature
+
+    async def generate_text(
+        self,
+        prompt: str,
+        max_tokens: int = 1000,
+        temperature: float = 0.7,
+        stop: Optional[List[str]] = None,
+        **kwargs: Any
+    ) -> ModelResponse:
+        coalesce = kwargs.pop("coalesce", True)
+
+        async def call() -> ModelResponse:
+            return await self.model.generate_text(
+                prompt=prompt,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                stop=stop,
+                **kwargs
+            )
+
+        if not coalesce or temperature > self.max_temperature:
+            return await call()
+
+        key = make_cache_key(
+            self.model_name,
+            prompt,
+            request_key_params(max_tokens, temperature, stop, kwargs)
+        )
+        response, coalesced = await self.group.do(key, call)
+
+        # 每个调用者拿到独立的副本，上层修改metadata时互不影响
+        shared = copy.deepcopy(response)
+        if not coalesced:
+            return shared
+
+        # 合并的调用不重复计算token
+        shared.metadata["coalesced"] = True
+        shared.metadata["coalesced_tokens"] = shared.tokens_used
+        shared.tokens_used = 0
+        return shared
+
+# 全局请求合并实例，所有模型共享统计
+request_coalescer = SingleFlight()
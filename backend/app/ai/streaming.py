@@ -0,0 +1,145 @@
+"""
+任务流式输出中转
+Agent在生成过程中把增量文本发布到这里，SSE端点从这里订阅并转发给前端
+"""
+import asyncio
+import logging
+from typing import AsyncIterator, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 会把生成过程发布到任务流的任务类型，其他任务没有流式输出
+STREAMING_TASK_TYPES = {"generate_content"}
+
+class TaskStream:
+    """
+    单个任务的流式输出通道
+    缓存已产生的片段，晚到的订阅者可以从头回放
+    """
+
+    def __init__(self, task_id: int):
+        self.task_id = task_id
+        self.chunks: List[str] = []
+        self.closed = False
+        self.cancelled = False
+        self.error: Optional[str] = None
+        self._condition = asyncio.Condition()
+
+    async def publish(self, chunk: str) -> None:
+        """
+        追加一个文本片段并唤醒订阅者
+        """
+        async with self._condition:
+            self.chunks.append(chunk)
+            self._condition.notify_all()
+
+    async def close(self, error: Optional[str] = None) -> None:
+        """
+        结束输出，重复关闭时保留第一次的结果
+        """
+        async with self._condition:
+            if self.closed:
+                return
+            self.closed = True
+            self.error = error
+            self._condition.notify_all()
+
+    async def subscribe(self) -> AsyncIterator[str]:
+        """
+        订阅输出，依次返回所有片段直到通道关闭
+        """
+        position = 0
+        while True:
+            async with self._condition:
+                await self._condition.wait_for(
+                    lambda: position < len(self.chunks) or self.closed
+                )
+                pending = self.chunks[position:]
+                position = len(self.chunks)
+                finished = self.closed
+
+            for chunk in pending:
+                yield chunk
+
+            if finished:
+                return
+
+class TaskStreamBroker:
+    """
+    任务流式输出管理器
+    仅在当前进程内有效，适用于由API进程后台执行的任务
+    """
+
+    def __init__(self, max_closed_streams: int = 100):
+        self._streams: Dict[int, TaskStream] = {}
+        # 已结束的通道保留一段时间供晚到的订阅者回放
+        self.max_closed_streams = max_closed_streams
+
+    def open(self, task_id: int) -> TaskStream:
+        """
+        为任务创建输出通道，已存在时直接返回
+        """
+        stream = self._streams.get(task_id)
+        if stream is None or stream.closed:
+            self._prune()
+            stream = TaskStream(task_id)
+            self._streams[task_id] = stream
+        return stream
+
+    def _prune(self) -> None:
+        """
+        清理超出保留数量的已结束通道（按创建顺序）
+        """
+        closed = [task_id for task_id, s in self._streams.items() if s.closed]
+        for task_id in closed[:max(0, len(closed) - self.max_closed_streams + 1)]:
+            del self._streams[task_id]
+
+    def get(self, task_id: int) -> Optional[TaskStream]:
+        """
+        获取任务的输出通道
+        """
+        return self._streams.get(task_id)
+
+    async def publish(self, task_id: int, chunk: str) -> None:
+        """
+        发布文本片段
+        """
+        await self.open(task_id).publish(chunk)
+
+    async def close(self, task_id: int, error: Optional[str] = None) -> None:
+        """
+        关闭任务的输出通道
+        """
+        stream = self._streams.get(task_id)
+        if stream is not None:
+            await stream.close(error)
+
+    def cancel(self, task_id: int) -> bool:
+        """
+        请求取消正在生成的任务
+        生成方在下一个片段到达时检测到取消并关闭上游请求
+        """
+        stream = self._streams.get(task_id)
+        if stream is None or stream.closed:
+            return False
+        stream.cancelled = True
+        logger.info(f"Task {task_id} stream cancellation requested")
+        return True
+
+    def is_cancelled(self, task_id: int) -> bool:
+        """
+        检查任务是否已被取消
+        """
+        stream = self._streams.get(task_id)
+        return stream is not None and stream.cancelled
+
+    def discard(self, task_id: int) -> None:
+        """
+        丢弃已结束的输出通道
+        """
+        stream = self._streams.get(task_id)
+        if stream is not None and stream.closed:
+            del self._streams[task_id]
+
+# 全局任务流管理器实例
+task_stream_broker = TaskStreamBroker()
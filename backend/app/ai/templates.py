@@ -0,0 +1,188 @@
+"""
+提示模板注册表
+每个模板只解析一次：记录需要的变量和静态文本的token数，
+渲染时直接拼接片段，估算渲染后token数时不必重新对静态部分分词
+"""
+import threading
+from collections import OrderedDict
+from string import Formatter
+from types import ModuleType
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
+
+from .tokenizer import tokenizer_registry
+
+# 片段：(静态文本, 变量名, 转换符, 格式说明)，变量名为None表示只有静态文本
+_Segment = Tuple[str, Optional[str], Optional[str], str]
+
+class PromptTemplate:
+    """
+    预编译的提示模板
+    支持str.format的语法（含{{}}转义、属性访问和格式说明），只在创建时解析一次
+    """
+
+    def __init__(self, template: str, name: Optional[str] = None):
+        self.template = template
+        self.name = name
+        self._segments: List[_Segment] = []
+        variables = []
+        for literal, field_name, format_spec, conversion in Formatter().parse(template):
+            if field_name == "":
+                raise ValueError(f"提示模板{name or ''}不支持位置参数")
+            self._segments.append((literal, field_name, conversion, format_spec or ""))
+            if field_name is not None:
+                variables.append(_root_name(field_name))
+        self.variables: FrozenSet[str] = frozenset(variables)
+        # 变量在模板中出现的次数，估算token数时按次数计
+        self._occurrences: Dict[str, int] = {}
+        for variable in variables:
+            self._occurrences[variable] = self._occurrences.get(variable, 0) + 1
+        self._static_text = "".join(segment[0] for segment in self._segments)
+        self._static_tokens: Dict[str, int] = {}
+
+    def static_tokens(self, model: str = "gpt-4") -> int:
+        """
+        静态文本的token数，每个模型只计算一次
+        """
+        count = self._static_tokens.get(model)
+        if count is None:
+            count = tokenizer_registry.count(self._static_text, model)
+            self._static_tokens[model] = count
+        return count
+
+    def missing_variables(self, variables: Dict[str, Any]) -> List[str]:
+        """
+        返回缺失的变量列表
+        """
+        return sorted(self.variables.difference(variables))
+
+    def render(self, **kwargs: Any) -> str:
+        """
+        渲染模板，缺少变量时抛出KeyError
+        """
+        missing = self.missing_variables(kwargs)
+        if missing:
+            raise KeyError(f"提示模板缺少变量: {', '.join(missing)}")
+
+        parts: List[str] = []
+        for literal, field_name, conversion, format_spec in self._segments:
+            parts.append(literal)
+            if field_name is None:
+                continue
+            if field_name in kwargs and conversion is None and not format_spec:
+                value = kwargs[field_name]
+                parts.append(value if isinstance(value, str) else str(value))
+            else:
+                # 属性访问、转换符和格式说明交给str.format处理
+                parts.append(self._format_field(field_name, conversion, format_spec, kwargs))
+        return "".join(parts)
+
+    @staticmethod
+    def _format_field(
+        field_name: str,
+        conversion: Optional[str],
+        format_spec: str,
+        kwargs: Dict[str, Any]
+    ) -> str:
+        formatter = Formatter()
+        value, _ = formatter.get_field(field_name, (), kwargs)
+        value = formatter.convert_field(value, conversion)
+        return formatter.format_field(value, format_spec)
+
+    def token_count(self, model: str = "gpt-4", **kwargs: Any) -> int:
+        """
+        估算渲染后的token数：静态部分使用缓存的计数，只对变量值分词。
+        分段计数与整体分词在拼接边界处可能有几个token的差异
+        """
+        total = self.static_tokens(model)
+        for variable, occurrences in self._occurrences.items():
+            value = kwargs.get(variable)
+            if value is None:
+                continue
+            total += occurrences * tokenizer_registry.count(str(value), model)
+        return total
+
+    def __repr__(self) -> str:
+        return f"PromptTemplate(name={self.name!r}, variables={sorted(self.variables)})"
+
+def _root_name(field_name: str) -> str:
+    """
+    取字段的根变量名，如"scene.title"和"items[0]"分别为"scene"和"items"
+    """
+    for index, char in enumerate(field_name):
+        if char in ".[":
+            return field_name[:index]
+    return field_name
+
+class TemplateRegistry:
+    """
+    提示模板注册表
+    按名称注册模板，也可以按模板文本取得编译结果。
+    按文本编译的结果放在容量为max_compiled的LRU中（调用方可能传入动态拼接的文本），
+    命名模板单独保存，不会被淘汰
+    """
+
+    def __init__(self, max_compiled: int = 256):
+        self.max_compiled = max_compiled
+        self._by_name: Dict[str, PromptTemplate] = {}
+        self._by_text: "OrderedDict[str, PromptTemplate]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def register(self, name: str, template: str) -> PromptTemplate:
+        """
+        注册命名模板
+        """
+        compiled = self.compile(template)
+        if compiled.name is None:
+            compiled.name = name
+        self._by_name[name] = compiled
+        return compiled
+
+    def register_module(self, module: ModuleType, suffix: str = "_PROMPT") -> List[str]:
+        """
+        注册模块中所有以suffix结尾的字符串常量，返回注册的名称
+        """
+        names = [
+            name for name, value in vars(module).items()
+            if name.endswith(suffix) and isinstance(value, str)
+        ]
+        for name in names:
+            self.register(name, getattr(module, name))
+        return names
+
+    def compile(self, template: str) -> PromptTemplate:
+        """
+        获取模板文本的编译结果
+        模板含有无法解析的花括号（如未转义的单个{或}）时抛出ValueError
+        """
+        with self._lock:
+            compiled = self._by_text.get(template)
+            if compiled is not None:
+                self._by_text.move_to_end(template)
+                return compiled
+
+        compiled = PromptTemplate(template)
+        with self._lock:
+            self._by_text[template] = compiled
+            while len(self._by_text) > self.max_compiled:
+                self._by_text.popitem(last=False)
+        return compiled
+
+    def get(self, name: str) -> PromptTemplate:
+        """
+        按名称获取模板
+        """
+        if name not in self._by_name:
+            raise ValueError(f"Prompt template {name} not found")
+        return self._by_name[name]
+
+    def render(self, name: str, **kwargs: Any) -> str:
+        """
+        按名称渲染模板
+        """
+        return self.get(name).render(**kwargs)
+
+    def list_templates(self) -> List[str]:
+        return list(self._by_name.keys())
+
+# 全局模板注册表实例，prompts模块中的模板在导入时注册
+template_registry = TemplateRegistry()
@@ -0,0 +1,65 @@
+import json
+import pytest
+
+from app.ai import ModelResponse
+from app.ai.tests.test_router import StubAdapter
+
+class ScriptedAdapter(StubAdapter):
+    """
+    按顺序返回预设内容的模型适配器
+    """
+    def __init__(self, contents):
+        super().__init__("scripted")
+        self.contents = list(contents)
+        self.prompts = []
+
+    async def generate_text(self, prompt, max_tokens=1000, temperature=0.7, stop=None, **kwargs):
+        self.calls += 1
+        self.prompts.append(prompt)
+        return ModelResponse(content=self.contents.pop(0), tokens_used=1, model_name=self.model_name)
+
+@pytest.mark.asyncio
+async def test_analyze_text_single_call():
+    """
+    测试多项分析在一次调用中完成
+    """
+    model = ScriptedAdapter([json.dumps({
+        "sentiment": {"positive": 0.8, "negative": 0.1, "neutral": 0.1},
+        "keywords": ["a", "b", "c"],
+        "safety": {"is_safe": True},
+    })])
+
+    result = await model.analyze_text(
+        "测试文本",
+        analyses=["sentiment", "keywords", "safety"],
+        max_keywords=2
+    )
+
+    assert model.calls == 1
+    assert model.prompts[0].count("测试文本") == 1
+    assert result["sentiment"]["positive"] == 0.8
+    assert result["keywords"] == ["a", "b"]
+    assert result["safety"]["is_safe"] is True
+
+@pytest.mark.asyncio
+async def test_analyze_text_falls_back_for_missing_items():
+    """
+    测试组合结果缺失或格式错误的分析项改用单项调用
+    """
+    model = ScriptedAdapter([
+        json.dumps({"sentiment": {"positive": 1.0}, "keywords": "not a list"}),
+        json.dumps(["关键词"]),
+    ])
+
+    result = await model.analyze_text("测试文本", analyses=["sentiment", "keywords"])
+
+    assert model.calls == 2
+    assert result == {"sentiment": {"positive": 1.0}, "keywords": ["关键词"]}
+
+@pytest.mark.asyncio
+async def test_analyze_text_requires_labels_for_classification():
+    """
+    测试分类分析缺少labels时报错
+    """
+    with pytest.raises(ValueError):
+        await ScriptedAdapter([]).analyze_text("测试文本", analyses=["classification"])
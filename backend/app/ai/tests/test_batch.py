@@ -0,0 +1,88 @@
+import json
+import pytest
+
+from app.ai import (
+    BatchRequest,
+    LocalBatchAdapter,
+    ModelAPIError,
+    read_batch_results,
+    write_batch_file,
+)
+from app.ai.tests.test_router import StubAdapter
+
+class FlakyAdapter(StubAdapter):
+    """
+    对包含"失败"的提示抛出模型错误
+    """
+    async def generate_text(self, prompt, max_tokens=1000, temperature=0.7, stop=None, **kwargs):
+        if "失败" in prompt:
+            raise ModelAPIError(
+                message="upstream error",
+                model_name=self.model_name,
+                error_code="server_error",
+                error_type="api_error"
+            )
+        return await super().generate_text(prompt, max_tokens, temperature, stop, **kwargs)
+
+def test_batch_file_uses_chat_completions_format(tmp_path):
+    """
+    测试批次文件每行是一个chat completions请求
+    """
+    path = tmp_path / "input.jsonl"
+    write_batch_file(
+        [BatchRequest("task-1", "检查内容", max_tokens=200, metadata={"task_type": "check_content_quality"})],
+        str(path),
+        "gpt-4"
+    )
+
+    line = json.loads(path.read_text(encoding="utf-8").splitlines()[0])
+    assert line["custom_id"] == "task-1"
+    assert line["url"] == "/v1/chat/completions"
+    assert line["body"]["model"] == "gpt-4"
+    assert line["body"]["messages"][0]["content"] == "检查内容"
+    assert line["body"]["max_tokens"] == 200
+
+@pytest.mark.asyncio
+async def test_local_batch_maps_results_by_custom_id(tmp_path):
+    """
+    测试本地批量实现执行全部请求，成功和失败的结果都按custom_id返回
+    """
+    model = FlakyAdapter("primary")
+    adapter = LocalBatchAdapter(model, str(tmp_path))
+    input_path = str(tmp_path / "input.jsonl")
+    write_batch_file(
+        [BatchRequest("task-1", "第一章"), BatchRequest("task-2", "失败的请求")],
+        input_path,
+        adapter.model_name
+    )
+
+    job = await adapter.submit_batch(input_path)
+    job = await adapter.wait(job.batch_id, poll_interval=0.01, timeout=5)
+
+    assert job.status == "completed"
+    assert (job.completed_count, job.failed_count) == (1, 1)
+    results = {r.custom_id: r for r in await adapter.get_results(job)}
+    assert results["task-1"].response.content == "第一章"
+    assert results["task-1"].response.metadata["batch"] is True
+    assert not results["task-2"].succeeded
+    assert "upstream error" in results["task-2"].error
+    assert len(read_batch_results(job.output_path)) == 2
+
+@pytest.mark.asyncio
+async def test_interrupted_batch_is_restarted(tmp_path):
+    """
+    测试进程重启后查询到未完成的批次会重新执行
+    """
+    input_path = str(tmp_path / "input.jsonl")
+    write_batch_file([BatchRequest("task-1", "第一章")], input_path, "primary")
+
+    first = LocalBatchAdapter(StubAdapter("primary"), str(tmp_path))
+    job = await first.submit_batch(input_path)
+    await first.aclose()
+
+    model = StubAdapter("primary")
+    second = LocalBatchAdapter(model, str(tmp_path))
+    job = await second.wait(job.batch_id, poll_interval=0.01, timeout=5)
+
+    assert job.status == "completed"
+    assert model.calls == 1
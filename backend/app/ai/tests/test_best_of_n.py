@@ -0,0 +1,95 @@
+import asyncio
+import pytest
+
+from app.ai import (
+    ModelResponse,
+    ModelTimeoutError,
+    best_of_n,
+    build_scorer,
+    keyword_scorer,
+    repetition_scorer,
+    sample_temperatures,
+)
+from app.ai.tests.test_router import StubAdapter
+
+class TemperatureAdapter(StubAdapter):
+    """
+    按温度返回预设内容的模型适配器，温度越高返回越慢
+    """
+    def __init__(self, model_name, outputs, error_temperature=None):
+        super().__init__(model_name)
+        self.outputs = outputs
+        self.error_temperature = error_temperature
+        self.cancelled = 0
+        self.kwargs = []
+
+    async def generate_text(self, prompt, max_tokens=1000, temperature=0.7, stop=None, **kwargs):
+        self.calls += 1
+        self.kwargs.append(kwargs)
+        try:
+            await asyncio.sleep(temperature / 10)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if temperature == self.error_temperature:
+            raise ModelTimeoutError(
+                message="timeout", model_name=self.model_name, error_code="timeout", error_type="timeout"
+            )
+        return ModelResponse(content=self.outputs[temperature], tokens_used=10, model_name=self.model_name)
+
+OUTPUTS = {
+    0.4: "林风走进山门。林风走进山门。林风走进山门。",
+    0.6: "林风走进山门，拜入青云宗。",
+    0.8: "林风在山门前驻足良久，终于拜入青云宗，师父是一位白发长老。",
+    1.0: "山门。",
+}
+
+@pytest.mark.asyncio
+async def test_best_sample_wins():
+    """
+    测试并发采样后按评分选出最好的候选，token为所有候选的总消耗
+    """
+    model = TemperatureAdapter("primary", OUTPUTS)
+    scorer = build_scorer([{"type": "repetition"}, {"type": "keywords", "keywords": ["青云宗", "师父"]}])
+
+    result = await best_of_n(model, "写一段拜师的情节", n=4, scorer=scorer, temperature=0.7, seed=7)
+
+    assert sample_temperatures(4, 0.7, 0.3) == [0.4, 0.6, 0.8, 1.0]
+    assert model.calls == 4
+    assert result.best.temperature == 0.8
+    assert result.response.tokens_used == 40
+    assert result.response.metadata["best_of_n"]["completed"] == 4
+    assert [kwargs["seed"] for kwargs in model.kwargs] == [7, 8, 9, 10]
+    assert all(kwargs["use_cache"] is False for kwargs in model.kwargs)
+
+@pytest.mark.asyncio
+async def test_threshold_stops_early_and_cancels_rest():
+    """
+    测试第一个达到阈值的候选直接胜出，其余请求被取消
+    """
+    model = TemperatureAdapter("primary", OUTPUTS)
+
+    result = await best_of_n(model, "写一段拜师的情节", n=4, scorer=keyword_scorer(["青云宗"]), threshold=1.0)
+
+    assert result.best.temperature == 0.6
+    assert result.early_stopped is True
+    await asyncio.sleep(0)
+    assert model.cancelled == 2
+    assert result.tokens_used == 20
+
+@pytest.mark.asyncio
+async def test_failed_samples_are_skipped():
+    """
+    测试失败的候选被跳过，全部失败或n无效时抛出错误
+    """
+    model = TemperatureAdapter("primary", OUTPUTS, error_temperature=0.8)
+    result = await best_of_n(model, "写一段拜师的情节", n=4, scorer=repetition_scorer())
+    assert result.failed == 1
+    assert result.best.temperature in (0.6, 1.0)
+
+    model = TemperatureAdapter("primary", OUTPUTS, error_temperature=0.7)
+    with pytest.raises(ModelTimeoutError):
+        await best_of_n(model, "写一段拜师的情节", n=1)
+
+    with pytest.raises(ValueError):
+        await best_of_n(model, "写一段拜师的情节", n=0)
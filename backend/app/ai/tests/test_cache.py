@@ -0,0 +1,86 @@
+import pytest
+from unittest.mock import AsyncMock
+
+from app.ai import (
+    ModelResponse,
+    OpenAIAdapter,
+    ResponseCache,
+    MemoryCacheBackend,
+    CachedModelAdapter,
+)
+
+@pytest.fixture
+def inner():
+    adapter = OpenAIAdapter(api_key="test-key", model_name="gpt-4")
+    adapter.generate_text = AsyncMock(return_value=ModelResponse(
+        content='{"positive": 0.6, "negative": 0.2, "neutral": 0.2}',
+        tokens_used=10,
+        model_name="gpt-4"
+    ))
+    return adapter
+
+@pytest.mark.asyncio
+async def test_cache_hit_costs_no_tokens(inner):
+    """
+    测试相同的确定性调用命中缓存
+    """
+    cache = ResponseCache()
+    model = CachedModelAdapter(inner, cache)
+
+    first = await model.generate_text("测试提示", temperature=0.3)
+    second = await model.generate_text("测试提示", temperature=0.3)
+
+    assert inner.generate_text.await_count == 1
+    assert first.tokens_used == 10
+    assert second.tokens_used == 0
+    assert second.metadata["cached"] is True
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+@pytest.mark.asyncio
+async def test_cache_bypass(inner):
+    """
+    测试高温度调用和显式关闭缓存时不使用缓存
+    """
+    cache = ResponseCache()
+    model = CachedModelAdapter(inner, cache)
+
+    await model.generate_text("测试提示", temperature=0.9)
+    await model.generate_text("测试提示", temperature=0.9)
+    await model.generate_text("测试提示", temperature=0.3, use_cache=False)
+
+    assert inner.generate_text.await_count == 3
+    # use_cache继续传给内层包装（如语义缓存），由供应商适配器最终移除
+    assert inner.generate_text.await_args.kwargs["use_cache"] is False
+    assert cache.stats()["misses"] == 0
+
+@pytest.mark.asyncio
+async def test_analysis_methods_go_through_cache(inner):
+    """
+    测试分析类方法经过缓存层
+    """
+    model = CachedModelAdapter(inner, ResponseCache())
+
+    await model.analyze_sentiment("这是一个测试文本")
+    sentiment = await model.analyze_sentiment("这是一个测试文本")
+
+    assert inner.generate_text.await_count == 1
+    assert sentiment["positive"] == 0.6
+
+@pytest.mark.asyncio
+async def test_memory_backend_lru_and_ttl():
+    """
+    测试内存缓存的LRU淘汰和过期
+    """
+    backend = MemoryCacheBackend(max_size=2, ttl=60)
+    await backend.set("a", {"v": 1})
+    await backend.set("b", {"v": 2})
+    await backend.get("a")
+    await backend.set("c", {"v": 3})
+
+    assert await backend.get("b") is None
+    assert await backend.get("a") == {"v": 1}
+
+    expired = MemoryCacheBackend(ttl=-1)
+    await expired.set("a", {"v": 1})
+    assert await expired.get("a") is None
@@ -0,0 +1,97 @@
+import pytest
+
+from app.ai import (
+    CascadeModelAdapter,
+    CascadePolicy,
+    CascadeStats,
+    ModelResponse,
+    ModelTimeoutError,
+    build_cascade_policies,
+    confidence_check,
+    json_check,
+)
+from app.ai.tests.test_router import StubAdapter
+
+class FixedAdapter(StubAdapter):
+    """
+    返回固定内容的模型适配器
+    """
+    def __init__(self, model_name, content, tokens_used=10, error=None):
+        super().__init__(model_name, error=error)
+        self.content = content
+        self.tokens_used = tokens_used
+
+    async def generate_text(self, prompt, max_tokens=1000, temperature=0.7, stop=None, **kwargs):
+        self.calls += 1
+        if self.error:
+            raise self.error
+        return ModelResponse(content=self.content, tokens_used=self.tokens_used, model_name=self.model_name)
+
+def make_cascade(draft_content, draft_error=None, policies=None):
+    strong = FixedAdapter("strong", '["修仙", "宗门"]', tokens_used=30)
+    draft = FixedAdapter("draft", draft_content, tokens_used=5, error=draft_error)
+    stats = CascadeStats()
+    model = CascadeModelAdapter(strong, draft, policies=policies, stats=stats)
+    return strong, draft, model, stats
+
+@pytest.mark.asyncio
+async def test_accepted_draft_skips_strong_model():
+    """
+    测试草稿通过验收检查时不调用强模型
+    """
+    strong, draft, model, stats = make_cascade('["林风", "拜师"]')
+
+    response = await model.generate_text("提取关键词", task_type="extract_keywords")
+
+    assert response.model_name == "draft"
+    assert response.metadata["cascade"]["tier"] == "draft"
+    assert strong.calls == 0
+    assert stats.to_dict()["extract_keywords"]["acceptance_rate"] == 1.0
+
+@pytest.mark.asyncio
+async def test_failed_check_or_draft_error_escalates():
+    """
+    测试草稿未通过检查或调用失败时升级到强模型，token包含草稿消耗
+    """
+    strong, draft, model, stats = make_cascade("这不是JSON")
+
+    response = await model.generate_text("提取关键词", task_type="extract_keywords")
+
+    assert response.model_name == "strong"
+    assert response.tokens_used == 35
+    assert response.metadata["cascade"]["reason"] == "invalid_json"
+
+    timeout = ModelTimeoutError(
+        message="timeout", model_name="draft", error_code="timeout", error_type="timeout"
+    )
+    strong, draft, model, stats = make_cascade("", draft_error=timeout)
+    response = await model.generate_text("提取关键词", task_type="extract_keywords")
+
+    assert response.model_name == "strong"
+    assert stats.to_dict()["extract_keywords"]["reasons"] == {"draft_error:timeout": 1}
+
+@pytest.mark.asyncio
+async def test_configured_checks_and_unconfigured_task_types():
+    """
+    测试按配置创建的检查，未配置级联的任务类型直接使用强模型
+    """
+    policies = build_cascade_policies({
+        "classify_text": {"checks": [{"type": "confidence", "threshold": 0.8}]},
+        "extract_keywords": None,
+    })
+    assert "extract_keywords" not in policies
+
+    strong, draft, model, stats = make_cascade('{"label": "仙侠", "confidence": 0.6}', policies=policies)
+    response = await model.generate_text("分类", task_type="classify_text")
+    assert response.model_name == "strong"
+    assert stats.to_dict()["classify_text"]["reasons"] == {"low_confidence": 1}
+
+    await model.generate_text("提取关键词", task_type="extract_keywords")
+    assert draft.calls == 1
+
+    assert json_check("object", required=["title"])(
+        ModelResponse(content='{"title": "第一章"}', tokens_used=1, model_name="draft")
+    ) == (True, "")
+    assert CascadePolicy(checks=[confidence_check()]).accept(
+        ModelResponse(content="[]", tokens_used=1, model_name="draft")
+    ) == (False, "low_confidence")
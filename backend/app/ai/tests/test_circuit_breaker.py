@@ -0,0 +1,124 @@
+import pytest
+
+from app.ai import (
+    CircuitBreaker,
+    CircuitBreakerAdapter,
+    CircuitOpenError,
+    CircuitState,
+    ModelManager,
+    ModelTimeoutError,
+    TokenLimitError,
+)
+from app.ai.tests.test_router import StubAdapter
+
+def timeout_error():
+    return ModelTimeoutError("timeout", "primary", "timeout", "timeout")
+
+def test_breaker_opens_and_half_opens():
+    """
+    测试熔断器状态转换
+    """
+    changes = []
+    breaker = CircuitBreaker(
+        "primary",
+        failure_threshold=2,
+        recovery_timeout=0,
+        on_state_change=lambda b, old, new: changes.append(new)
+    )
+    breaker.record_failure()
+    assert breaker.allow_request()
+    breaker.record_failure()
+
+    # recovery_timeout为0，打开后立即进入半开状态并只放行一个探测请求
+    assert breaker.state == CircuitState.HALF_OPEN
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+
+    breaker.record_success()
+    assert breaker.state == CircuitState.CLOSED
+    assert changes == [CircuitState.OPEN, CircuitState.HALF_OPEN, CircuitState.CLOSED]
+
+@pytest.mark.asyncio
+async def test_open_breaker_fails_fast():
+    """
+    测试熔断打开后不再调用内部适配器
+    """
+    inner = StubAdapter("primary", error=timeout_error())
+    model = CircuitBreakerAdapter(
+        inner,
+        failure_threshold=2,
+        recovery_timeout=60,
+        on_state_change=None
+    )
+    model.circuit_breaker.on_state_change = None
+
+    for _ in range(2):
+        with pytest.raises(ModelTimeoutError):
+            await model.generate_text("测试提示")
+    with pytest.raises(CircuitOpenError):
+        await model.generate_text("测试提示")
+
+    assert inner.calls == 2
+
+@pytest.mark.asyncio
+async def test_request_errors_do_not_trip_breaker():
+    """
+    测试token超限等请求错误不计入熔断
+    """
+    error = TokenLimitError("too long", "primary", "token_limit_exceeded", "token_limit")
+    model = CircuitBreakerAdapter(StubAdapter("primary", error=error), failure_threshold=1)
+
+    for _ in range(3):
+        with pytest.raises(TokenLimitError):
+            await model.generate_text("测试提示")
+    assert model.circuit_breaker.state == CircuitState.CLOSED
+
+@pytest.mark.asyncio
+async def test_router_reroutes_open_breaker():
+    """
+    测试路由器绕开熔断打开的模型
+    """
+    manager = ModelManager()
+    primary = CircuitBreakerAdapter(StubAdapter("primary"), recovery_timeout=60)
+    primary.circuit_breaker.record_failure()
+    primary.circuit_breaker.failure_threshold = 1
+    primary.circuit_breaker.record_failure()
+    backup = StubAdapter("backup")
+    manager.register_model("primary", primary, is_default=True, fallback="backup")
+    manager.register_model("backup", backup)
+
+    response = await manager.get_router().generate_text("测试提示")
+
+    assert response.model_name == "backup"
+    assert "circuit open" in response.metadata["routing"]["reason"]
+    assert primary.model.calls == 0
+
+@pytest.mark.asyncio
+async def test_probe_outcomes_release_half_open_slot():
+    """
+    测试探测请求遇到请求错误或流被提前关闭时不会占住半开名额
+    """
+    inner = StubAdapter("primary", error=timeout_error())
+    model = CircuitBreakerAdapter(inner, failure_threshold=1, recovery_timeout=0)
+    model.circuit_breaker.on_state_change = None
+
+    with pytest.raises(ModelTimeoutError):
+        await model.generate_text("测试提示")
+    assert model.circuit_breaker.state == CircuitState.HALF_OPEN
+
+    # 流在结束前被关闭：不改变状态，名额归还
+    inner.error = None
+    stream = model.generate_text_stream("测试提示")
+    await stream.__anext__()
+    await stream.aclose()
+    assert model.circuit_breaker.state == CircuitState.HALF_OPEN
+
+    # token超限说明供应商正常响应，按成功处理
+    inner.error = TokenLimitError("too long", "primary", "token_limit_exceeded", "token_limit")
+    with pytest.raises(TokenLimitError):
+        await model.generate_text("测试提示")
+    assert model.circuit_breaker.state == CircuitState.CLOSED
+
+    inner.error = None
+    response = await model.generate_text("测试提示")
+    assert response.model_name == "primary"
@@ -0,0 +1,56 @@
+import pytest
+
+from app.ai import ContextBuilder, ContextSection, count_tokens, truncate_to_tokens
+
+LONG = "长夜将尽，城门外的马蹄声由远及近。" * 40
+
+def test_truncate_to_tokens_keeps_head_or_tail():
+    """
+    测试截断后不超过预算，并按要求保留开头或结尾
+    """
+    head = truncate_to_tokens(LONG + "结尾", 30)
+    tail = truncate_to_tokens("开头" + LONG, 30, keep="tail")
+
+    assert count_tokens(head) <= 30 and LONG.startswith(head)
+    assert count_tokens(tail) <= 30 and LONG.endswith(tail)
+    assert truncate_to_tokens("短文本", 30) == "短文本"
+
+@pytest.mark.asyncio
+async def test_builder_respects_priority_and_minimums():
+    """
+    测试按优先级分配预算，放不下最小长度的片段被丢弃
+    """
+    builder = ContextBuilder(budget=120)
+    builder.add("scene", LONG, priority=3, min_tokens=50)
+    builder.add("characters", LONG, priority=2, min_tokens=40, keep="tail")
+    builder.add("history", LONG, priority=1, min_tokens=100)
+
+    context = await builder.build()
+
+    assert list(context.sections) == ["scene", "characters", "history"]
+    assert context.dropped == ["history"]
+    assert context.sections["history"] == ""
+    assert set(context.truncated) == {"scene", "characters"}
+    assert context.tokens <= 120
+    # 预算基本用满
+    assert context.tokens >= 110
+    assert count_tokens(context.sections["characters"]) > 30
+    assert LONG.endswith(context.sections["characters"])
+
+@pytest.mark.asyncio
+async def test_builder_summarizes_marked_sections():
+    """
+    测试标记了summarize的片段使用摘要函数
+    """
+    async def summarizer(text, max_tokens):
+        return "摘要"
+
+    builder = ContextBuilder(budget=60, summarizer=summarizer)
+    builder.add_section(ContextSection("outline", "简短大纲", priority=2))
+    builder.add_section(ContextSection("characters", LONG, priority=1, summarize=True))
+
+    context = await builder.build()
+
+    assert context.sections == {"outline": "简短大纲", "characters": "摘要"}
+    assert context.summarized == ["characters"]
+    assert not context.truncated
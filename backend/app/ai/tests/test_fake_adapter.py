@@ -0,0 +1,63 @@
+import pytest
+
+from app.ai import (
+    FakeModelAdapter,
+    ModelManager,
+    ModelRateLimitError,
+    create_fake_adapter,
+)
+
+@pytest.mark.asyncio
+async def test_fake_adapter_is_deterministic():
+    """
+    测试相同seed和提示得到相同输出，流式输出与完整输出一致
+    """
+    a = FakeModelAdapter(seed=1, output_tokens=20, time_scale=0)
+    b = FakeModelAdapter(seed=1, output_tokens=20, time_scale=0)
+
+    first = await a.generate_text("测试提示", max_tokens=50)
+    second = await b.generate_text("测试提示", max_tokens=50)
+    chunks = [chunk async for chunk in a.generate_text_stream("测试提示", max_tokens=50)]
+
+    assert first.content == second.content
+    assert "".join(chunks) == first.content
+    assert first.tokens_used == a.get_token_count("测试提示") + len(chunks)
+
+    other = await FakeModelAdapter(seed=2, output_tokens=20, time_scale=0).generate_text(
+        "测试提示", max_tokens=50
+    )
+    assert other.content != first.content
+
+@pytest.mark.asyncio
+async def test_fake_adapter_respects_max_tokens_and_embeddings():
+    """
+    测试输出长度受max_tokens限制，嵌入向量为确定性的单位向量
+    """
+    model = FakeModelAdapter(output_tokens=500, time_scale=0, embedding_dim=8)
+
+    response = await model.generate_text("测试提示", max_tokens=5)
+    vectors = await model.generate_embeddings(["甲", "乙", "甲"])
+
+    assert response.metadata["finish_reason"] == "length"
+    assert len(response.content) <= 10
+    assert vectors[0] == vectors[2] != vectors[1]
+    assert abs(sum(v * v for v in vectors[0]) - 1.0) < 1e-9
+
+@pytest.mark.asyncio
+async def test_fake_adapter_injects_errors_via_provider():
+    """
+    测试通过供应商注册创建模拟模型并注入限流错误
+    """
+    manager = ModelManager()
+    manager.register_provider("fake", create_fake_adapter)
+    model = manager.create_adapter(
+        "fake",
+        model_name="fake-gpt",
+        extra_params={"fake": {"rate_limit_error_rate": 1.0, "time_scale": 0}}
+    )
+
+    assert model.model_name == "fake-gpt"
+    with pytest.raises(ModelRateLimitError):
+        await model.generate_text("测试提示")
+    with pytest.raises(ValueError):
+        manager.create_adapter("unknown")
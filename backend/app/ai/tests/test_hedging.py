@@ -0,0 +1,132 @@
+import asyncio
+import pytest
+
+from app.ai import HedgeBudget, HedgedModelAdapter, HedgingPolicy, current_task_type
+from app.ai.tests.test_router import StubAdapter
+
+class DelayedAdapter(StubAdapter):
+    """
+    按固定延迟返回，记录被取消的调用
+    """
+    def __init__(self, model_name, delay):
+        super().__init__(model_name)
+        self.delay = delay
+        self.cancelled = 0
+
+    async def generate_text(self, prompt, max_tokens=1000, temperature=0.7, stop=None, **kwargs):
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return await super().generate_text(prompt, max_tokens, temperature, stop, **kwargs)
+
+def fast_policy():
+    return HedgingPolicy(min_samples=1000, initial_delay=0.01)
+
+@pytest.mark.asyncio
+async def test_slow_call_is_hedged_and_loser_cancelled():
+    """
+    测试超过对冲等待时间后发出对冲请求，先完成的结果胜出并取消另一个
+    """
+    primary = DelayedAdapter("primary", delay=1.0)
+    backup = DelayedAdapter("backup", delay=0.0)
+    budget = HedgeBudget()
+    model = HedgedModelAdapter(
+        primary, hedge_model=backup, policies={"generate_scene": fast_policy()}, budget=budget
+    )
+
+    response = await model.generate_text("测试提示", task_type="generate_scene")
+    await asyncio.sleep(0)
+
+    assert response.model_name == "backup"
+    assert response.metadata["hedge"]["winner"] == "hedge"
+    assert primary.cancelled == 1
+    assert budget.stats()["hedged"] == 1
+    assert budget.stats()["hedge_wins"] == 1
+
+@pytest.mark.asyncio
+async def test_task_type_from_context_selects_policy():
+    """
+    测试未显式传入task_type时使用上下文中的任务类型，未配置的任务类型不对冲
+    """
+    primary = DelayedAdapter("primary", delay=0.05)
+    backup = DelayedAdapter("backup", delay=0.0)
+    model = HedgedModelAdapter(
+        primary, hedge_model=backup,
+        policies={"generate_scene": fast_policy()}, budget=HedgeBudget()
+    )
+
+    response = await model.generate_text("测试提示", task_type="check_quality")
+    assert response.model_name == "primary"
+    assert backup.calls == 0
+
+    token = current_task_type.set("generate_scene")
+    try:
+        response = await model.generate_text("测试提示")
+    finally:
+        current_task_type.reset(token)
+    assert response.model_name == "backup"
+
+@pytest.mark.asyncio
+async def test_no_hedge_when_disabled_or_budget_exhausted():
+    """
+    测试显式关闭对冲或预算耗尽时只等待原请求
+    """
+    primary = DelayedAdapter("primary", delay=0.05)
+    backup = DelayedAdapter("backup", delay=0.0)
+    budget = HedgeBudget(max_extra_ratio=0.0, burst_tokens=0)
+    model = HedgedModelAdapter(
+        primary, hedge_model=backup, policies={"generate_scene": fast_policy()}, budget=budget
+    )
+
+    response = await model.generate_text("测试提示", task_type="generate_scene")
+    assert response.model_name == "primary"
+    assert budget.stats()["denied"] == 1
+
+    response = await model.generate_text("测试提示", task_type="generate_scene", hedge=False)
+    assert response.model_name == "primary"
+    assert backup.calls == 0
+
+@pytest.mark.asyncio
+async def test_delay_uses_latency_of_same_task_type():
+    """
+    测试对冲阈值按任务类型统计，慢任务的延迟不会推迟快任务的对冲
+    """
+    primary = DelayedAdapter("primary", delay=0.05)
+    backup = DelayedAdapter("backup", delay=0.0)
+    policy = HedgingPolicy(min_samples=1, initial_delay=0.01, min_delay=0.0)
+    model = HedgedModelAdapter(
+        primary, hedge_model=backup,
+        policies={"generate_scene": policy, "extract_keywords": policy}, budget=HedgeBudget()
+    )
+    model.stats_for("generate_scene").record(10.0)
+
+    response = await model.generate_text("测试提示", task_type="generate_scene")
+    assert response.model_name == "primary"
+    assert model.stats_for("generate_scene").sample_count == 2
+
+    response = await model.generate_text("测试提示", task_type="extract_keywords")
+    assert response.model_name == "backup"
+
+@pytest.mark.asyncio
+async def test_cancelled_request_does_not_mask_other_result():
+    """
+    测试其中一个请求被取消时继续等待另一个请求，而不是抛出CancelledError
+    """
+    primary = asyncio.ensure_future(DelayedAdapter("primary", delay=1.0).generate_text("测试提示"))
+    hedge = asyncio.ensure_future(DelayedAdapter("backup", delay=0.02).generate_text("测试提示"))
+    await asyncio.sleep(0)
+    primary.cancel()
+
+    response, winner = await HedgedModelAdapter._first_success({primary: "primary", hedge: "hedge"})
+    assert winner == "hedge"
+    assert response.model_name == "backup"
+
+def test_no_task_type_is_hedged_by_default():
+    """
+    测试默认不对冲任何任务类型
+    """
+    model = HedgedModelAdapter(StubAdapter("primary"), budget=HedgeBudget())
+    assert not model.policy_for({"task_type": "generate_outline"}).enabled
+    assert model.policy_for({"task_type": "generate_outline", "hedge": True}).enabled
@@ -0,0 +1,47 @@
+import pytest
+
+from app.ai import JSONStreamParser, extract_json, iter_json_fields, parse_json_response
+
+def test_parser_emits_fields_as_they_close():
+    """
+    测试顶层字段闭合后立即返回
+    """
+    parser = JSONStreamParser()
+
+    assert parser.feed('好的，以下是大纲：\n```json\n{"title": "长夜') == []
+    assert parser.feed('", "chapters": [{"n": 1}, {"n": 2}],') == [
+        ("title", "长夜"),
+        ("chapters", [{"n": 1}, {"n": 2}]),
+    ]
+    assert parser.feed(' "note": "含有}和,的字符串\\"引号"}\n```\n以上。') == [
+        ("note", '含有}和,的字符串"引号'),
+    ]
+    assert parser.done
+    assert parser.result()["title"] == "长夜"
+
+def test_extract_json_handles_prose_and_arrays():
+    """
+    测试从带说明文字和代码块标记的输出中提取JSON
+    """
+    assert extract_json('结果：["甲", "乙"] 以上为关键词') == ["甲", "乙"]
+    assert extract_json('使用{name}占位。\n{"a": 1}\n后记{b}') == {"a": 1}
+    assert parse_json_response('```json\n{"key": "value"}\n```\n说明 {x}') == {"key": "value"}
+    with pytest.raises(ValueError):
+        extract_json('{"a": 1')
+
+@pytest.mark.asyncio
+async def test_iter_json_fields_closes_upstream():
+    """
+    测试JSON闭合后停止读取并关闭上游流
+    """
+    consumed = []
+
+    async def stream():
+        for chunk in ['{"a": 1,', ' "b": [2]}', '尾随文字', '更多文字']:
+            consumed.append(chunk)
+            yield chunk
+
+    fields = [item async for item in iter_json_fields(stream())]
+
+    assert fields == [("a", 1), ("b", [2])]
+    assert consumed == ['{"a": 1,', ' "b": [2]}']
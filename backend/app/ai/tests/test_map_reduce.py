@@ -0,0 +1,94 @@
+import asyncio
+import json
+import pytest
+
+from app.ai import ModelResponse, count_tokens, get_reducer, map_reduce, merge_generations
+from app.ai.tests.test_router import StubAdapter
+
+class AnalysisAdapter(StubAdapter):
+    """
+    按提示返回固定的分析结果，记录每次调用的提示长度和最大并发数
+    """
+    context_window = 2048
+
+    def __init__(self, model_name):
+        super().__init__(model_name)
+        self.prompt_tokens = []
+        self.active = 0
+        self.max_active = 0
+
+    async def generate_text(self, prompt, max_tokens=1000, temperature=0.7, stop=None, **kwargs):
+        self.calls += 1
+        self.prompt_tokens.append(count_tokens(prompt, self.model_name))
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        await asyncio.sleep(0.01)
+        self.active -= 1
+        if "暴力" in prompt and "打斗" in prompt:
+            content = {"is_safe": False, "violence": True}
+        elif "关键词" in prompt:
+            content = ["修仙", "林风"]
+        else:
+            content = {"is_safe": True, "violence": False}
+        return ModelResponse(json.dumps(content, ensure_ascii=False), 1, self.model_name)
+
+def test_reducers():
+    """
+    测试内置归并方式
+    """
+    assert get_reducer("vote")(["武侠", "仙侠", "仙侠"]) == "仙侠"
+    assert get_reducer("vote")([{"a": 0.9, "b": 0.1}, {"a": 0.2, "b": 0.8}, {"a": 0.6, "b": 0.4}]) == {
+        "a": 2 / 3, "b": 1 / 3
+    }
+    assert get_reducer("average")([{"score": 8, "tags": ["a"]}, {"score": 6, "tags": ["b"]}]) == {
+        "score": 7, "tags": ["a", "b"]
+    }
+    assert get_reducer("max_risk")([
+        {"is_safe": True, "violence": False, "score": 0.1},
+        {"is_safe": False, "violence": True, "score": 0.7},
+    ]) == {"is_safe": False, "violence": True, "score": 0.7}
+    assert get_reducer("union")([["林风", "修仙"], ["修仙", "宗门"]]) == ["修仙", "林风", "宗门"]
+    assert merge_generations(["甲", "乙", "乙"], mode="vote") == "乙"
+
+@pytest.mark.asyncio
+async def test_map_reduce_bounds_concurrency_and_keeps_order():
+    """
+    测试分块并发不超过上限，归并时保持块的顺序
+    """
+    active = 0
+    max_active = 0
+
+    async def echo(chunk):
+        nonlocal active, max_active
+        active += 1
+        max_active = max(max_active, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+        return [chunk]
+
+    text = "。".join(f"第{i}句话的内容" for i in range(200))
+    chunks = await map_reduce(text, echo, "concat", chunk_tokens=50, boundary_window=10, max_concurrency=3)
+
+    assert len(chunks) > 3
+    assert max_active == 3
+    assert "".join(chunks) == text
+
+@pytest.mark.asyncio
+async def test_long_text_analysis_is_split_and_reduced():
+    """
+    测试超出单次调用上限的文本分块分析，安全检查任一块不安全则整体不安全
+    """
+    model = AnalysisAdapter("primary")
+    safe = "他们在山门前静静地喝茶聊天。" * 150
+    text = safe + "两人突然爆发打斗，场面充满暴力。" + safe
+
+    result = await model.check_content_safety(text)
+
+    assert model.calls > 1
+    assert max(model.prompt_tokens) < model.context_window
+    assert model.max_active <= model.analysis_max_concurrency
+    assert result["is_safe"] is False
+    assert result["violence"] is True
+
+    keywords = await model.extract_keywords(text, max_keywords=1)
+    assert keywords == ["修仙"]
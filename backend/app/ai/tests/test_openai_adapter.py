@@ -1,5 +1,5 @@
 import pytest
-from unittest.mock import Mock, patch
+from unittest.mock import AsyncMock, Mock, patch
 import openai
 
 from app.ai import OpenAIAdapter, ModelResponse, TokenLimitError, ModelAPIError
@@ -118,6 +118,30 @@ async def test_generate_embedding(adapter):
         assert len(embedding) == len(mock_embedding)
         assert embedding == mock_embedding
 
+@pytest.mark.asyncio
+async def test_generate_embeddings_batches_in_order(adapter):
+    """
+    测试批量生成嵌入向量时按批次请求并保持输入顺序
+    """
+    adapter.embedding_batch_size = 2
+    calls = []
+
+    async def fake_create(model, input, **kwargs):
+        calls.append(list(input))
+        # 故意打乱返回顺序，验证按index还原
+        data = [
+            Mock(index=i, embedding=[float(len(text))])
+            for i, text in enumerate(input)
+        ]
+        return Mock(data=list(reversed(data)))
+
+    with patch('openai.Embedding.acreate', AsyncMock(side_effect=fake_create)):
+        texts = ["a", "bb", "ccc", "dddd", "eeeee"]
+        embeddings = await adapter.generate_embeddings(texts)
+
+    assert len(calls) == 3
+    assert embeddings == [[1.0], [2.0], [3.0], [4.0], [5.0]]
+
 async def test_analyze_sentiment(adapter):
     """
     测试情感分析
@@ -171,4 +195,38 @@ def test_get_token_count(adapter):
     text = "这是一个测试文本"
     count = adapter.get_token_count(text)
     assert isinstance(count, (int, float))
-    assert count > 0
\ No newline at end of file
+    assert count > 0
+
+@pytest.mark.asyncio
+async def test_adapters_use_own_credentials_and_pool():
+    """
+    测试每个适配器按请求携带自己的凭据和地址，并复用自己的连接池
+    """
+    first = OpenAIAdapter(api_key="key-a", model_name="gpt-4", base_url="http://a.local/v1")
+    second = OpenAIAdapter(api_key="key-b", model_name="gpt-4", organization="org-b")
+    sessions = []
+
+    async def fake_create(**kwargs):
+        sessions.append(openai.aiosession.get())
+        return Mock(
+            choices=[Mock(message=Mock(content="ok"), finish_reason="stop")],
+            usage=Mock(total_tokens=1),
+            id="id"
+        )
+
+    with patch('openai.ChatCompletion.acreate', AsyncMock(side_effect=fake_create)) as create:
+        await first.generate_text("测试提示")
+        await first.generate_text("测试提示")
+        await second.generate_text("测试提示")
+
+    calls = [call.kwargs for call in create.call_args_list]
+    assert calls[0]["api_key"] == "key-a" and calls[0]["api_base"] == "http://a.local/v1"
+    assert calls[2]["api_key"] == "key-b" and calls[2]["organization"] == "org-b"
+    assert "api_base" not in calls[2]
+    assert sessions[0] is sessions[1] is not sessions[2]
+    assert openai.aiosession.get() is None
+    assert openai.api_key != "key-b"
+
+    await first.aclose()
+    await second.aclose()
+    assert sessions[0].closed
@@ -0,0 +1,171 @@
+import pytest
+
+from app.ai import (
+    CachedModelAdapter,
+    ModelResponse,
+    OutputLengthAdapter,
+    OutputLengthPredictor,
+    ResponseCache,
+)
+from app.ai.tests.test_router import StubAdapter
+from app.ai.utils import count_tokens
+
+class LengthAdapter(StubAdapter):
+    """
+    输出固定数量的token，超过max_tokens时截断
+    """
+    context_window = 16000
+
+    def __init__(self, model_name, output_tokens):
+        super().__init__(model_name)
+        self.output_tokens = output_tokens
+        self.requests = []
+        self.options = []
+
+    async def generate_text(self, prompt, max_tokens=1000, temperature=0.7, stop=None, **kwargs):
+        self.calls += 1
+        self.requests.append((prompt, max_tokens))
+        self.options.append(kwargs)
+        produced = min(self.output_tokens, max_tokens)
+        self.output_tokens -= produced
+        return ModelResponse(
+            content="字" * produced,
+            tokens_used=10 + produced,
+            model_name=self.model_name,
+            metadata={
+                "finish_reason": "length" if self.output_tokens > 0 else "stop",
+                "completion_tokens": produced,
+            }
+        )
+
+def test_predictor_uses_p95_with_margin():
+    """
+    测试样本足够时按P95乘以安全系数预测，样本不足时使用默认值
+    """
+    predictor = OutputLengthPredictor(min_samples=5, margin=1.2)
+    assert predictor.predict("plot:generate_outline", 2048) == 2048
+
+    for tokens in (100, 120, 150, 180, 200):
+        predictor.record("plot:generate_outline", tokens)
+
+    assert predictor.predict("plot:generate_outline", 2048) == 240
+    assert predictor.predict("plot:generate_outline", 100) == 200
+    assert predictor.stats()["plot:generate_outline"]["p95"] == 200
+
+@pytest.mark.asyncio
+async def test_adaptive_max_tokens_only_for_unspecified_calls():
+    """
+    测试未指定max_tokens的调用使用预测值并计入样本，指定了的调用保持原样
+    """
+    predictor = OutputLengthPredictor(min_samples=1)
+    predictor.record("writing:polish_text", 300)
+    inner = LengthAdapter("primary", output_tokens=200)
+    model = OutputLengthAdapter(inner, "writing", default_max_tokens=2048, predictor=predictor)
+
+    response = await model.generate_text("润色", task_type="polish_text")
+    assert inner.requests[-1][1] == 360
+    assert response.metadata["max_tokens"] == 360
+    assert predictor.stats()["writing:polish_text"]["samples"] == 2
+
+    inner.output_tokens = 50
+    await model.generate_text("润色", max_tokens=100, task_type="polish_text")
+    assert inner.requests[-1][1] == 100
+    assert predictor.stats()["writing:polish_text"]["samples"] == 2
+
+@pytest.mark.asyncio
+async def test_truncated_output_is_continued_once():
+    """
+    测试输出因长度截断时续写一次并拼接结果，样本记录两次输出之和
+    """
+    predictor = OutputLengthPredictor()
+    inner = LengthAdapter("primary", output_tokens=150)
+    model = OutputLengthAdapter(inner, "plot", default_max_tokens=100, predictor=predictor)
+
+    response = await model.generate_text("写大纲", task_type="generate_outline")
+
+    assert inner.calls == 2
+    assert "字" * 100 in inner.requests[1][0]
+    assert response.content == "字" * 150
+    assert response.tokens_used == 170
+    assert response.metadata["continued"] is True
+    assert response.metadata["finish_reason"] == "stop"
+    stats = predictor.stats()["plot:generate_outline"]
+    assert (stats["p95"], stats["truncated"], stats["continued"]) == (150, 1, 1)
+
+    inner.output_tokens = 500
+    await model.generate_text("写大纲", task_type="generate_outline", continue_truncated=False)
+    assert inner.calls == 3
+
+@pytest.mark.asyncio
+async def test_truncated_stream_is_continued_once():
+    """
+    测试流式输出因长度截断时接着流式输出续写，调用方通过stream_result拿到最终的finish_reason
+    """
+    predictor = OutputLengthPredictor()
+    inner = LengthAdapter("primary", output_tokens=150)
+    model = OutputLengthAdapter(inner, "writing", default_max_tokens=100, predictor=predictor)
+    result = {}
+
+    chunks = [
+        chunk async for chunk in model.generate_text_stream(
+            "写正文", task_type="generate_content", stream_result=result
+        )
+    ]
+
+    assert chunks == ["字" * 100, "字" * 50]
+    assert "字" * 100 in inner.requests[1][0]
+    assert inner.options[1]["overflow"] is False
+    assert result == {"finish_reason": "stop", "continued": True}
+    stats = predictor.stats()["writing:generate_content"]
+    assert (stats["truncated"], stats["continued"]) == (1, 1)
+
+    inner.output_tokens = 500
+    chunks = [
+        chunk async for chunk in model.generate_text_stream(
+            "写正文", task_type="generate_content", continue_truncated=False
+        )
+    ]
+    assert chunks == ["字" * 100]
+    assert inner.calls == 3
+
+@pytest.mark.asyncio
+async def test_continuation_fits_window_without_overflow_recovery():
+    """
+    测试续写提示按模型窗口压缩，且不交给超限恢复（恢复会按原提示重新生成）
+    """
+    inner = LengthAdapter("primary", output_tokens=150)
+    inner.context_window = 600
+    model = OutputLengthAdapter(inner, "writing", default_max_tokens=100, predictor=OutputLengthPredictor())
+
+    async def rebuild(budget):
+        return "重建的提示"
+
+    response = await model.generate_text(
+        "场景设定" * 500, task_type="generate_content", overflow=rebuild
+    )
+
+    prompt, max_tokens = inner.requests[1]
+    assert count_tokens(prompt, "primary") + max_tokens <= 600
+    assert prompt.rstrip().endswith("也不要添加任何说明。")
+    assert inner.options[0]["overflow"] is rebuild
+    assert inner.options[1]["overflow"] is False
+    assert response.content == "字" * 150
+
+@pytest.mark.asyncio
+async def test_predicted_max_tokens_not_in_cache_key():
+    """
+    测试预测的max_tokens变化后相同的请求仍然命中响应缓存
+    """
+    predictor = OutputLengthPredictor(min_samples=1)
+    predictor.record("qa:check_quality", 100)
+    inner = LengthAdapter("primary", output_tokens=50)
+    model = OutputLengthAdapter(
+        CachedModelAdapter(inner, ResponseCache()), "qa", default_max_tokens=2048, predictor=predictor
+    )
+
+    await model.generate_text("检查质量", temperature=0.2, task_type="check_quality")
+    predictor.record("qa:check_quality", 400)
+    await model.generate_text("检查质量", temperature=0.2, task_type="check_quality")
+
+    assert inner.calls == 1
+    assert "adaptive_max_tokens" in inner.options[0]
@@ -0,0 +1,117 @@
+import pytest
+
+from app.ai import (
+    COMPRESSION_MARKER,
+    ModelResponse,
+    OverflowRecoveryAdapter,
+    OverflowStats,
+    TokenLimitError,
+    count_tokens,
+    overflow_stats,
+)
+from app.ai.tests.test_router import StubAdapter
+
+class LimitedAdapter(StubAdapter):
+    """
+    提示加输出超过limit个token时抛出与OpenAI相同格式的超限错误
+    """
+    context_window = 100000
+
+    def __init__(self, model_name, limit):
+        super().__init__(model_name)
+        self.limit = limit
+        self.requests = []
+
+    def _check(self, prompt, max_tokens):
+        self.calls += 1
+        requested = count_tokens(prompt, self.model_name) + max_tokens
+        self.requests.append((prompt, max_tokens))
+        if requested > self.limit:
+            raise TokenLimitError(
+                message=(
+                    f"This model's maximum context length is {self.limit} tokens. "
+                    f"However, you requested {requested} tokens."
+                ),
+                model_name=self.model_name,
+                error_code="token_limit_exceeded",
+                error_type="token_limit"
+            )
+
+    async def generate_text(self, prompt, max_tokens=1000, temperature=0.7, stop=None, **kwargs):
+        self._check(prompt, max_tokens)
+        if "暴力" in prompt and "打斗" in prompt:
+            content = '{"is_safe": false, "violence": true}'
+        else:
+            content = '{"is_safe": true, "violence": false}'
+        return ModelResponse(content=content, tokens_used=1, model_name=self.model_name)
+
+    async def generate_text_stream(self, prompt, max_tokens=1000, temperature=0.7, stop=None, **kwargs):
+        self._check(prompt, max_tokens)
+        for piece in ("林风", "拜师"):
+            yield piece
+
+    def get_token_count(self, text):
+        return count_tokens(text, self.model_name)
+
+@pytest.mark.asyncio
+async def test_overflow_shrinks_output_or_compresses_prompt():
+    """
+    测试提示放得下时缩小输出长度，放不下时压缩提示中间部分，各重试一次
+    """
+    inner = LimitedAdapter("primary", limit=2000)
+    stats = OverflowStats()
+    model = OverflowRecoveryAdapter(inner, stats=stats)
+
+    response = await model.generate_text("写一段拜师的情节", max_tokens=4000)
+    assert response.metadata["overflow"]["strategy"] == "max_tokens"
+    assert inner.requests[-1][1] <= 2000
+
+    prompt = "指令：总结下文。" + "山门前的石阶很长。" * 1000 + "要求：输出JSON。"
+    response = await model.generate_text(prompt, max_tokens=500)
+    compressed, max_tokens = inner.requests[-1]
+    assert response.metadata["overflow"]["strategy"] == "compress"
+    assert compressed.startswith("指令") and compressed.endswith("要求：输出JSON。")
+    assert COMPRESSION_MARKER in compressed
+    assert count_tokens(compressed, "primary") + max_tokens <= 2000
+    assert stats.to_dict()["unknown"]["recovered"] == 2
+
+@pytest.mark.asyncio
+async def test_overflow_uses_rebuilder_and_recovers_streams():
+    """
+    测试调用方提供重建函数时按目标预算重建提示，流式调用在输出前超限时同样恢复；overflow=False时直接抛出
+    """
+    inner = LimitedAdapter("primary", limit=1000)
+    model = OverflowRecoveryAdapter(inner, stats=OverflowStats())
+    budgets = []
+
+    async def rebuild(prompt_tokens):
+        budgets.append(prompt_tokens)
+        return "摘要后的上下文"
+
+    chunks = [chunk async for chunk in model.generate_text_stream("长" * 3000, max_tokens=200, overflow=rebuild)]
+
+    assert chunks == ["林风", "拜师"]
+    assert budgets[0] + 200 <= 1000
+    assert inner.requests[-1][0] == "摘要后的上下文"
+
+    with pytest.raises(TokenLimitError):
+        await model.generate_text("长" * 3000, max_tokens=200, overflow=False)
+
+@pytest.mark.asyncio
+async def test_analysis_overflow_switches_to_map_reduce():
+    """
+    测试分析调用超出供应商的上下文窗口时改为分块分析并归并结果
+    """
+    overflow_stats.reset()
+    inner = LimitedAdapter("primary", limit=1500)
+    model = OverflowRecoveryAdapter(inner, stats=OverflowStats())
+    safe = "他们在山门前静静地喝茶聊天。" * 60
+    text = safe + "两人突然爆发打斗，场面充满暴力。" + safe
+
+    result = await model.check_content_safety(text)
+
+    assert result["is_safe"] is False
+    assert inner.calls > 2
+    stats = overflow_stats.to_dict()["check_content_safety"]
+    assert list(stats["strategies"]) == ["map_reduce"]
+    assert stats["failed"] == 0
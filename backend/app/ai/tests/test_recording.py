@@ -0,0 +1,53 @@
+import pytest
+
+from app.ai import (
+    CassetteMissError,
+    FakeModelAdapter,
+    ModelRateLimitError,
+    RecordingAdapter,
+)
+
+@pytest.mark.asyncio
+async def test_record_then_replay(tmp_path):
+    """
+    测试录制的调用可以在没有上游的情况下原样回放
+    """
+    path = str(tmp_path / "run.jsonl")
+    upstream = FakeModelAdapter(output_tokens=10, time_scale=0)
+    recorder = RecordingAdapter(upstream, path)
+
+    response = await recorder.generate_text("测试提示", temperature=0)
+    chunks = [chunk async for chunk in recorder.generate_text_stream("流式提示")]
+    vectors = await recorder.generate_embeddings(["甲", "乙"])
+
+    player = RecordingAdapter(
+        FakeModelAdapter(seed=99, time_scale=0), path, mode="replay", time_scale=0
+    )
+    replayed = await player.generate_text("测试提示", temperature=0)
+
+    assert replayed.content == response.content
+    assert replayed.tokens_used == response.tokens_used
+    assert replayed.metadata["replayed"] is True
+    result = {}
+    assert [c async for c in player.generate_text_stream("流式提示", stream_result=result)] == chunks
+    assert result == {"finish_reason": "stop"}
+    assert await player.generate_embeddings(["甲", "乙"]) == vectors
+
+    with pytest.raises(CassetteMissError):
+        await player.generate_text("未录制的提示")
+
+@pytest.mark.asyncio
+async def test_replay_reproduces_recorded_errors(tmp_path):
+    """
+    测试录制的模型错误在回放时按原类型抛出
+    """
+    path = str(tmp_path / "errors.jsonl")
+    recorder = RecordingAdapter(
+        FakeModelAdapter(rate_limit_error_rate=1.0, time_scale=0), path
+    )
+    with pytest.raises(ModelRateLimitError):
+        await recorder.generate_text("测试提示")
+
+    player = RecordingAdapter(FakeModelAdapter(), path, mode="replay", time_scale=0)
+    with pytest.raises(ModelRateLimitError):
+        await player.generate_text("测试提示")
@@ -0,0 +1,94 @@
+import openai
+import pytest
+
+from app.ai import (
+    ModelAPIError,
+    ModelRateLimitError,
+    OpenAIAdapter,
+    RetryBudget,
+    RetryPolicy,
+    RetryRule,
+    TokenLimitError,
+    with_retry,
+)
+
+class FlakyClient:
+    """
+    按顺序抛出预设错误，错误用完后返回成功
+    """
+    def __init__(self, errors, budget=None, rules=None):
+        self.errors = list(errors)
+        self.calls = 0
+        self.retry_policy = RetryPolicy(
+            rules or {"rate_limit": RetryRule(max_attempts=4, base_delay=0.001, max_delay=0.001)},
+            budget=budget or RetryBudget()
+        )
+
+    @with_retry
+    async def call(self):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return "ok"
+
+def rate_limit(retry_after=None):
+    return ModelRateLimitError(
+        message="rate limited",
+        model_name="primary",
+        error_code="rate_limit_exceeded",
+        error_type="rate_limit",
+        metadata={} if retry_after is None else {"retry_after": retry_after}
+    )
+
+@pytest.mark.asyncio
+async def test_retryable_errors_honour_retry_after():
+    """
+    测试限流错误按Retry-After重试，服务端要求等待过久时不重试
+    """
+    client = FlakyClient([rate_limit(0.01), rate_limit()])
+    assert await client.call() == "ok"
+    assert client.calls == 3
+    assert client.retry_policy.budget.stats()["retries_by_type"] == {"rate_limit": 2}
+
+    client = FlakyClient([rate_limit(600)])
+    with pytest.raises(ModelRateLimitError):
+        await client.call()
+    assert client.calls == 1
+
+    adapter = OpenAIAdapter(api_key="test-key", model_name="gpt-4")
+    error = adapter._convert_error(openai.error.RateLimitError("slow down", headers={"Retry-After": "2"}))
+    assert error.metadata["retry_after"] == 2.0
+
+@pytest.mark.asyncio
+async def test_errors_that_cannot_succeed_are_not_retried():
+    """
+    测试token超限和无效请求不重试
+    """
+    token_limit = TokenLimitError("too long", "primary", "token_limit_exceeded", "token_limit")
+    invalid = ModelAPIError("bad", "primary", "invalid_request", "api_error")
+    rules = {"api_error": RetryRule(base_delay=0.001), "token_limit": RetryRule(base_delay=0.001)}
+
+    for error in (token_limit, invalid):
+        client = FlakyClient([error], rules=rules)
+        with pytest.raises(type(error)):
+            await client.call()
+        assert client.calls == 1
+        assert sum(client.retry_policy.budget.stats()["not_retryable_by_type"].values()) == 1
+
+@pytest.mark.asyncio
+async def test_retry_budget_caps_retries():
+    """
+    测试重试次数超过预算后不再重试
+    """
+    budget = RetryBudget(ratio=0.0, min_retries=1)
+
+    first = FlakyClient([rate_limit()], budget=budget)
+    assert await first.call() == "ok"
+
+    second = FlakyClient([rate_limit()], budget=budget)
+    with pytest.raises(ModelRateLimitError):
+        await second.call()
+
+    assert second.calls == 1
+    assert budget.stats()["denied"] == 1
+    assert budget.stats()["requests"] == 2
@@ -0,0 +1,85 @@
+import pytest
+
+from app.ai import (
+    BaseModelAdapter,
+    ModelManager,
+    ModelResponse,
+    ModelRateLimitError,
+    ModelAPIError,
+)
+
+class StubAdapter(BaseModelAdapter):
+    """
+    测试用的模型适配器
+    """
+    def __init__(self, model_name, error=None):
+        self.model_name = model_name
+        self.error = error
+        self.calls = 0
+
+    async def generate_text(self, prompt, max_tokens=1000, temperature=0.7, stop=None, **kwargs):
+        self.calls += 1
+        if self.error:
+            raise self.error
+        return ModelResponse(content=prompt, tokens_used=1, model_name=self.model_name)
+
+    async def generate_embedding(self, text):
+        return [0.0]
+
+    def get_token_count(self, text):
+        return len(text)
+
+def rate_limit_error(model_name):
+    return ModelRateLimitError(
+        message="rate limited",
+        model_name=model_name,
+        error_code="rate_limit_exceeded",
+        error_type="rate_limit"
+    )
+
+@pytest.mark.asyncio
+async def test_failover_on_rate_limit():
+    """
+    测试限流时切换到备用模型并记录原因
+    """
+    manager = ModelManager()
+    primary = StubAdapter("primary", error=rate_limit_error("primary"))
+    backup = StubAdapter("backup")
+    manager.register_model("primary", primary, is_default=True, fallback="backup")
+    manager.register_model("backup", backup)
+
+    response = await manager.get_router().generate_text("测试提示")
+
+    assert response.model_name == "backup"
+    assert response.metadata["routing"]["fallback_from"] == "primary"
+    assert "ModelRateLimitError" in manager.last_decision.reason
+    assert manager.get_stats("primary").error_rate == 1.0
+
+@pytest.mark.asyncio
+async def test_no_failover_on_api_error():
+    """
+    测试非限流/超时错误不触发故障转移
+    """
+    manager = ModelManager()
+    error = ModelAPIError("bad", "primary", "invalid_request", "api_error")
+    manager.register_model("primary", StubAdapter("primary", error=error), fallback="backup")
+    manager.register_model("backup", StubAdapter("backup"))
+
+    with pytest.raises(ModelAPIError):
+        await manager.get_router().generate_text("测试提示")
+
+def test_select_model_skips_unhealthy():
+    """
+    测试错误率过高的模型不参与路由
+    """
+    manager = ModelManager()
+    manager.register_model("a", StubAdapter("a"))
+    manager.register_model("b", StubAdapter("b"))
+    for _ in range(10):
+        manager.record_call("a", 0.1, success=False)
+        manager.record_call("b", 0.5, success=True)
+
+    for _ in range(20):
+        decision = manager.select_model(["a", "b"])
+        assert decision.model_name == "b"
+    assert "excluded unhealthy: a" in decision.reason
@@ -0,0 +1,156 @@
+import pytest
+
+from app.ai import (
+    ModelResponse,
+    SemanticCache,
+    SemanticCacheAdapter,
+    SemanticCachePolicy,
+    semantic_cache,
+    wrap_model,
+)
+from app.ai.tests.test_router import StubAdapter
+
+class CharEmbeddingAdapter(StubAdapter):
+    """
+    以字符计数作为嵌入向量，字符组成相近的提示相似度高
+    """
+    def __init__(self, model_name):
+        super().__init__(model_name)
+        self.embeddings = 0
+
+    async def generate_embedding(self, text):
+        self.embeddings += 1
+        vector = [0.0] * 64
+        for char in text:
+            vector[ord(char) % 64] += 1.0
+        return vector
+
+def make_adapter(cache=None, **policy):
+    policy.setdefault("min_prompt_length", 0)
+    inner = CharEmbeddingAdapter("primary")
+    model = SemanticCacheAdapter(
+        inner,
+        cache or SemanticCache(),
+        policies={"extract_keywords": SemanticCachePolicy(**policy)}
+    )
+    return inner, model
+
+@pytest.mark.asyncio
+async def test_near_duplicate_prompts_reuse_response():
+    """
+    测试只有空白差异和细微改动的提示命中语义缓存
+    """
+    inner, model = make_adapter(threshold=0.9)
+
+    first = await model.generate_text(
+        "提取关键词： 林风走进山门， 拜师学艺", temperature=0.3, task_type="extract_keywords"
+    )
+    spaced = await model.generate_text(
+        "提取关键词：  林风走进山门，\n  拜师学艺\n", temperature=0.3, task_type="extract_keywords"
+    )
+    reordered = await model.generate_text(
+        "提取关键词： 林风拜师学艺， 走进山门", temperature=0.3, task_type="extract_keywords"
+    )
+
+    assert inner.calls == 1
+    assert spaced.content == first.content
+    assert spaced.metadata["semantic_cache"]["similarity"] == 1.0
+    assert reordered.tokens_used == 0
+    assert model.cache.stats()["exact_hits"] == 1
+    assert model.cache.stats()["hits"] == 1
+
+@pytest.mark.asyncio
+async def test_unconfigured_task_types_and_dissimilar_prompts_miss():
+    """
+    测试未配置的任务类型不使用语义缓存，不相似的提示不命中
+    """
+    inner, model = make_adapter(threshold=0.95)
+
+    await model.generate_text("分类：林风走进山门", temperature=0.3, task_type="classify_text")
+    await model.generate_text("分类：林风走进山门", temperature=0.3, task_type="classify_text")
+    assert inner.calls == 2
+    assert inner.embeddings == 0
+
+    await model.generate_text("提取关键词：林风走进山门", temperature=0.3, task_type="extract_keywords")
+    await model.generate_text("提取关键词：月下独酌，举杯邀明月", temperature=0.3, task_type="extract_keywords")
+    assert inner.calls == 4
+
+@pytest.mark.asyncio
+async def test_eviction_by_size_and_age():
+    """
+    测试超过容量时淘汰最久未命中的条目，过期条目不再命中
+    """
+    cache = SemanticCache(max_entries=2)
+    response = ModelResponse(content="结果", tokens_used=5, model_name="primary")
+
+    cache.add("p", "a", [1.0, 0.0, 0.0], response, ttl=60)
+    cache.add("p", "b", [0.0, 1.0, 0.0], response, ttl=60)
+    assert await cache.search("p", [1.0, 0.0, 0.0], 0.99) is not None
+    cache.add("p", "c", [0.0, 0.0, 1.0], response, ttl=60)
+
+    assert len(cache) == 2
+    assert cache.stats()["evictions"] == 1
+    assert await cache.search("p", [0.0, 1.0, 0.0], 0.99) is None
+    assert await cache.search("p", [1.0, 0.0, 0.0], 0.99) is not None
+
+    cache.add("p", "d", [0.5, 0.5, 0.0], response, ttl=-1)
+    assert cache.get_exact("p", "d") is None
+
+@pytest.mark.asyncio
+async def test_use_cache_false_reaches_semantic_cache():
+    """
+    测试通过wrap_model组装的包装链中use_cache=False同样跳过语义缓存
+    """
+    inner = CharEmbeddingAdapter("primary")
+    model = wrap_model(inner, {"semantic_cache": {"extract_keywords": {"threshold": 0.9, "min_prompt_length": 0}}})
+    semantic_cache.clear()
+    prompt = "提取关键词： 苏晴在雨夜赶回客栈"
+
+    await model.generate_text(prompt, temperature=0.3, task_type="extract_keywords")
+    # 空白不同的提示不命中精确缓存，但会命中语义缓存
+    await model.generate_text(prompt + " ", temperature=0.3, task_type="extract_keywords")
+    assert inner.calls == 1
+
+    await model.generate_text(
+        prompt + " ", temperature=0.3, task_type="extract_keywords", use_cache=False
+    )
+    assert inner.calls == 2
+    semantic_cache.clear()
+
+@pytest.mark.asyncio
+async def test_partition_size_is_capped():
+    """
+    测试单个分区超过容量时淘汰分区内最久未命中的条目，其他分区不受影响
+    """
+    cache = SemanticCache(max_entries=10, max_partition_entries=2)
+    response = ModelResponse(content="结果", tokens_used=5, model_name="primary")
+
+    cache.add("q", "x", [1.0, 1.0, 0.0], response, ttl=60)
+    cache.add("p", "a", [1.0, 0.0, 0.0], response, ttl=60)
+    cache.add("p", "b", [0.0, 1.0, 0.0], response, ttl=60)
+    assert await cache.search("p", [1.0, 0.0, 0.0], 0.99) is not None
+    cache.add("p", "c", [0.0, 0.0, 1.0], response, ttl=60)
+
+    assert len(cache) == 3
+    assert cache.get_exact("p", "b") is None
+    assert cache.get_exact("p", "a") is not None
+    assert cache.get_exact("q", "x") is not None
+
+@pytest.mark.asyncio
+async def test_short_prompts_skip_embedding():
+    """
+    测试短提示只做精确匹配、不生成嵌入向量，嵌入调用次数计入统计
+    """
+    inner, model = make_adapter(threshold=0.9, min_prompt_length=20)
+
+    await model.generate_text("提取关键词：林风", temperature=0.3, task_type="extract_keywords")
+    await model.generate_text("提取关键词：林风", temperature=0.3, task_type="extract_keywords")
+    assert inner.calls == 1
+    assert inner.embeddings == 0
+    assert model.cache.stats()["short_prompts"] == 1
+
+    await model.generate_text(
+        "提取关键词：林风走进山门，拜师学艺，从此踏上修行之路", temperature=0.3, task_type="extract_keywords"
+    )
+    assert inner.embeddings == 1
+    assert model.cache.stats()["embedding_calls"] == 1
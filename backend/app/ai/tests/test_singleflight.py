@@ -0,0 +1,68 @@
+import asyncio
+import pytest
+
+from app.ai import SingleFlight, SingleFlightAdapter
+from app.ai.tests.test_router import StubAdapter
+
+class SlowAdapter(StubAdapter):
+    """
+    返回前让出事件循环，模拟进行中的上游请求
+    """
+    async def generate_text(self, prompt, max_tokens=1000, temperature=0.7, stop=None, **kwargs):
+        await asyncio.sleep(0.01)
+        return await super().generate_text(prompt, max_tokens, temperature, stop, **kwargs)
+
+@pytest.mark.asyncio
+async def test_concurrent_identical_calls_share_one_request():
+    """
+    测试并发的相同调用只请求一次
+    """
+    inner = SlowAdapter("primary")
+    group = SingleFlight()
+    model = SingleFlightAdapter(inner, group=group)
+
+    responses = await asyncio.gather(*[
+        model.generate_text("测试提示", temperature=0) for _ in range(3)
+    ])
+
+    assert inner.calls == 1
+    assert [r.content for r in responses] == ["测试提示"] * 3
+    assert sum(r.tokens_used for r in responses) == 1
+    assert sum(bool(r.metadata.get("coalesced")) for r in responses) == 2
+    assert group.stats()["coalesced"] == 2
+    assert group.inflight == 0
+
+@pytest.mark.asyncio
+async def test_non_deterministic_calls_are_not_coalesced():
+    """
+    测试高温度调用和显式关闭合并的调用不合并
+    """
+    inner = SlowAdapter("primary")
+    model = SingleFlightAdapter(inner, group=SingleFlight())
+
+    await asyncio.gather(
+        model.generate_text("测试提示", temperature=0.9),
+        model.generate_text("测试提示", temperature=0.9),
+        model.generate_text("测试提示", temperature=0, coalesce=False),
+        model.generate_text("测试提示", temperature=0, coalesce=False),
+    )
+
+    assert inner.calls == 4
+
+@pytest.mark.asyncio
+async def test_cancelled_leader_does_not_cancel_followers():
+    """
+    测试第一个调用者被取消时其他调用者仍能拿到结果
+    """
+    inner = SlowAdapter("primary")
+    model = SingleFlightAdapter(inner, group=SingleFlight())
+
+    leader = asyncio.create_task(model.generate_text("测试提示", temperature=0))
+    await asyncio.sleep(0)
+    follower = asyncio.create_task(model.generate_text("测试提示", temperature=0))
+    await asyncio.sleep(0)
+    leader.cancel()
+
+    response = await follower
+    assert response.content == "测试提示"
+    assert inner.calls == 1
@@ -0,0 +1,96 @@
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, Mock, patch
+
+from app.ai import OpenAIAdapter, TaskStreamBroker
+
+class _FakeStream:
+    """
+    模拟OpenAI流式响应，最后一个增量带有finish_reason
+    """
+    def __init__(self, pieces, finish_reason="stop"):
+        self._pieces = list(pieces)
+        self.finish_reason = finish_reason
+        self.closed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self._pieces:
+            raise StopAsyncIteration
+        piece = self._pieces.pop(0)
+        finish_reason = None if self._pieces else self.finish_reason
+        return Mock(choices=[Mock(delta={"content": piece}, finish_reason=finish_reason)])
+
+    async def aclose(self):
+        self.closed = True
+
+@pytest.mark.asyncio
+async def test_generate_text_stream_yields_chunks():
+    """
+    测试流式生成逐块返回内容
+    """
+    adapter = OpenAIAdapter(api_key="test-key", model_name="gpt-4")
+    fake_stream = _FakeStream(["第一", "第二", "第三"], finish_reason="length")
+    result = {}
+
+    with patch("openai.ChatCompletion.acreate", AsyncMock(return_value=fake_stream)) as create:
+        chunks = [
+            chunk async for chunk in adapter.generate_text_stream("测试提示", stream_result=result)
+        ]
+
+    assert chunks == ["第一", "第二", "第三"]
+    assert fake_stream.closed
+    assert result == {"finish_reason": "length"}
+    assert "stream_result" not in create.call_args.kwargs
+
+@pytest.mark.asyncio
+async def test_generate_text_stream_early_close():
+    """
+    测试提前结束迭代时关闭上游流
+    """
+    adapter = OpenAIAdapter(api_key="test-key", model_name="gpt-4")
+    fake_stream = _FakeStream(["第一", "第二", "第三"])
+
+    with patch("openai.ChatCompletion.acreate", AsyncMock(return_value=fake_stream)):
+        stream = adapter.generate_text_stream("测试提示")
+        first = await stream.__anext__()
+        await stream.aclose()
+
+    assert first == "第一"
+    assert fake_stream.closed
+
+@pytest.mark.asyncio
+async def test_task_stream_broker_replay_and_cancel():
+    """
+    测试任务流的回放与取消
+    """
+    broker = TaskStreamBroker()
+    stream = broker.open(1)
+    await broker.publish(1, "a")
+
+    async def consume():
+        return [chunk async for chunk in stream.subscribe()]
+
+    consumer = asyncio.create_task(consume())
+    await broker.publish(1, "b")
+    assert broker.cancel(1)
+    assert broker.is_cancelled(1)
+    await broker.close(1)
+
+    assert await consumer == ["a", "b"]
+    assert not broker.cancel(1)
+
+@pytest.mark.asyncio
+async def test_task_stream_close_keeps_first_result():
+    """
+    测试重复关闭任务流时保留第一次的结束状态
+    """
+    broker = TaskStreamBroker()
+    stream = broker.open(1)
+    await broker.close(1, error="生成失败")
+    await broker.close(1)
+
+    assert stream.error == "生成失败"
+    assert [chunk async for chunk in stream.subscribe()] == []
@@ -0,0 +1,79 @@
+import pytest
+from unittest.mock import patch
+
+from app.ai import (
+    PromptTemplate,
+    TemplateRegistry,
+    count_tokens,
+    load_prompt_template,
+    template_registry,
+    validate_prompt_variables,
+)
+from app.ai.tokenizer import TokenizerRegistry
+
+def test_prompt_template_render_and_variables():
+    """
+    测试模板解析出的变量和渲染结果与str.format一致
+    """
+    text = "为{genre}小说写{count:03d}个{{占位}}，主角{hero.name}，{genre}风格"
+    template = PromptTemplate(text)
+
+    class Hero:
+        name = "林远"
+
+    assert template.variables == {"genre", "count", "hero"}
+    assert template.render(genre="武侠", count=5, hero=Hero()) == text.format(
+        genre="武侠", count=5, hero=Hero()
+    )
+    assert template.missing_variables({"genre": "武侠"}) == ["count", "hero"]
+    with pytest.raises(KeyError):
+        template.render(genre="武侠")
+
+def test_token_count_reuses_static_tokens():
+    """
+    测试估算token数时静态部分只分词一次
+    """
+    template = PromptTemplate("请为{genre}小说创建详细的故事大纲，题材为{genre}。")
+    registry = TokenizerRegistry()
+
+    with patch("app.ai.templates.tokenizer_registry", registry), \
+            patch.object(registry, "count", wraps=registry.count) as count:
+        first = template.token_count(genre="武侠")
+        second = template.token_count(genre="科幻")
+        counted = [call.args[0] for call in count.call_args_list]
+
+    assert counted.count(template._static_text) == 1
+    assert first == template.static_tokens() + 2 * count_tokens("武侠")
+    assert second == template.static_tokens() + 2 * count_tokens("科幻")
+
+def test_registry_compiles_once_and_registers_prompts():
+    """
+    测试同一模板文本只编译一次，内置提示模板已注册
+    """
+    registry = TemplateRegistry()
+    assert registry.compile("你好，{name}") is registry.compile("你好，{name}")
+    assert "genre" in template_registry.get("OUTLINE_PROMPT").variables
+    with pytest.raises(ValueError):
+        registry.get("MISSING_PROMPT")
+
+def test_registry_bounds_compiled_texts():
+    """
+    测试按文本编译的结果有容量上限，命名模板不会被淘汰
+    """
+    registry = TemplateRegistry(max_compiled=2)
+    named = registry.register("GREETING_PROMPT", "你好，{name}")
+    for index in range(5):
+        registry.compile(f"第{index}章：{{title}}")
+
+    assert len(registry._by_text) == 2
+    assert registry.get("GREETING_PROMPT") is named
+
+def test_stray_braces():
+    """
+    测试未转义的单个花括号：渲染时与str.format一样抛出ValueError，校验变量时退回按{name}查找
+    """
+    text = "返回JSON：{\"title\": {title}"
+    with pytest.raises(ValueError):
+        load_prompt_template(text, title="标题")
+    assert validate_prompt_variables(text, {}) == ["title"]
+    assert validate_prompt_variables(text, {"title": "标题"}) == []
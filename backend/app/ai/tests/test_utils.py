@@ -2,11 +2,16 @@ import pytest
 from unittest.mock import patch
 import json
 
+from app.ai.tokenizer import tokenizer_registry, estimate_tokens
 from app.ai.utils import (
     load_prompt_template,
     parse_json_response,
     count_tokens,
+    count_tokens_batch,
     chunk_text,
+    chunk_chars,
+    iter_chunks,
+    pack_batches,
     validate_prompt_variables,
     sanitize_prompt_input,
     merge_generations,
@@ -14,6 +19,15 @@ from app.ai.utils import (
     rate_content_quality,
 )
 
+@pytest.fixture(autouse=True)
+def clear_tokenizer_registry():
+    """
+    每个测试前清空已缓存的编码，保证对tiktoken的模拟生效
+    """
+    tokenizer_registry.clear()
+    yield
+    tokenizer_registry.clear()
+
 def test_load_prompt_template():
     """
     测试提示模板加载
@@ -56,10 +70,31 @@ def test_count_tokens(text, expected_count):
     """
     # 模拟tiktoken
     with patch('tiktoken.encoding_for_model') as mock_encoding:
-        mock_encoding.return_value.encode.return_value = [0] * expected_count
+        mock_encoding.return_value.encode_ordinary.return_value = [0] * expected_count
         count = count_tokens(text)
         assert count == expected_count
 
+def test_count_tokens_loads_encoding_once():
+    """
+    测试编码只加载一次
+    """
+    with patch('tiktoken.encoding_for_model') as mock_encoding:
+        mock_encoding.return_value.encode_ordinary.return_value = [0, 0]
+        mock_encoding.return_value.encode_ordinary_batch.return_value = [[0], [0, 0]]
+        count_tokens("a")
+        count_tokens("b")
+        assert count_tokens_batch(["a", "b"]) == [1, 2]
+        assert mock_encoding.call_count == 1
+
+def test_estimate_tokens():
+    """
+    测试无分词器时的token估算
+    """
+    assert estimate_tokens("") == 0
+    assert isinstance(estimate_tokens("Hello World"), int)
+    # 中文文本没有空格，也应按字数估算
+    assert estimate_tokens("这是一个很长的中文句子") > estimate_tokens("这是")
+
 def test_chunk_text():
     """
     测试文本分块
@@ -70,7 +105,7 @@ def test_chunk_text():
     
     # 模拟tiktoken
     with patch('tiktoken.encoding_for_model') as mock_encoding:
-        mock_encoding.return_value.encode.return_value = list(range(15))
+        mock_encoding.return_value.encode_ordinary.return_value = list(range(15))
         mock_encoding.return_value.decode.side_effect = lambda x: "".join(str(i) for i in x)
         
         chunks = chunk_text(text, max_tokens, overlap)
@@ -78,6 +113,42 @@ def test_chunk_text():
         assert len(chunks) > 0
         assert isinstance(chunks[0], str)
 
+def test_iter_chunks_without_tokenizer():
+    """
+    测试无分词器时按句子边界分块，且逐章惰性分块与整体分块结果一致
+    """
+    chapter = "这是第一句。这是第二句！这是第三句？" * 20
+    with patch.object(tokenizer_registry, "get_encoding", return_value=None):
+        chunks = chunk_text(chapter * 2, max_tokens=30, boundary_window=10)
+        lazy = list(iter_chunks(iter([chapter, chapter]), max_tokens=30, boundary_window=10))
+
+    assert "".join(chunks) == chapter * 2
+    assert all(chunk[-1] in "。！？" for chunk in chunks)
+    assert lazy == chunks
+
+def test_chunk_chars_counts_characters():
+    """
+    测试按字符数分块：每块不超过上限，优先在句子边界切分，块之间不重叠
+    """
+    text = "这是第一句。这是第二句！这是第三句？" * 20
+    chunks = chunk_chars(text, max_chars=50, boundary_window=10)
+
+    assert "".join(chunks) == text
+    assert all(len(chunk) <= 50 for chunk in chunks)
+    assert all(chunk[-1] in "。！？" for chunk in chunks)
+    assert chunk_chars("无标点的长文本" * 10, max_chars=20, boundary_window=5)[0] == ("无标点的长文本" * 3)[:20]
+
+def test_pack_batches():
+    """
+    测试按条数和token预算打包批次
+    """
+    texts = ["a" * 3, "b" * 3, "c" * 3, "d" * 10, "e"]
+    batches = pack_batches(texts, max_items=2, max_tokens=8, token_counter=len)
+
+    # 保持输入顺序且每个下标只出现一次
+    assert [i for batch in batches for i in batch] == list(range(len(texts)))
+    assert batches == [[0, 1], [2], [3], [4]]
+
 def test_validate_prompt_variables():
     """
     测试提示模板变量验证
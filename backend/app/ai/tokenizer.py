@@ -0,0 +1,122 @@
+"""
+分词器注册表
+每种编码在进程内只加载一次，供token计数、文本分块等功能共享
+"""
+import logging
+import math
+import re
+import threading
+from typing import Any, Dict, List, Optional
+
+try:
+    import tiktoken
+except ImportError:  # pragma: no cover - tiktoken为可选依赖
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+# 未知模型使用的默认编码
+DEFAULT_ENCODING = "cl100k_base"
+
+# 中日韩字符（含全角标点），这类文本没有空格分词
+_CJK_PATTERN = re.compile(
+    r"[\u3000-\u303f\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uff00-\uffef]"
+)
+_WORD_PATTERN = re.compile(r"[A-Za-z0-9_]+|[^\sA-Za-z0-9_]")
+
+def estimate_tokens(text: str) -> int:
+    """
+    快速估算token数量
+    无法加载分词器时使用：中日韩字符按每字约1.5个token计，
+    其余部分按单词约1.3个token计，返回向上取整的整数
+    """
+    if not text:
+        return 0
+
+    cjk_count = len(_CJK_PATTERN.findall(text))
+    if cjk_count:
+        text = _CJK_PATTERN.sub(" ", text)
+    word_count = len(_WORD_PATTERN.findall(text))
+
+    return int(math.ceil(cjk_count * 1.5 + word_count * 1.3))
+
+class TokenizerRegistry:
+    """
+    进程级分词器注册表
+    按模型名缓存编码对象，加载失败的模型也会被记录，避免重复尝试
+    """
+
+    def __init__(self):
+        self._encodings: Dict[str, Optional[Any]] = {}
+        self._lock = threading.Lock()
+
+    def get_encoding(self, model: str = "gpt-4") -> Optional[Any]:
+        """
+        获取模型对应的编码，无法加载时返回None
+        """
+        try:
+            return self._encodings[model]
+        except KeyError:
+            pass
+
+        with self._lock:
+            if model not in self._encodings:
+                self._encodings[model] = self._load(model)
+            return self._encodings[model]
+
+    def _load(self, model: str) -> Optional[Any]:
+        if tiktoken is None:
+            return None
+
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            # 未登记的模型名（如自定义部署）使用默认编码
+            try:
+                return tiktoken.get_encoding(DEFAULT_ENCODING)
+            except Exception as e:
+                logger.warning(f"Failed to load encoding {DEFAULT_ENCODING}: {e}")
+        except Exception as e:
+            logger.warning(f"Failed to load encoding for model {model}: {e}")
+        return None
+
+    def count(self, text: str, model: str = "gpt-4") -> int:
+        """
+        计算单个文本的token数量
+        """
+        if not text:
+            return 0
+
+        encoding = self.get_encoding(model)
+        if encoding is not None:
+            try:
+                return len(encoding.encode_ordinary(text))
+            except Exception:
+                pass
+        return estimate_tokens(text)
+
+    def count_batch(self, texts: List[str], model: str = "gpt-4") -> List[int]:
+        """
+        批量计算token数量
+        使用encode_ordinary_batch在多线程中编码
+        """
+        if not texts:
+            return []
+
+        encoding = self.get_encoding(model)
+        if encoding is not None:
+            try:
+                return [len(tokens) for tokens in encoding.encode_ordinary_batch(texts)]
+            except Exception:
+                pass
+        return [estimate_tokens(text) for text in texts]
+
+    def clear(self) -> None:
+        """
+        清空已加载的编码
+        """
+        with self._lock:
+            self._encodings.clear()
+
+# 全局分词器注册表实例
+tokenizer_registry = TokenizerRegistry()
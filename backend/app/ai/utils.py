@@ -1,86 +1,268 @@
-from typing import List, Dict, Any, Optional
-import json
-import tiktoken
+import re
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
 from app.core.config import settings
+from .json_stream import extract_json
+from .reducers import REDUCERS, get_reducer
+from .templates import template_registry
+from .tokenizer import tokenizer_registry
 
 def load_prompt_template(template: str, **kwargs: Any) -> str:
     """
     加载并格式化提示模板
+    模板只在第一次使用时解析，缺少变量时抛出KeyError；
+    与str.format一样，含有未转义的单个花括号时抛出ValueError
     """
-    return template.format(**kwargs)
+    return template_registry.compile(template).render(**kwargs)
 
 def parse_json_response(response: str) -> Dict[str, Any]:
     """
     解析模型返回的JSON响应
-    处理各种可能的格式问题
+    处理代码块标记、前后说明文字等格式问题
     """
     try:
-        # 尝试直接解析
-        return json.loads(response)
-    except json.JSONDecodeError:
-        try:
-            # 尝试提取JSON部分
-            import re
-            json_pattern = r'\{.*\}'
-            match = re.search(json_pattern, response, re.DOTALL)
-            if match:
-                return json.loads(match.group())
-            return {"error": "无法解析JSON响应"}
-        except Exception:
-            return {"error": "响应格式错误"}
+        result = extract_json(response)
+    except ValueError:
+        return {"error": "无法解析JSON响应"}
+    if not isinstance(result, dict):
+        return {"error": "响应格式错误"}
+    return result
 
 def count_tokens(text: str, model: str = "gpt-4") -> int:
     """
     计算文本的token数量
+    编码从全局注册表获取，无法使用tiktoken时退化为快速估算
     """
-    try:
-        encoding = tiktoken.encoding_for_model(model)
-        return len(encoding.encode(text))
-    except Exception:
-        # 如果无法使用tiktoken，使用简单的估算
-        return len(text.split()) * 1.3
+    return tokenizer_registry.count(text, model)
+
+def count_tokens_batch(texts: List[str], model: str = "gpt-4") -> List[int]:
+    """
+    批量计算文本的token数量
+    """
+    return tokenizer_registry.count_batch(texts, model)
+
+# 句子边界标记，分块时优先在这些位置切分
+SENTENCE_BOUNDARIES = ("。", "！", "？", "…", ".", "!", "?", "\n")
+
+class _CharacterCodec:
+    """
+    无法加载分词器时的退化编码，以字符作为切分单位
+    """
+    # 保守估计每个字符约1.5个token（中文），用于换算分块大小
+    tokens_per_unit = 1.5
+
+    def encode_ordinary(self, text: str) -> List[str]:
+        return list(text)
+
+    def decode(self, units: List[str]) -> str:
+        return "".join(units)
+
+_boundary_cache: Dict[int, Any] = {}
+
+def _boundary_token_ids(encoding: Any) -> Any:
+    """
+    预先计算句子边界对应的token id，每种编码只计算一次
+    """
+    key = id(encoding)
+    cached = _boundary_cache.get(key)
+    if cached is not None and cached[0] is encoding:
+        return cached[1]
+
+    ids = set()
+    for mark in SENTENCE_BOUNDARIES:
+        for suffix in ("", "\n", "”", "\"", "」"):
+            try:
+                tokens = encoding.encode_ordinary(mark + suffix)
+            except Exception:
+                continue
+            if isinstance(tokens, list) and len(tokens) == 1:
+                ids.add(tokens[0])
+
+    boundary_ids = frozenset(ids)
+    _boundary_cache[key] = (encoding, boundary_ids)
+    return boundary_ids
+
+def _split_points(
+    tokens: List[Any],
+    boundary_ids: Any,
+    max_tokens: int,
+    boundary_window: int,
+    final: bool
+) -> Iterator[int]:
+    """
+    单遍计算切分位置
+    每块末尾boundary_window范围内从后向前寻找句子边界，找不到时在max_tokens处硬切；
+    相邻的块首尾相接、互不重叠；
+    final为False时不切出最后一块不足max_tokens的部分
+    """
+    start = 0
+    total = len(tokens)
+    while start < total:
+        end = start + max_tokens
+        if end >= total:
+            if final:
+                yield total
+            return
+
+        split_point = end
+        for i in range(end - 1, max(start, end - boundary_window) - 1, -1):
+            if tokens[i] in boundary_ids:
+                split_point = i + 1
+                break
+
+        yield split_point
+        start = split_point
+
+def iter_chunks(
+    texts: Iterable[str],
+    max_tokens: int = 2000,
+    boundary_window: int = 200,
+    model: str = "gpt-4"
+) -> Iterator[str]:
+    """
+    按token数量把连续的文本（如逐章读取的小说）惰性分块
+    每次只保留当前章节和上一章未切出的尾部token，适合处理整部小说
+    """
+    encoding = tokenizer_registry.get_encoding(model)
+    if encoding is None:
+        encoding = _CharacterCodec()
+        max_tokens = max(1, int(max_tokens / encoding.tokens_per_unit))
+        boundary_window = int(boundary_window / encoding.tokens_per_unit)
+        boundary_ids = frozenset(SENTENCE_BOUNDARIES)
+    else:
+        boundary_ids = _boundary_token_ids(encoding)
+
+    pending: List[Any] = []
+    for text in texts:
+        if not text:
+            continue
+        pending.extend(encoding.encode_ordinary(text))
+
+        start = 0
+        for split_point in _split_points(
+            pending, boundary_ids, max_tokens, boundary_window, final=False
+        ):
+            yield encoding.decode(pending[start:split_point])
+            start = split_point
+        pending = pending[start:]
+
+    start = 0
+    for split_point in _split_points(
+        pending, boundary_ids, max_tokens, boundary_window, final=True
+    ):
+        yield encoding.decode(pending[start:split_point])
+        start = split_point
 
 def chunk_text(
     text: str,
     max_tokens: int = 2000,
-    overlap: int = 200,
+    boundary_window: int = 200,
     model: str = "gpt-4"
 ) -> List[str]:
     """
-    将长文本分割成小块，保持上下文重叠
+    将长文本按token数量分割成小块
+    在每块末尾boundary_window个token的范围内寻找句子边界切分，避免截断句子；块之间不重叠，拼接后即原文
     """
+    return list(iter_chunks([text], max_tokens=max_tokens, boundary_window=boundary_window, model=model))
+
+def chunk_chars(
+    text: str,
+    max_chars: int = 2000,
+    boundary_window: int = 200
+) -> List[str]:
+    """
+    将长文本按字符数分割成小块
+    与chunk_text相同，在每块末尾boundary_window个字符的范围内寻找句子边界切分，支持无空格的中文文本
+    """
+    characters = list(text)
     chunks = []
-    encoding = tiktoken.encoding_for_model(model)
-    tokens = encoding.encode(text)
-    
     start = 0
-    while start < len(tokens):
-        end = start + max_tokens
-        if end >= len(tokens):
-            chunks.append(encoding.decode(tokens[start:]))
-            break
-            
-        # 在重叠区域内找到合适的分割点
-        split_point = end - overlap
-        while split_point < end:
-            if tokens[split_point] in {encoding.encode(".")[0], encoding.encode("。")[0]}:
-                break
-            split_point += 1
-                
-        chunks.append(encoding.decode(tokens[start:split_point]))
+    for split_point in _split_points(
+        characters, frozenset(SENTENCE_BOUNDARIES), max(1, max_chars), boundary_window, final=True
+    ):
+        chunks.append(text[start:split_point])
         start = split_point
-        
     return chunks
 
+def truncate_to_tokens(
+    text: str,
+    max_tokens: int,
+    model: str = "gpt-4",
+    keep: str = "head"
+) -> str:
+    """
+    把文本截断到不超过max_tokens个token
+    keep为head时保留开头，为tail时保留结尾（如前文章节只需要最近的部分）
+    """
+    if max_tokens <= 0:
+        return ""
+
+    encoding = tokenizer_registry.get_encoding(model)
+    if encoding is not None:
+        tokens = encoding.encode_ordinary(text)
+        if len(tokens) <= max_tokens:
+            return text
+        kept = tokens[:max_tokens] if keep == "head" else tokens[-max_tokens:]
+        # 多字节字符可能被切在token中间，去掉解码出的替换字符
+        return encoding.decode(kept).strip("�")
+
+    # 没有分词器时按估算的token数二分查找保留的字符数
+    if tokenizer_registry.count(text, model) <= max_tokens:
+        return text
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        piece = text[:middle] if keep == "head" else text[len(text) - middle:]
+        if tokenizer_registry.count(piece, model) <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    return text[:low] if keep == "head" else text[len(text) - low:]
+
+def pack_batches(
+    texts: List[str],
+    max_items: int = 100,
+    max_tokens: int = 8000,
+    token_counter: Callable[[str], int] = count_tokens,
+    token_counts: Optional[List[int]] = None
+) -> List[List[int]]:
+    """
+    按条数和token预算把文本打包成批次
+    返回每个批次包含的文本下标，保持输入顺序；单条超出预算的文本独占一个批次
+    已经批量计算过token数时可以通过token_counts直接传入
+    """
+    batches: List[List[int]] = []
+    current: List[int] = []
+    current_tokens = 0
+
+    for index, text in enumerate(texts):
+        tokens = token_counts[index] if token_counts is not None else token_counter(text)
+        if current and (
+            len(current) >= max_items
+            or current_tokens + tokens > max_tokens
+        ):
+            batches.append(current)
+            current = []
+            current_tokens = 0
+        current.append(index)
+        current_tokens += tokens
+
+    if current:
+        batches.append(current)
+
+    return batches
+
 def validate_prompt_variables(template: str, variables: Dict[str, Any]) -> List[str]:
     """
     验证提示模板变量是否完整
     返回缺失的变量列表
     """
-    import re
-    required_vars = set(re.findall(r'\{(\w+)\}', template))
-    provided_vars = set(variables.keys())
-    return list(required_vars - provided_vars)
+    try:
+        compiled = template_registry.compile(template)
+    except ValueError:
+        # 含有未转义的单个花括号等无法按str.format解析的文本时，退回只识别{name}形式的变量
+        required = set(re.findall(r"\{(\w+)\}", template))
+        return sorted(required.difference(variables))
+    return compiled.missing_variables(variables)
 
 def sanitize_prompt_input(text: str) -> str:
     """
@@ -94,20 +276,17 @@ def sanitize_prompt_input(text: str) -> str:
         return text[:max_length] + "..."
     return text
 
-def merge_generations(responses: List[str], mode: str = "concat") -> str:
+def merge_generations(responses: List[Any], mode: str = "concat") -> Any:
     """
     合并多个生成结果
+    mode为reducers中注册的归并方式（concat、first、longest、shortest、vote、average、max_risk、union），
+    未知的方式取第一个结果
     """
-    if mode == "concat":
-        return "\n".join(responses)
-    elif mode == "first":
-        return responses[0] if responses else ""
-    elif mode == "longest":
-        return max(responses, key=len) if responses else ""
-    elif mode == "shortest":
-        return min(responses, key=len) if responses else ""
-    else:
-        return responses[0] if responses else ""
+    if not responses:
+        return ""
+    if mode not in REDUCERS:
+        return responses[0]
+    return get_reducer(mode)(responses)
 
 def extract_constraints(prompt: str) -> Dict[str, Any]:
     """
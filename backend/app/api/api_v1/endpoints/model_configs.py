@@ -1,3 +1,4 @@
+import asyncio
 from typing import Any, List
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
@@ -9,6 +10,17 @@ from app.schemas.model_config import (
     ModelProviderConfig,
 )
 from app.models.user import User as UserModel
+from app.ai import (
+    cascade_stats,
+    hedge_budget,
+    model_manager,
+    output_length_predictor,
+    overflow_stats,
+    request_coalescer,
+    response_cache,
+    retry_budget,
+    semantic_cache,
+)
 from app import crud
 
 router = APIRouter()
@@ -62,6 +74,35 @@ async def create_model_config(
     )
     return config
 
+@router.get("/cache/stats", response_model=dict)
+async def read_cache_stats(
+    current_user: UserModel = Depends(deps.get_current_active_superuser)
+) -> Any:
+    """
+    获取模型响应缓存、语义缓存的命中统计和相同请求合并统计（仅管理员）
+    """
+    return {
+        **response_cache.stats(),
+        "coalescing": request_coalescer.stats(),
+        "semantic": semantic_cache.stats(),
+    }
+
+@router.get("/routing/stats", response_model=dict)
+async def read_routing_stats(
+    current_user: UserModel = Depends(deps.get_current_active_superuser)
+) -> Any:
+    """
+    获取模型路由统计、最近的路由决策、级联、对冲请求、重试、上下文超限恢复和输出长度统计（仅管理员）
+    """
+    return {
+        **model_manager.get_routing_stats(),
+        "cascade": cascade_stats.to_dict(),
+        "hedging": hedge_budget.stats(),
+        "retries": retry_budget.stats(),
+        "overflow": overflow_stats.to_dict(),
+        "output_length": output_length_predictor.stats(),
+    }
+
 @router.get("/{agent_id}", response_model=AgentModelConfig)
 async def read_model_config(
     *,
@@ -173,7 +214,9 @@ async def check_usage_limits(
     """
     检查使用限制
     """
-    result = crud.model_config.check_usage_limits(
+    # 限流器可能访问Redis，放到线程池中执行，避免阻塞事件循环
+    result = await asyncio.to_thread(
+        crud.model_config.check_usage_limits,
         db,
         agent_id=agent_id,
         tokens_required=tokens_required
@@ -1,10 +1,13 @@
-from typing import Any, List
+from typing import Any, AsyncIterator, List
+import json
 from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 
 from app.api import deps
 from app.schemas.agent import Task, TaskCreate, TaskUpdate
 from app.models.user import User as UserModel
+from app.ai import STREAMING_TASK_TYPES, task_stream_broker
 from app import crud
 
 router = APIRouter()
@@ -68,10 +71,11 @@ async def create_task(
         priority=task_in.priority
     )
     
-    # 在后台执行任务
+    # 在后台执行任务，非紧急任务加入离线批次
     background_tasks.add_task(
-        agent_manager.execute_task,
-        task.id
+        agent_manager.schedule_task,
+        task.id,
+        task_in.batch
     )
     
     return task
@@ -99,6 +103,65 @@ async def read_task(
         
     return task
 
+@router.get("/{task_id}/stream")
+async def stream_task(
+    *,
+    db: Session = Depends(deps.get_db),
+    task_id: int,
+    current_user: UserModel = Depends(deps.get_current_user)
+) -> Any:
+    """
+    以Server-Sent Events方式推送任务的生成内容
+    每个data事件携带一个增量文本片段，结束时发送done或error事件；
+    只有流式生成的任务类型（STREAMING_TASK_TYPES）可以订阅
+    """
+    task = crud.task.get(db, id=task_id)
+    if not task:
+        raise HTTPException(
+            status_code=404,
+            detail="任务不存在"
+        )
+        
+    # 检查访问权限
+    if not current_user.is_superuser:
+        deps.check_novel_access(task.novel_id, current_user=current_user, db=db)
+    
+    if task.task_type not in STREAMING_TASK_TYPES:
+        raise HTTPException(
+            status_code=400,
+            detail="该任务类型不支持流式输出"
+        )
+    
+    stream = task_stream_broker.get(task_id)
+    if stream is None:
+        if task.status in ("completed", "failed", "cancelled"):
+            raise HTTPException(
+                status_code=404,
+                detail="该任务没有可用的流式输出"
+            )
+        # 任务尚未开始生成，先创建通道等待输出
+        stream = task_stream_broker.open(task_id)
+    
+    async def event_source() -> AsyncIterator[str]:
+        async for chunk in stream.subscribe():
+            data = json.dumps({"content": chunk}, ensure_ascii=False)
+            yield f"data: {data}\n\n"
+        if stream.error:
+            data = json.dumps({"detail": stream.error}, ensure_ascii=False)
+            yield f"event: error\ndata: {data}\n\n"
+        else:
+            data = json.dumps({"cancelled": stream.cancelled})
+            yield f"event: done\ndata: {data}\n\n"
+    
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+        }
+    )
+
 @router.put("/{task_id}", response_model=Task)
 async def update_task(
     *,
@@ -144,6 +207,9 @@ async def cancel_task(
     # 获取Agent管理器
     agent_manager = deps.get_agent_manager(db)
     
+    # 中止正在进行的流式生成
+    task_stream_broker.cancel(task_id)
+    
     # 更新任务状态为已取消
     task_in = TaskUpdate(status="cancelled")
     task = crud.task.update(db, db_obj=task, obj_in=task_in)
@@ -30,6 +30,17 @@ class Settings(BaseSettings):
             path=f"/{values.get('POSTGRES_DB') or ''}",
         )
 
+    # AI模型配置
+    AI_MODEL_PROVIDER: str = "openai"  # 可选值: "openai", "fake"（离线压测）
+    AI_MODEL_API_KEY: str = ""
+    OPENAI_ORG_ID: Optional[str] = None
+    
+    # 离线批量推理配置，质量检查等非紧急任务攒批后提交
+    BATCH_WORK_DIR: str = "./data/batches"
+    BATCH_MAX_SIZE: int = 50  # 每个批次最多包含的任务数
+    BATCH_INTERVAL: int = 300  # 提交批次和收取结果的间隔（秒）
+    BATCH_MAX_CONCURRENCY: int = 2  # 本地批量实现同时执行的请求数
+
     # Redis配置
     REDIS_HOST: str = "redis"
     REDIS_PORT: int = 6379
@@ -41,6 +52,9 @@ class Settings(BaseSettings):
     # 事件总线配置
     EVENT_BUS_IMPLEMENTATION: str = "kafka"  # 可选值: "kafka", "redis", "memory"
     
+    # 限流器配置，多进程部署（API + Celery worker）时应使用redis共享配额
+    RATE_LIMITER_IMPLEMENTATION: str = "redis"  # 可选值: "redis", "memory"
+    
     # Milvus配置
     MILVUS_HOST: str = "milvus"
     MILVUS_PORT: int = 19530
@@ -1,3 +1,4 @@
+import asyncio
 from typing import Callable
 from fastapi import FastAPI
 from redis import Redis
@@ -6,6 +7,7 @@ import logging
 
 from .config import settings
 from .event_bus import init_event_bus, get_event_bus
+from .rate_limiter import init_rate_limiter
 
 logger = logging.getLogger(__name__)
 
@@ -57,6 +59,16 @@ def create_start_app_handler(app: FastAPI) -> Callable:
             decode_responses=True
         )
         
+        # 为模型响应缓存挂载Redis共享层
+        from app.ai import response_cache
+        response_cache.attach_redis(app.state.redis)
+        
+        # 初始化限流器
+        if settings.RATE_LIMITER_IMPLEMENTATION == "redis":
+            init_rate_limiter("redis", client=app.state.redis)
+        else:
+            init_rate_limiter("memory")
+        
         # 初始化事件总线
         event_bus_implementation = settings.EVENT_BUS_IMPLEMENTATION
         if event_bus_implementation == "kafka":
@@ -86,12 +98,17 @@ def create_start_app_handler(app: FastAPI) -> Callable:
             "writing_events",
             "qa_events",
             "coherence_events",
+            "model_events",
         ]
         await get_event_bus().create_topics(topics)
         
         # 创建Milvus集合
         create_milvus_collections()
         
+        # 启动离线批次的定期提交和结果收取
+        from app.agents.batch import run_batch_worker
+        app.state.batch_worker = asyncio.create_task(run_batch_worker())
+        
         logger.info("Application startup complete")
 
     return start_app
@@ -104,6 +121,15 @@ def create_stop_app_handler(app: FastAPI) -> Callable:
         # 关闭Redis连接
         await app.state.redis.close()
         
+        # 停止离线批次任务，未完成的本地批次在下次启动后重新执行
+        app.state.batch_worker.cancel()
+        from app.ai import close_batch_adapters
+        await close_batch_adapters()
+        
+        # 关闭模型适配器的连接池
+        from app.ai import model_manager
+        await model_manager.aclose()
+        
         # 事件总线会在FastAPI的shutdown事件中自动关闭
         
         logger.info("Application shutdown complete")
@@ -0,0 +1,451 @@
+"""
+模型调用限流器
+按Agent的usage_limits做准入控制：每分钟请求数使用滑动窗口计数器，
+每日token数使用按天计数器，两者的检查都是O(1)的。
+提供进程内实现和基于Redis Lua脚本的共享实现（API进程与Celery worker共用配额）
+"""
+import asyncio
+import threading
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional, Tuple
+
+# 每分钟请求限制的窗口长度（秒）
+MINUTE = 60
+# 每日token限制的窗口长度（秒，按UTC日期切分）
+DAY = 24 * 3600
+
+# 拒绝原因
+REASON_REQUESTS_PER_MINUTE = "超过每分钟请求限制"
+REASON_TOKENS_PER_REQUEST = "超过单次token限制"
+REASON_DAILY_TOKENS = "超过每日token限制"
+
+@dataclass
+class RateLimitResult:
+    """
+    准入检查结果
+    retry_after为预计需要等待的秒数，单次token超限时为None（等待无意义）
+    """
+    allowed: bool
+    reason: Optional[str] = None
+    retry_after: Optional[float] = 0.0
+    remaining: Dict[str, Any] = field(default_factory=dict)
+
+    def to_dict(self) -> Dict[str, Any]:
+        result: Dict[str, Any] = {"allowed": self.allowed}
+        if self.allowed:
+            result["remaining"] = self.remaining
+        else:
+            result["reason"] = self.reason
+            result["retry_after"] = self.retry_after
+        return result
+
+def _sliding_window_count(
+    previous: int,
+    current: int,
+    elapsed: float,
+    window: float = MINUTE
+) -> float:
+    """
+    滑动窗口计数：上一窗口的计数按未过去的比例折算后加上当前窗口计数
+    """
+    return previous * (1 - elapsed / window) + current
+
+def _requests_retry_after(
+    previous: int,
+    current: int,
+    elapsed: float,
+    limit: int,
+    window: float = MINUTE
+) -> float:
+    """
+    估算滑动窗口计数降到可以再放行一个请求所需的秒数
+    """
+    budget = limit - 1 - current
+    if budget < 0 or previous <= 0:
+        # 当前窗口已满，至少要等到下一个窗口
+        return window - elapsed
+    return max(0.0, window * (1 - budget / previous) - elapsed)
+
+class RateLimiter(ABC):
+    """
+    限流器抽象基类
+    key一般为"agent:<id>"，limits为ModelConfig.usage_limits，缺少的限制项视为不限制
+    """
+
+    @abstractmethod
+    def try_acquire(
+        self,
+        key: str,
+        limits: Dict[str, Any],
+        tokens: int = 0,
+        consume: bool = True
+    ) -> RateLimitResult:
+        """
+        检查并（consume为True时）占用一次请求和tokens个token的配额
+        """
+        ...
+
+    @abstractmethod
+    def consume_tokens(self, key: str, tokens: int) -> None:
+        """
+        追加计入token用量，用于在调用结束后按实际用量补记
+        tokens为负数时退还多预留的部分（实际用量少于准入时的估算），当日用量不会低于0
+        """
+        ...
+
+    @abstractmethod
+    def reset(self, key: str) -> None:
+        """
+        清空某个key的计数
+        """
+        ...
+
+    async def try_acquire_async(
+        self,
+        key: str,
+        limits: Dict[str, Any],
+        tokens: int = 0,
+        consume: bool = True
+    ) -> RateLimitResult:
+        """
+        try_acquire的异步版本，供事件循环中调用；需要网络访问的实现应覆盖它，避免阻塞事件循环
+        """
+        return self.try_acquire(key, limits, tokens, consume)
+
+    async def consume_tokens_async(self, key: str, tokens: int) -> None:
+        """
+        consume_tokens的异步版本
+        """
+        self.consume_tokens(key, tokens)
+
+    def check(
+        self,
+        key: str,
+        limits: Dict[str, Any],
+        tokens: int = 0
+    ) -> RateLimitResult:
+        """
+        只检查不占用配额
+        """
+        return self.try_acquire(key, limits, tokens, consume=False)
+
+    async def acquire(
+        self,
+        key: str,
+        limits: Dict[str, Any],
+        tokens: int = 0,
+        timeout: float = 0.0
+    ) -> RateLimitResult:
+        """
+        占用配额，配额不足时最多等待timeout秒
+        超时或请求本身超过单次限制时返回未通过的结果
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            result = await self.try_acquire_async(key, limits, tokens)
+            if result.allowed or result.retry_after is None:
+                return result
+
+            remaining = deadline - time.monotonic()
+            if result.retry_after > remaining:
+                return result
+            # 稍微多等一点，避免恰好落在窗口边界上再次被拒
+            await asyncio.sleep(result.retry_after + 0.01)
+
+class MemoryRateLimiter(RateLimiter):
+    """
+    进程内限流器
+    只在单个进程内有效，适用于开发环境和单进程部署
+    """
+
+    def __init__(self):
+        # key -> [窗口编号, 上一窗口计数, 当前窗口计数]
+        self._requests: Dict[str, list] = {}
+        # key -> (日期编号, 已用token数)
+        self._tokens: Dict[str, Tuple[int, int]] = {}
+        self._lock = threading.Lock()
+
+    def _request_counts(self, key: str, now: float) -> Tuple[int, int, float]:
+        window_id = int(now // MINUTE)
+        state = self._requests.get(key)
+        if state is None:
+            state = [window_id, 0, 0]
+            self._requests[key] = state
+        elif state[0] != window_id:
+            # 窗口前进：相邻窗口时当前计数变为上一窗口计数，否则全部清零
+            previous = state[2] if state[0] == window_id - 1 else 0
+            state[:] = [window_id, previous, 0]
+        return state[1], state[2], now - window_id * MINUTE
+
+    def _daily_tokens(self, key: str, now: float) -> int:
+        day = int(now // DAY)
+        stored_day, used = self._tokens.get(key, (day, 0))
+        return used if stored_day == day else 0
+
+    def try_acquire(
+        self,
+        key: str,
+        limits: Dict[str, Any],
+        tokens: int = 0,
+        consume: bool = True
+    ) -> RateLimitResult:
+        max_per_request = limits.get("max_tokens_per_request")
+        if max_per_request is not None and tokens > max_per_request:
+            return RateLimitResult(False, REASON_TOKENS_PER_REQUEST, retry_after=None)
+
+        now = time.time()
+        with self._lock:
+            previous, current, elapsed = self._request_counts(key, now)
+            remaining: Dict[str, Any] = {}
+
+            max_rpm = limits.get("max_requests_per_minute")
+            if max_rpm is not None:
+                count = _sliding_window_count(previous, current, elapsed)
+                if count + 1 > max_rpm:
+                    return RateLimitResult(
+                        False,
+                        REASON_REQUESTS_PER_MINUTE,
+                        retry_after=_requests_retry_after(previous, current, elapsed, max_rpm)
+                    )
+                remaining["requests_per_minute"] = int(max_rpm - count - (1 if consume else 0))
+
+            used = self._daily_tokens(key, now)
+            max_daily = limits.get("max_daily_tokens")
+            if max_daily is not None:
+                if used + tokens > max_daily:
+                    return RateLimitResult(
+                        False,
+                        REASON_DAILY_TOKENS,
+                        retry_after=DAY - now % DAY
+                    )
+                remaining["daily_tokens"] = max_daily - used - (tokens if consume else 0)
+
+            if consume:
+                self._requests[key][2] += 1
+                self._tokens[key] = (int(now // DAY), used + tokens)
+
+        return RateLimitResult(True, remaining=remaining)
+
+    def consume_tokens(self, key: str, tokens: int) -> None:
+        if tokens == 0:
+            return
+        now = time.time()
+        with self._lock:
+            used = max(0, self._daily_tokens(key, now) + tokens)
+            self._tokens[key] = (int(now // DAY), used)
+
+    def reset(self, key: str) -> None:
+        with self._lock:
+            self._requests.pop(key, None)
+            self._tokens.pop(key, None)
+
+# 准入脚本：使用Redis服务器时间，保证多个worker之间的计数一致
+# 返回 {是否通过, 原因代码, 等待毫秒数, 剩余请求数, 剩余token数}，-1表示不限制
+_ACQUIRE_SCRIPT = """
+local prefix = KEYS[1]
+local max_rpm = tonumber(ARGV[1])
+local max_daily = tonumber(ARGV[2])
+local tokens = tonumber(ARGV[3])
+local consume = tonumber(ARGV[4])
+local minute = tonumber(ARGV[5])
+local day = tonumber(ARGV[6])
+
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local window_id = math.floor(now / minute)
+local elapsed = now - window_id * minute
+local day_id = math.floor(now / day)
+
+local current_key = prefix .. ':rpm:' .. window_id
+local previous = tonumber(redis.call('GET', prefix .. ':rpm:' .. (window_id - 1)) or '0')
+local current = tonumber(redis.call('GET', current_key) or '0')
+local tokens_key = prefix .. ':tokens:' .. day_id
+local used = tonumber(redis.call('GET', tokens_key) or '0')
+
+local remaining_rpm = -1
+if max_rpm >= 0 then
+    local count = previous * (1 - elapsed / minute) + current
+    if count + 1 > max_rpm then
+        local budget = max_rpm - 1 - current
+        local wait
+        if budget < 0 or previous <= 0 then
+            wait = minute - elapsed
+        else
+            wait = math.max(0, minute * (1 - budget / previous) - elapsed)
+        end
+        return {0, 1, math.ceil(wait * 1000), 0, 0}
+    end
+    remaining_rpm = math.floor(max_rpm - count - consume)
+end
+
+local remaining_tokens = -1
+if max_daily >= 0 then
+    if used + tokens > max_daily then
+        return {0, 2, math.ceil((day - now % day) * 1000), 0, 0}
+    end
+    remaining_tokens = max_daily - used - tokens * consume
+end
+
+if consume == 1 then
+    redis.call('INCR', current_key)
+    redis.call('EXPIRE', current_key, minute * 2)
+    if tokens > 0 then
+        redis.call('INCRBY', tokens_key, tokens)
+    end
+    redis.call('EXPIRE', tokens_key, day * 2)
+end
+return {1, 0, 0, remaining_rpm, remaining_tokens}
+"""
+
+_CONSUME_SCRIPT = """
+local t = redis.call('TIME')
+local day = tonumber(ARGV[2])
+local tokens_key = KEYS[1] .. ':tokens:' .. math.floor(tonumber(t[1]) / day)
+local used = redis.call('INCRBY', tokens_key, tonumber(ARGV[1]))
+if used < 0 then
+    -- 退还的token跨过了日期边界
+    redis.call('SET', tokens_key, 0)
+end
+redis.call('EXPIRE', tokens_key, day * 2)
+return 1
+"""
+
+_REASONS = {
+    1: REASON_REQUESTS_PER_MINUTE,
+    2: REASON_DAILY_TOKENS,
+}
+
+class RedisRateLimiter(RateLimiter):
+    """
+    基于Redis的共享限流器
+    检查和计数在一个Lua脚本中原子完成，多个进程并发调用时不会超发
+    """
+
+    def __init__(
+        self,
+        host: str = "redis",
+        port: int = 6379,
+        db: int = 0,
+        password: Optional[str] = None,
+        prefix: str = "verseforge:rate_limit:",
+        client: Any = None,
+        **kwargs: Any
+    ):
+        if client is None:
+            from redis import Redis
+            client = Redis(host=host, port=port, db=db, password=password, **kwargs)
+        self.redis = client
+        self.prefix = prefix
+        self._acquire = client.register_script(_ACQUIRE_SCRIPT)
+        self._consume = client.register_script(_CONSUME_SCRIPT)
+
+    def try_acquire(
+        self,
+        key: str,
+        limits: Dict[str, Any],
+        tokens: int = 0,
+        consume: bool = True
+    ) -> RateLimitResult:
+        max_per_request = limits.get("max_tokens_per_request")
+        if max_per_request is not None and tokens > max_per_request:
+            return RateLimitResult(False, REASON_TOKENS_PER_REQUEST, retry_after=None)
+
+        max_rpm = limits.get("max_requests_per_minute")
+        max_daily = limits.get("max_daily_tokens")
+        allowed, reason, wait_ms, remaining_rpm, remaining_tokens = self._acquire(
+            keys=[self.prefix + key],
+            args=[
+                -1 if max_rpm is None else max_rpm,
+                -1 if max_daily is None else max_daily,
+                tokens,
+                1 if consume else 0,
+                MINUTE,
+                DAY,
+            ]
+        )
+
+        if not allowed:
+            return RateLimitResult(False, _REASONS[int(reason)], retry_after=int(wait_ms) / 1000)
+
+        remaining: Dict[str, Any] = {}
+        if max_rpm is not None:
+            remaining["requests_per_minute"] = int(remaining_rpm)
+        if max_daily is not None:
+            remaining["daily_tokens"] = int(remaining_tokens)
+        return RateLimitResult(True, remaining=remaining)
+
+    def consume_tokens(self, key: str, tokens: int) -> None:
+        if tokens == 0:
+            return
+        self._consume(keys=[self.prefix + key], args=[tokens, DAY])
+
+    async def try_acquire_async(
+        self,
+        key: str,
+        limits: Dict[str, Any],
+        tokens: int = 0,
+        consume: bool = True
+    ) -> RateLimitResult:
+        # 同步客户端放到线程池中执行，避免阻塞事件循环
+        return await asyncio.to_thread(self.try_acquire, key, limits, tokens, consume)
+
+    async def consume_tokens_async(self, key: str, tokens: int) -> None:
+        if tokens == 0:
+            return
+        await asyncio.to_thread(self.consume_tokens, key, tokens)
+
+    def reset(self, key: str) -> None:
+        keys = self.redis.keys(self.prefix + key + ":*")
+        if keys:
+            self.redis.delete(*keys)
+
+# 全局限流器实例
+_rate_limiter: Optional[RateLimiter] = None
+
+def init_rate_limiter(implementation: str = "memory", **kwargs: Any) -> RateLimiter:
+    """
+    初始化限流器
+
+    Args:
+        implementation: 限流器实现，可选值: "memory", "redis"
+        **kwargs: 传递给具体实现的参数
+
+    Raises:
+        ValueError: 如果指定的实现不存在
+    """
+    global _rate_limiter
+
+    if implementation == "redis":
+        _rate_limiter = RedisRateLimiter(**kwargs)
+    elif implementation == "memory":
+        _rate_limiter = MemoryRateLimiter()
+    else:
+        raise ValueError(f"不支持的限流器实现: {implementation}")
+
+    return _rate_limiter
+
+def get_rate_limiter() -> RateLimiter:
+    """
+    获取全局限流器实例
+    尚未初始化时（如Celery worker中）按配置创建
+    """
+    if _rate_limiter is None:
+        from .config import settings
+
+        if settings.RATE_LIMITER_IMPLEMENTATION == "redis":
+            return init_rate_limiter(
+                "redis",
+                host=settings.REDIS_HOST,
+                port=settings.REDIS_PORT,
+                db=settings.REDIS_DB
+            )
+        return init_rate_limiter(settings.RATE_LIMITER_IMPLEMENTATION)
+    return _rate_limiter
+
+def usage_limit_key(agent_id: int) -> str:
+    """
+    Agent使用限制对应的限流key
+    """
+    return f"agent:{agent_id}"
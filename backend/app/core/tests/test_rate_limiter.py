@@ -0,0 +1,131 @@
+import pytest
+
+from app.core import rate_limiter
+from app.core.rate_limiter import (
+    DAY,
+    MINUTE,
+    REASON_DAILY_TOKENS,
+    REASON_REQUESTS_PER_MINUTE,
+    REASON_TOKENS_PER_REQUEST,
+    MemoryRateLimiter,
+    RedisRateLimiter,
+)
+
+class Clock:
+    """
+    可控的time.time，Redis实现中由fakeredis的TIME命令读取
+    """
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    # 从某天第一个分钟窗口的开头开始
+    clock = Clock(float(20000 * DAY))
+    monkeypatch.setattr(rate_limiter.time, "time", clock)
+    return clock
+
+@pytest.fixture(params=["memory", "redis"])
+def limiter(request, clock):
+    if request.param == "memory":
+        return MemoryRateLimiter()
+    # Redis实现在fakeredis中执行真实的Lua脚本
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")
+    return RedisRateLimiter(client=fakeredis.FakeRedis())
+
+@pytest.mark.asyncio
+async def test_requests_per_minute_sliding_window(limiter, clock):
+    """
+    测试每分钟请求数超限时拒绝，等待retry_after后重新放行，且上一窗口的请求按比例计入
+    """
+    limits = {"max_requests_per_minute": 2}
+    assert (await limiter.try_acquire_async("agent:1", limits)).allowed
+    assert (await limiter.try_acquire_async("agent:1", limits)).allowed
+
+    rejected = await limiter.try_acquire_async("agent:1", limits)
+    assert not rejected.allowed
+    assert rejected.reason == REASON_REQUESTS_PER_MINUTE
+    assert 0 < rejected.retry_after <= MINUTE
+
+    # 进入下一个窗口时上一窗口的2个请求仍然全部计入
+    clock.now += MINUTE
+    rejected = await limiter.try_acquire_async("agent:1", limits)
+    assert not rejected.allowed
+    assert rejected.retry_after == pytest.approx(MINUTE / 2, abs=0.01)
+
+    clock.now += rejected.retry_after + 0.01
+    result = await limiter.try_acquire_async("agent:1", limits)
+    assert result.allowed
+    assert result.remaining["requests_per_minute"] == 0
+
+    # 其他key不受影响
+    assert (await limiter.try_acquire_async("agent:2", limits)).allowed
+
+@pytest.mark.asyncio
+async def test_daily_token_cap_and_refund(limiter, clock):
+    """
+    测试每日token上限、单次token上限，退还多预留的token后可以继续使用，次日重新计数
+    """
+    limits = {"max_daily_tokens": 100, "max_tokens_per_request": 80}
+    result = await limiter.try_acquire_async("agent:1", limits, tokens=60)
+    assert result.allowed
+    assert result.remaining["daily_tokens"] == 40
+
+    rejected = await limiter.try_acquire_async("agent:1", limits, tokens=50)
+    assert not rejected.allowed
+    assert rejected.reason == REASON_DAILY_TOKENS
+    assert rejected.retry_after == pytest.approx(DAY, abs=0.01)
+
+    too_large = await limiter.try_acquire_async("agent:1", limits, tokens=90)
+    assert too_large.reason == REASON_TOKENS_PER_REQUEST
+    assert too_large.retry_after is None
+
+    # 实际用量比预留少30个token
+    await limiter.consume_tokens_async("agent:1", -30)
+    assert (await limiter.try_acquire_async("agent:1", limits, tokens=50)).allowed
+    await limiter.consume_tokens_async("agent:1", 20)
+    assert not limiter.check("agent:1", limits, tokens=1).allowed
+
+    # 次日重新计数，退还不会让当日用量低于0
+    clock.now += DAY
+    await limiter.consume_tokens_async("agent:1", -500)
+    result = await limiter.try_acquire_async("agent:1", limits, tokens=80)
+    assert result.allowed
+    assert result.remaining["daily_tokens"] == 20
+
+@pytest.mark.asyncio
+async def test_acquire_waits_for_retry_after(limiter, clock, monkeypatch):
+    """
+    测试acquire在timeout内等待retry_after后占用配额，等待时间超过timeout时直接返回拒绝结果
+    """
+    sleeps = []
+
+    async def sleep(seconds):
+        sleeps.append(seconds)
+        clock.now += seconds
+
+    monkeypatch.setattr(rate_limiter.asyncio, "sleep", sleep)
+    limits = {"max_requests_per_minute": 2}
+    assert (await limiter.acquire("agent:1", limits)).allowed
+    assert (await limiter.acquire("agent:1", limits)).allowed
+
+    rejected = await limiter.acquire("agent:1", limits, timeout=0)
+    assert not rejected.allowed
+    assert sleeps == []
+
+    started = clock.now
+    result = await limiter.acquire("agent:1", limits, timeout=2 * MINUTE)
+    assert result.allowed
+    # 每次按拒绝结果的retry_after等待，窗口前进后滑动计数降下来即放行
+    assert sleeps[0] == pytest.approx(rejected.retry_after + 0.01)
+    assert clock.now - started == pytest.approx(sum(sleeps))
+    assert clock.now - started < 2 * MINUTE
+
+    # 需要等待的时间超过timeout时不等待
+    result = await limiter.acquire("agent:1", limits, timeout=1)
+    assert not result.allowed
+    assert clock.now - started == pytest.approx(sum(sleeps))
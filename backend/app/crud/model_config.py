@@ -1,6 +1,7 @@
 from typing import Optional, Dict, Any
 from sqlalchemy.orm import Session
 
+from app.core.rate_limiter import get_rate_limiter, usage_limit_key
 from app.crud.base import CRUDBase
 from app.models.model_config import ModelConfig
 from app.schemas.model_config import (
@@ -108,11 +109,12 @@ class CRUDModelConfig(CRUDBase[ModelConfig, AgentModelConfig, ModelConfigUpdate]
         db: Session,
         *,
         agent_id: int,
-        tokens_required: int
+        tokens_required: int,
+        consume: bool = False
     ) -> Dict[str, Any]:
         """
         检查是否超过使用限制
-        返回检查结果和剩余配额
+        返回检查结果和剩余配额，consume为True时同时占用配额
         """
         config = self.get_by_agent_id(db, agent_id=agent_id)
         if not config:
@@ -121,49 +123,12 @@ class CRUDModelConfig(CRUDBase[ModelConfig, AgentModelConfig, ModelConfigUpdate]
                 "reason": "未找到模型配置"
             }
         
-        limits = config.usage_limits
-        stats = config.usage_stats
-        
-        # 检查每分钟请求限制
-        from datetime import datetime, timedelta
-        now = datetime.utcnow()
-        last_minute = (now - timedelta(minutes=1)).isoformat()
-        
-        recent_requests = sum(
-            1 for timestamp in stats.get("request_timestamps", [])
-            if timestamp > last_minute
+        result = get_rate_limiter().try_acquire(
+            usage_limit_key(agent_id),
+            config.usage_limits or {},
+            tokens_required,
+            consume=consume
         )
-        
-        if recent_requests >= limits["max_requests_per_minute"]:
-            return {
-                "allowed": False,
-                "reason": "超过每分钟请求限制"
-            }
-        
-        # 检查token数量限制
-        if tokens_required > limits["max_tokens_per_request"]:
-            return {
-                "allowed": False,
-                "reason": "超过单次token限制"
-            }
-        
-        # 检查每日token限制
-        today = datetime.now().date().isoformat()
-        daily_stats = stats.get("daily_stats", {}).get(today, {})
-        daily_tokens = daily_stats.get("tokens", 0)
-        
-        if daily_tokens + tokens_required > limits["max_daily_tokens"]:
-            return {
-                "allowed": False,
-                "reason": "超过每日token限制"
-            }
-        
-        return {
-            "allowed": True,
-            "remaining": {
-                "requests_per_minute": limits["max_requests_per_minute"] - recent_requests,
-                "daily_tokens": limits["max_daily_tokens"] - daily_tokens
-            }
-        }
+        return result.to_dict()
 
 model_config = CRUDModelConfig(ModelConfig)
\ No newline at end of file
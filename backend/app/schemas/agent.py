@@ -52,6 +52,8 @@ class TaskCreate(TaskBase):
     """
     agent_id: int
     novel_id: int
+    # 是否通过离线批量推理执行，为空时按任务类型决定（质量检查、连贯性分析默认批量执行）
+    batch: Optional[bool] = None
 
 class TaskUpdate(BaseModel):
     """